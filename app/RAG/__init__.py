@@ -1,8 +1,6 @@
 from flask import Blueprint
-import redis 
+from app.extensions import r, r_raw
 
 RAG_bp = Blueprint('RAG',__name__)
 
-r = redis.Redis(host='localhost', port=6379, db=0, decode_responses=True)
-
 from . import routes
\ No newline at end of file
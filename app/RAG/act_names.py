@@ -0,0 +1,20 @@
+"""
+Act titles normalised to the keys of chroma_db/section_index.json. Written
+by data/ingest.py and looked up by app/RAG/section_index.py, so both import
+act_key() from here; the module has no dependencies of its own.
+"""
+import re
+
+_act_noise = re.compile(r"[^a-z0-9 ]+")
+_year = re.compile(r"\b\d{4}\b")
+_spaces = re.compile(r"\s+")
+
+
+def act_key(title: str) -> str:
+    """Lower-case act title without "the", year or punctuation."""
+    key = _act_noise.sub(" ", title.lower())
+    key = _year.sub(" ", key)
+    key = _spaces.sub(" ", key).strip()
+    if key.startswith("the "):
+        key = key[4:]
+    return key
@@ -0,0 +1,146 @@
+import os
+import time
+import threading
+
+import xxhash
+
+from app.local_cache import LocalCache
+from .embedding_cache import normalize_text
+from .cache_codec import CacheCodec
+
+ANALYSIS_PREFIX = "lex:analysis:"
+LRU_KEY = "lex:analysis:lru"
+ANALYSIS_TTL_SECONDS = int(os.environ.get("LEX_ANALYSIS_CACHE_TTL", 7 * 86400))
+ANALYSIS_MAX_ENTRIES = int(os.environ.get("LEX_ANALYSIS_CACHE_MAX_ENTRIES", 5000))
+L1_MAX_ENTRIES = int(os.environ.get("LEX_L1_ANALYSIS_MAX_ENTRIES", 64))
+
+
+class AnalysisCache:
+    """
+    Cross-user cache of finished analyses, content-addressed by
+    xxh3_128(prompt version, model, jurisdiction, normalised document).
+
+    Each entry is a Redis hash holding the document text and the result, so
+    a document is stored once however many users upload it; per-user
+    caches keep only the digest. Reads slide the TTL and bump the entry in
+    the LRU sorted set; writes trim the set to max_entries, evicting the
+    least recently used analyses.
+
+    Text and result are stored through `codec` (orjson + zstd, see
+    app/RAG/cache_codec.py), so `redis_client` must return bytes.
+
+    Decoded entries are also kept briefly in a per-process L1 (a chat turn
+    reads the current analysis every time). A digest's entry never
+    changes, so the L1 needs no invalidation; an L1 hit skips the TTL slide
+    and LRU bump, which the next Redis read after it expires catches up on.
+    """
+
+    def __init__(self, redis_client, model_name: str, prompt_version: str,
+                 ttl: int = ANALYSIS_TTL_SECONDS, max_entries: int = ANALYSIS_MAX_ENTRIES, codec: CacheCodec = None):
+        self.redis = redis_client
+        self.model_name = model_name
+        self.prompt_version = prompt_version
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.codec = codec or CacheCodec(redis_client)
+        # Callers only read entries, so they are shared rather than copied
+        self.local = LocalCache("analysis", max_entries=L1_MAX_ENTRIES, copy_values=False)
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "errors": 0}
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def digest(self, document_text: str, jurisdiction: str = None, model_name: str = None) -> str:
+        """`model_name` overrides the cache's model, e.g. for an analysis routed to the local model."""
+        model_name = model_name or self.model_name
+        return xxhash.xxh3_128_hexdigest(
+            f"{self.prompt_version}\0{model_name}\0{jurisdiction or ''}\0{normalize_text(document_text)}".encode("utf-8")
+        )
+
+    def get(self, digest: str, count: bool = True):
+        """{"document", "result"} for a digest, or None. `count` = include in the hit rate."""
+        entry = self.local.get(digest)
+        if entry is not None:
+            if count:
+                self._count("hits")
+            return entry
+
+        key = ANALYSIS_PREFIX + digest
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.hgetall(key)
+            pipe.expire(key, self.ttl)
+            pipe.zadd(LRU_KEY, {digest: time.time()}, xx=True)
+            entry, _, _ = pipe.execute()
+        except Exception as e:
+            print(f"[AnalysisCache] Redis read failed: {e}")
+            self._count("errors")
+            return None
+
+        if not entry:
+            if count:
+                self._count("misses")
+            return None
+        if count:
+            self._count("hits")
+        try:
+            # Entries from before the codec hold plain text and json.dumps output
+            entry = {
+                "document": self.codec.decode(entry[b"document"], legacy="text"),
+                "result": self.codec.decode(entry[b"result"]),
+            }
+        except Exception as e:
+            print(f"[AnalysisCache] Could not decode {digest}: {e}")
+            self._count("errors")
+            return None
+        self.local.put(digest, entry)
+        return entry
+
+    def put(self, digest: str, document_text: str, result: dict):
+        key = ANALYSIS_PREFIX + digest
+        now = time.time()
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.hset(key, mapping={
+                "document": self.codec.encode(document_text),
+                "result": self.codec.encode(result),
+                "model": self.model_name,
+                "prompt_version": self.prompt_version,
+                "created": now,
+            })
+            pipe.expire(key, self.ttl)
+            pipe.zadd(LRU_KEY, {digest: now})
+            # Members untouched for a full TTL have already expired on their own
+            pipe.zremrangebyscore(LRU_KEY, "-inf", now - self.ttl)
+            pipe.zcard(LRU_KEY)
+            size = pipe.execute()[-1]
+            self._count("stores")
+
+            if size > self.max_entries:
+                evicted = [member.decode() for member, _ in self.redis.zpopmin(LRU_KEY, size - self.max_entries)]
+                if evicted:
+                    self.redis.delete(*(ANALYSIS_PREFIX + d for d in evicted))
+                    self._count("evictions", len(evicted))
+        except Exception as e:
+            print(f"[AnalysisCache] Redis write failed: {e}")
+            self._count("errors")
+
+    def stats(self) -> dict:
+        with self._lock:
+            c = dict(self.counters)
+        lookups = c["hits"] + c["misses"]
+        try:
+            entries = self.redis.zcard(LRU_KEY)
+        except Exception:
+            entries = None
+        return {
+            **c,
+            "hit_rate": round(c["hits"] / lookups, 4) if lookups else 0.0,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "prompt_version": self.prompt_version,
+            "codec": self.codec.stats(),
+        }
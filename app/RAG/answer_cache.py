@@ -0,0 +1,144 @@
+import os
+import json
+import time
+import threading
+
+import numpy as np
+import xxhash
+
+from .embedding_cache import normalize_text
+
+ANSWER_PREFIX = "lex:answers:"
+ANSWER_TTL_SECONDS = int(os.environ.get("LEX_ANSWER_CACHE_TTL", 86400))
+ANSWER_MAX_ENTRIES = int(os.environ.get("LEX_ANSWER_CACHE_MAX_ENTRIES", 100))   # Per analysis and context
+ANSWER_SIMILARITY = float(os.environ.get("LEX_ANSWER_CACHE_THRESHOLD", 0.95))
+
+
+class AnswerCache:
+    """
+    Semantic cache of chat answers, scoped to one analysis and one
+    conversation context.
+
+    The context is a digest of everything else the model sees (the earlier
+    turns and the rolling summary; see context_digest()). A first question
+    has the same context for every user, so its answers are shared by
+    everyone who analysed the document; a follow-up only matches the same
+    conversation.
+
+    For each (analysis hash, context) there are three Redis keys: the question
+    embeddings (float16 blobs), the answers, and an LRU sorted set that
+    bounds them to max_entries. A question is answered from the cache when
+    its embedding's cosine similarity to a cached question is at least
+    `threshold` (embeddings are normalised, so this is a dot product).
+    Every read or write slides the TTL of all three keys.
+
+    `redis_client` must return bytes (the vectors are binary).
+    """
+
+    def __init__(self, redis_client, version: str, threshold: float = ANSWER_SIMILARITY,
+                 max_entries: int = ANSWER_MAX_ENTRIES, ttl: int = ANSWER_TTL_SECONDS):
+        self.redis = redis_client
+        self.version = version
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "errors": 0}
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    @staticmethod
+    def context_digest(earlier_turns: list, summary: str = None) -> str:
+        """Digest of the conversation before the question (messages as {"role", "content"})."""
+        h = xxhash.xxh3_64()
+        h.update((summary or "").encode("utf-8"))
+        for message in earlier_turns:
+            h.update(f"\0{message.get('role')}\0{message.get('content', '')}".encode("utf-8"))
+        return h.hexdigest()
+
+    def _keys(self, analysis_hash: str, context: str):
+        base = f"{ANSWER_PREFIX}{self.version}:{analysis_hash}:{context}"
+        return f"{base}:vec", f"{base}:ans", f"{base}:lru"
+
+    def _touch(self, pipe, keys):
+        for key in keys:
+            pipe.expire(key, self.ttl)
+
+    def lookup(self, analysis_hash: str, context: str, vector: np.ndarray):
+        """{"question", "answer", "similarity"} of the closest cached question, or None."""
+        keys = self._keys(analysis_hash, context)
+        vec_key, ans_key, lru_key = keys
+        try:
+            cached = self.redis.hgetall(vec_key)
+            if not cached:
+                self._count("misses")
+                return None
+
+            query = np.asarray(vector, dtype=np.float32).ravel()
+            ids = [qid for qid, blob in cached.items() if len(blob) == query.size * 2]
+            if not ids:
+                self._count("misses")
+                return None
+            matrix = np.stack([np.frombuffer(cached[qid], dtype=np.float16) for qid in ids]).astype(np.float32)
+            scores = matrix @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self._count("misses")
+                return None
+
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.hget(ans_key, ids[best])
+            pipe.zadd(lru_key, {ids[best]: time.time()}, xx=True)
+            self._touch(pipe, keys)
+            entry = pipe.execute()[0]
+        except Exception as e:
+            print(f"[AnswerCache] Redis read failed: {e}")
+            self._count("errors")
+            return None
+
+        if entry is None:   # Evicted between the two reads
+            self._count("misses")
+            return None
+        self._count("hits")
+        entry = json.loads(entry)
+        return {"question": entry["question"], "answer": entry["answer"], "similarity": round(float(scores[best]), 4)}
+
+    def store(self, analysis_hash: str, context: str, question: str, vector: np.ndarray, answer: str):
+        keys = self._keys(analysis_hash, context)
+        vec_key, ans_key, lru_key = keys
+        qid = xxhash.xxh3_64_hexdigest(normalize_text(question).lower().encode("utf-8"))
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.hset(vec_key, qid, np.asarray(vector, dtype=np.float16).ravel().tobytes())
+            pipe.hset(ans_key, qid, json.dumps({"question": question, "answer": answer, "created": time.time()}))
+            pipe.zadd(lru_key, {qid: time.time()})
+            self._touch(pipe, keys)
+            pipe.zcard(lru_key)
+            size = pipe.execute()[-1]
+            self._count("stores")
+
+            if size > self.max_entries:
+                evicted = [member for member, _ in self.redis.zpopmin(lru_key, size - self.max_entries)]
+                if evicted:
+                    pipe = self.redis.pipeline(transaction=False)
+                    pipe.hdel(vec_key, *evicted)
+                    pipe.hdel(ans_key, *evicted)
+                    pipe.execute()
+                    self._count("evictions", len(evicted))
+        except Exception as e:
+            print(f"[AnswerCache] Redis write failed: {e}")
+            self._count("errors")
+
+    def stats(self) -> dict:
+        with self._lock:
+            c = dict(self.counters)
+        lookups = c["hits"] + c["misses"]
+        return {
+            **c,
+            "hit_rate": round(c["hits"] / lookups, 4) if lookups else 0.0,
+            "threshold": self.threshold,
+            "max_entries_per_context": self.max_entries,
+            "ttl_seconds": self.ttl,
+        }
@@ -0,0 +1,162 @@
+"""
+Compact encoding for large cached values (documents, analyses).
+
+Every encoded value starts with a one-byte format header:
+
+    0x01  orjson bytes
+    0x02  zstd frame of the orjson bytes, compressed with the current trained
+          dictionary (its id is stored in the frame, so entries written with
+          an older dictionary still decode)
+
+Values at least min_bytes long are compressed; shorter ones aren't worth it.
+Anything without a header was written before the codec existed (json.dumps
+output or plain text) and is decoded the old way, so old and new entries can
+be read side by side during a rollout.
+
+Dictionaries are trained by data/train_cache_dictionary.py and kept in Redis
+(lex:codec:dict:{id}, with lex:codec:dict:current naming the one to write
+with). Workers re-read lex:codec:dict:current every refresh_seconds, so a
+newly published dictionary is picked up without a restart.
+"""
+import os
+import json
+import time
+import threading
+
+import orjson
+import zstandard
+
+FORMAT_ORJSON = 0x01
+FORMAT_ZSTD = 0x02
+ZSTD_MIN_BYTES = int(os.environ.get("LEX_CODEC_ZSTD_MIN_BYTES", 1024))
+ZSTD_LEVEL = int(os.environ.get("LEX_CODEC_ZSTD_LEVEL", 3))
+DICT_KEY_FORMAT = "lex:codec:dict:{}"
+CURRENT_DICT_KEY = "lex:codec:dict:current"
+DICT_REFRESH_SECONDS = float(os.environ.get("LEX_CODEC_DICT_REFRESH_SECONDS", 60))
+
+
+class CacheCodec:
+    def __init__(self, redis_client=None, level: int = ZSTD_LEVEL, min_bytes: int = ZSTD_MIN_BYTES,
+                 dictionary: bytes = None, refresh_seconds: float = DICT_REFRESH_SECONDS):
+        """`redis_client` (bytes) is where trained dictionaries live; `dictionary` skips it."""
+        self.redis = redis_client
+        self.level = level
+        self.min_bytes = min_bytes
+        self.refresh_seconds = refresh_seconds
+        self._dicts = {}            # dict_id -> ZstdCompressionDict
+        self._current = None
+        self._pinned = False        # Set by use_dictionary(): Redis is not consulted
+        self._checked_at = None     # time.monotonic() of the last read of CURRENT_DICT_KEY
+        self._local = threading.local()   # zstd (de)compressors are not thread-safe
+        self._lock = threading.Lock()
+        self.counters = {
+            "encoded": 0, "compressed": 0, "bytes_json": 0, "bytes_stored": 0, "legacy_reads": 0, "errors": 0,
+        }
+        if dictionary is not None:
+            self.use_dictionary(dictionary)
+
+    def _count(self, **deltas):
+        with self._lock:
+            for name, n in deltas.items():
+                self.counters[name] += n
+
+    # --- Dictionaries ---
+    def use_dictionary(self, data: bytes) -> int:
+        """Compresses with `data` from now on; returns its dictionary id."""
+        dictionary = zstandard.ZstdCompressionDict(data)
+        dictionary.precompute_compress(level=self.level)
+        self._dicts[dictionary.dict_id()] = dictionary
+        self._current, self._pinned = dictionary, True
+        return dictionary.dict_id()
+
+    def _fetch(self, dict_id: int):
+        if dict_id not in self._dicts and self.redis is not None:
+            data = self.redis.get(DICT_KEY_FORMAT.format(dict_id))
+            if data:
+                self._dicts[dict_id] = zstandard.ZstdCompressionDict(data)
+        return self._dicts.get(dict_id)
+
+    def _current_dictionary(self):
+        checked_at = self._checked_at
+        if self._pinned or self.redis is None or (
+                checked_at is not None and time.monotonic() - checked_at < self.refresh_seconds):
+            return self._current
+        with self._lock:
+            if self._checked_at == checked_at:     # Not refreshed by another thread meanwhile
+                try:
+                    dict_id = self.redis.get(CURRENT_DICT_KEY)
+                    if dict_id and (self._current is None or self._current.dict_id() != int(dict_id)):
+                        dictionary = self._fetch(int(dict_id))
+                        if dictionary is not None:
+                            dictionary.precompute_compress(level=self.level)
+                            self._current = dictionary
+                            print(f"[CacheCodec] Compressing with zstd dictionary {dictionary.dict_id()}.")
+                except Exception as e:
+                    # Keeps the dictionary it has (or none) and tries again after refresh_seconds
+                    print(f"[CacheCodec] Could not load the zstd dictionary: {e}")
+                self._checked_at = time.monotonic()
+        return self._current
+
+    def _compressor(self):
+        dictionary = self._current_dictionary()
+        local = self._local
+        if getattr(local, "dictionary", False) is not dictionary:
+            local.compressor = (
+                zstandard.ZstdCompressor(level=self.level, dict_data=dictionary) if dictionary
+                else zstandard.ZstdCompressor(level=self.level)
+            )
+            local.dictionary = dictionary
+        return local.compressor
+
+    def _decompressor(self, dict_id: int):
+        cache = getattr(self._local, "decompressors", None)
+        if cache is None:
+            cache = self._local.decompressors = {}
+        if dict_id not in cache:
+            if dict_id:
+                dictionary = self._fetch(dict_id)
+                if dictionary is None:
+                    raise ValueError(f"zstd dictionary {dict_id} is not available")
+                cache[dict_id] = zstandard.ZstdDecompressor(dict_data=dictionary)
+            else:
+                cache[dict_id] = zstandard.ZstdDecompressor()
+        return cache[dict_id]
+
+    # --- Public API ---
+    def encode(self, value) -> bytes:
+        raw = orjson.dumps(value)
+        if len(raw) < self.min_bytes:
+            data = bytes((FORMAT_ORJSON,)) + raw
+        else:
+            data = bytes((FORMAT_ZSTD,)) + self._compressor().compress(raw)
+        self._count(encoded=1, compressed=int(data[0] == FORMAT_ZSTD), bytes_json=len(raw), bytes_stored=len(data))
+        return data
+
+    def decode(self, data, legacy: str = "json"):
+        """
+        The value stored in `data`. For entries without a header, `legacy`
+        says what was stored: "json" (json.dumps output) or "text".
+        """
+        if data and data[0] == FORMAT_ORJSON:
+            return orjson.loads(memoryview(data)[1:])
+        if data and data[0] == FORMAT_ZSTD:
+            frame = memoryview(data)[1:]
+            dict_id = zstandard.get_frame_parameters(frame).dict_id
+            return orjson.loads(self._decompressor(dict_id).decompress(frame))
+
+        self._count(legacy_reads=1)
+        text = data.decode("utf-8") if isinstance(data, bytes) else data
+        return json.loads(text) if legacy == "json" else text
+
+    def stats(self) -> dict:
+        with self._lock:
+            c = dict(self.counters)
+        dictionary = self._current
+        return {
+            **c,
+            "bytes_saved": c["bytes_json"] - c["bytes_stored"],
+            "ratio": round(c["bytes_stored"] / c["bytes_json"], 4) if c["bytes_json"] else None,
+            "dictionary_id": dictionary.dict_id() if dictionary is not None else None,
+            "min_bytes": self.min_bytes,
+            "level": self.level,
+        }
@@ -0,0 +1,66 @@
+"""
+Keeps the chat prompt a roughly constant size however long a conversation runs.
+
+The newest KEEP_MESSAGES messages are always sent verbatim. Older messages
+are folded into a rolling summary, stored in the user's Redis cache as
+{"text", "covered", "digest"}: the summary text, how many leading messages it
+covers and a hash of those messages. The hash detects a client that edited
+or replaced its history, in which case the summary is rebuilt from scratch.
+
+Folding is batched: it only happens once FOLD_BATCH or more messages have
+fallen out of the verbatim window, or once the unfolded messages exceed their
+token budget. Most turns therefore make no extra LLM call.
+"""
+import os
+import json
+
+import xxhash
+
+from .context_builder import count_tokens, truncate_to_tokens
+
+HISTORY_TOKEN_BUDGET = int(os.environ.get("LEX_CHAT_HISTORY_TOKENS", 1500))
+SUMMARY_TOKEN_BUDGET = int(os.environ.get("LEX_CHAT_SUMMARY_TOKENS", 300))
+KEEP_MESSAGES = int(os.environ.get("LEX_CHAT_KEEP_MESSAGES", 6))   # Three user/model exchanges
+FOLD_BATCH = 4
+
+
+def _digest(messages) -> str:
+    return xxhash.xxh3_64_hexdigest(json.dumps(messages, sort_keys=True).encode("utf-8"))
+
+
+def _tokens(messages) -> int:
+    return sum(count_tokens(m.get("content", "")) for m in messages)
+
+
+def empty_summary() -> dict:
+    return {"text": "", "covered": 0, "digest": _digest([])}
+
+
+def compact_history(history: list, summary: dict, summarize):
+    """
+    Returns (messages to send verbatim, updated summary state).
+    `summarize(previous_text, messages) -> str` is only called when a fold is due.
+    """
+    summary = summary or empty_summary()
+    covered = summary.get("covered", 0)
+    if covered > len(history) or _digest(history[:covered]) != summary.get("digest"):
+        summary, covered = empty_summary(), 0   # History no longer matches what was summarised
+
+    unfolded = history[covered:]
+    recent_budget = HISTORY_TOKEN_BUDGET - SUMMARY_TOKEN_BUDGET
+    fold_count = max(0, len(unfolded) - KEEP_MESSAGES)
+    if fold_count >= FOLD_BATCH or (fold_count and _tokens(unfolded) > recent_budget):
+        folded = unfolded[:fold_count]
+        text = truncate_to_tokens(summarize(summary["text"], folded).strip(), SUMMARY_TOKEN_BUDGET)
+        covered += fold_count
+        summary = {"text": text, "covered": covered, "digest": _digest(history[:covered])}
+        print(f"[ChatHistory] Folded {fold_count} message(s); summary covers {covered}")
+
+    # Whatever still doesn't fit (e.g. a few very long messages) is trimmed oldest-first;
+    # the newest message is always kept, truncated if it alone is over budget.
+    recent = list(history[summary["covered"]:])
+    while len(recent) > 1 and _tokens(recent) > recent_budget:
+        recent.pop(0)
+    if recent and _tokens(recent) > recent_budget:
+        recent[0] = {**recent[0], "content": truncate_to_tokens(recent[0]["content"], recent_budget)}
+    return recent, summary
@@ -0,0 +1,130 @@
+"""
+Turns a retrieval result into the compact context block of the analysis prompt.
+
+Chunks are packed in rank order under a token budget, each with a short
+source tag the model can quote as `context_source`. Text shared with an
+already-packed chunk of the same act (ingest uses a 200-char overlap) is
+trimmed, and chunks fully contained in another are dropped.
+
+Token counts use tiktoken's cl100k_base. It is not Gemini's tokenizer, but it
+tracks it closely enough for budgeting and for trend metrics.
+"""
+import os
+import re
+import threading
+
+TOKEN_ENCODING = "cl100k_base"
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("LEX_CONTEXT_TOKEN_BUDGET", 3000))
+MAX_OVERLAP_CHARS = 250     # Ingest chunk_overlap (200) plus slack for whitespace changes
+MIN_OVERLAP_CHARS = 30      # Shorter shared spans are coincidence, not chunk overlap
+MIN_PARTIAL_TOKENS = 60     # Don't bother packing a truncated tail smaller than this
+
+_encoding = None
+_encoding_lock = threading.Lock()
+_whitespace = re.compile(r"[ \t]+")
+_blank_lines = re.compile(r"\n\s*\n+")
+
+
+class _ApproxEncoding:
+    """~4 characters per token. Used only if the tiktoken BPE file can't be loaded (offline host)."""
+
+    def encode(self, text, **kwargs):
+        return [text[i:i + 4] for i in range(0, len(text), 4)]
+
+    def decode(self, tokens):
+        return "".join(tokens)
+
+
+def get_encoding():
+    global _encoding
+    if _encoding is None:
+        with _encoding_lock:
+            if _encoding is None:
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.get_encoding(TOKEN_ENCODING)
+                except Exception as e:
+                    print(f"[Tokens] Could not load {TOKEN_ENCODING} ({e}); using a 4-chars-per-token estimate.")
+                    _encoding = _ApproxEncoding()
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    return len(get_encoding().encode(text or "", disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    tokens = get_encoding().encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return get_encoding().decode(tokens[:max_tokens])
+
+
+def _clean(text: str) -> str:
+    return _blank_lines.sub("\n", _whitespace.sub(" ", text or "")).strip()
+
+
+def _overlap(left: str, right: str) -> int:
+    """Length of the longest suffix of `left` that is a prefix of `right`."""
+    for k in range(min(MAX_OVERLAP_CHARS, len(left), len(right)), MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:k]):
+            return k
+    return 0
+
+
+def _dedupe(text: str, packed: list) -> str:
+    """Removes spans of `text` already present in packed chunks of the same source."""
+    for other in packed:
+        if text in other:
+            return ""
+        head = _overlap(other, text)
+        if head:
+            text = text[head:]
+        tail = _overlap(text, other)
+        if tail:
+            text = text[:-tail]
+    return text.strip()
+
+
+def _source_tag(n: int, metadata: dict) -> str:
+    metadata = metadata or {}
+    tag = f"[S{n}] {metadata.get('source', 'unknown')}"
+    if metadata.get("page") is not None:
+        tag += f" p.{int(metadata['page']) + 1}"   # PyPDFLoader pages are 0-based
+    return tag
+
+
+def build_context(results, token_budget: int = CONTEXT_TOKEN_BUDGET) -> str:
+    """
+    Packs a single-query retrieval result ({"documents": [[...]], "metadatas": [[...]]})
+    into at most `token_budget` tokens of tagged plain text.
+    """
+    documents = (results or {}).get("documents") or [[]]
+    metadatas = (results or {}).get("metadatas") or [[]]
+
+    packed_by_source = {}
+    blocks = []
+    used = 0
+
+    for text, metadata in zip(documents[0], metadatas[0]):
+        source = (metadata or {}).get("source")
+        same_source = packed_by_source.setdefault(source, [])
+        text = _dedupe(_clean(text), same_source)
+        if not text:
+            continue
+
+        tag = _source_tag(len(blocks) + 1, metadata)
+        cost = count_tokens(tag) + count_tokens(text) + 2
+        remaining = token_budget - used
+        if cost > remaining:
+            room = remaining - count_tokens(tag) - 2
+            if room >= MIN_PARTIAL_TOKENS:
+                text = truncate_to_tokens(text, room) + " …"
+                blocks.append(f"{tag}\n{text}")
+            break
+
+        same_source.append(text)
+        blocks.append(f"{tag}\n{text}")
+        used += cost
+
+    return "\n\n".join(blocks) if blocks else "No supporting legal context was found."
@@ -0,0 +1,173 @@
+"""
+Selectable embedding backends for bge-m3.
+
+    torch      full-precision PyTorch (transformers AutoModel)
+    onnx       exported ONNX graph on ONNX Runtime
+    onnx-int8  the same graph with dynamically quantised int8 weights
+
+Every backend shares the same tokenizer, batching, CLS pooling and
+L2 normalisation (what SentenceTransformer does for bge-m3), so only the
+forward pass differs. The encode() signature matches SentenceTransformer.
+
+Export the ONNX graphs with:
+    python -m app.RAG.embedding_backend
+"""
+import os
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+BACKEND_ROOT = SCRIPT_DIR.parent.parent
+ONNX_DIR = BACKEND_ROOT/"models"/"bge-m3-onnx"
+ONNX_FP32_PATH = ONNX_DIR/"model.onnx"
+ONNX_INT8_PATH = ONNX_DIR/"model-int8.onnx"
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+MAX_SEQ_LENGTH = 8192
+DEFAULT_BATCH_SIZE = 16
+ONNX_THREADS = int(os.environ.get("LEX_ONNX_THREADS", 0))  # 0 = let ONNX Runtime decide
+
+
+class EmbeddingBackend:
+    """Tokenise -> forward -> CLS pool -> normalise. Subclasses provide _forward()."""
+
+    name = None
+
+    def __init__(self, model_name: str, max_seq_length: int = MAX_SEQ_LENGTH):
+        from transformers import AutoTokenizer
+        self.model_name = model_name
+        self.max_seq_length = max_seq_length
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+
+    def _forward(self, input_ids: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        """Returns last_hidden_state as a (batch, tokens, dim) float32 array."""
+        raise NotImplementedError
+
+    def encode(self, sentences, batch_size: int = DEFAULT_BATCH_SIZE, normalize_embeddings: bool = True, **kwargs):
+        single = isinstance(sentences, str)
+        if single:
+            sentences = [sentences]
+
+        # Length-sorted batches keep padding (and wasted compute) to a minimum
+        order = np.argsort([-len(s) for s in sentences], kind="stable")
+        output = [None] * len(sentences)
+
+        for start in range(0, len(sentences), batch_size):
+            idx = order[start:start + batch_size]
+            tokens = self.tokenizer(
+                [sentences[i] for i in idx],
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors="np"
+            )
+            hidden = self._forward(tokens["input_ids"].astype(np.int64), tokens["attention_mask"].astype(np.int64))
+            pooled = hidden[:, 0].astype(np.float32)   # bge-m3 dense = CLS token
+            if normalize_embeddings:
+                pooled /= np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+            for row, i in enumerate(idx):
+                output[i] = pooled[row]
+
+        embeddings = np.vstack(output)
+        return embeddings[0] if single else embeddings
+
+
+class TorchBackend(EmbeddingBackend):
+    name = "torch"
+
+    def __init__(self, model_name: str, **kwargs):
+        super().__init__(model_name, **kwargs)
+        import torch
+        from transformers import AutoModel
+        self.torch = torch
+        self.model = AutoModel.from_pretrained(model_name).eval()
+
+    def _forward(self, input_ids, attention_mask):
+        with self.torch.inference_mode():
+            out = self.model(
+                input_ids=self.torch.from_numpy(input_ids),
+                attention_mask=self.torch.from_numpy(attention_mask)
+            )
+        return out.last_hidden_state.numpy()
+
+
+class OnnxBackend(EmbeddingBackend):
+    def __init__(self, model_name: str, path, **kwargs):
+        super().__init__(model_name, **kwargs)
+        import onnxruntime as ort
+        if not Path(path).exists():
+            raise FileNotFoundError(f"{path} not found. Run `python -m app.RAG.embedding_backend` first.")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if ONNX_THREADS:
+            options.intra_op_num_threads = ONNX_THREADS
+        self.session = ort.InferenceSession(str(path), options, providers=["CPUExecutionProvider"])
+        self.name = "onnx-int8" if Path(path) == ONNX_INT8_PATH else "onnx"
+
+    def _forward(self, input_ids, attention_mask):
+        return self.session.run(
+            ["last_hidden_state"],
+            {"input_ids": input_ids, "attention_mask": attention_mask}
+        )[0]
+
+
+def load_backend(name: str, model_name: str) -> EmbeddingBackend:
+    if name == "torch":
+        return TorchBackend(model_name)
+    if name == "onnx":
+        return OnnxBackend(model_name, ONNX_FP32_PATH)
+    if name == "onnx-int8":
+        return OnnxBackend(model_name, ONNX_INT8_PATH)
+    raise ValueError(f"Unknown embedding backend '{name}'. Expected one of: {', '.join(BACKENDS)}")
+
+
+def export_onnx(model_name: str, out_dir=ONNX_DIR, opset: int = 17):
+    """Exports the transformer to ONNX and writes a dynamically quantised int8 copy."""
+    import torch
+    from transformers import AutoModel
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    class _Encoder(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask):
+            return self.model(input_ids=input_ids, attention_mask=attention_mask).last_hidden_state
+
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    fp32_path, int8_path = out/ONNX_FP32_PATH.name, out/ONNX_INT8_PATH.name
+
+    print(f"Exporting {model_name} to {fp32_path} ...")
+    model = _Encoder(AutoModel.from_pretrained(model_name).eval())
+    dummy = torch.ones((1, 8), dtype=torch.int64)
+    torch.onnx.export(
+        model,
+        (dummy, dummy),
+        str(fp32_path),
+        input_names=["input_ids", "attention_mask"],
+        output_names=["last_hidden_state"],
+        dynamic_axes={
+            "input_ids": {0: "batch", 1: "tokens"},
+            "attention_mask": {0: "batch", 1: "tokens"},
+            "last_hidden_state": {0: "batch", 1: "tokens"},
+        },
+        opset_version=opset,
+        dynamo=False,   # The TorchScript exporter handles dynamic_axes and >2GB external data
+    )
+
+    print(f"Quantising weights to int8 -> {int8_path} ...")
+    quantize_dynamic(str(fp32_path), str(int8_path), weight_type=QuantType.QInt8)
+    print("ONNX export complete.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export bge-m3 to ONNX (fp32 + int8).")
+    parser.add_argument("--model", default="BAAI/bge-m3")
+    parser.add_argument("--out", default=str(ONNX_DIR))
+    args = parser.parse_args()
+    export_onnx(args.model, args.out)
@@ -0,0 +1,132 @@
+import threading
+import unicodedata
+import re
+from collections import OrderedDict
+
+import numpy as np
+import xxhash
+
+# --- Cache settings ---
+L1_MAX_BYTES = 64 * 1024 * 1024   # In-process LRU budget (float32 vectors)
+L2_TTL_SECONDS = 7 * 86400        # Redis entries live for a week
+L2_PREFIX = "lex:emb:"
+
+_whitespace = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Canonical form used for hashing: NFKC + collapsed whitespace."""
+    return _whitespace.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+
+
+def cache_key(text: str, model_name: str) -> str:
+    digest = xxhash.xxh3_128_hexdigest(f"{model_name}\0{normalize_text(text)}".encode("utf-8"))
+    return f"{L2_PREFIX}{digest}"
+
+
+class EmbeddingCache:
+    """
+    Two-tier cache in front of an embedding model.
+
+    L1 is a per-process LRU bounded by the total bytes of the stored vectors.
+    L2 is Redis, shared by every worker, holding compact float16 blobs.
+    """
+
+    def __init__(self, redis_client, model_name: str, max_bytes: int = L1_MAX_BYTES, ttl: int = L2_TTL_SECONDS):
+        self.redis = redis_client
+        self.model_name = model_name
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lru = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.counters = {"l1_hits": 0, "l2_hits": 0, "misses": 0, "l2_errors": 0}
+
+    # --- L1 helpers ---
+    def _l1_get(self, key):
+        with self._lock:
+            vec = self._lru.get(key)
+            if vec is not None:
+                self._lru.move_to_end(key)
+            return vec
+
+    def _l1_put(self, key, vec: np.ndarray):
+        with self._lock:
+            old = self._lru.pop(key, None)
+            if old is not None:
+                self._bytes -= old.nbytes
+            self._lru[key] = vec
+            self._bytes += vec.nbytes
+            while self._bytes > self.max_bytes and self._lru:
+                _, evicted = self._lru.popitem(last=False)
+                self._bytes -= evicted.nbytes
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    # --- Public API ---
+    def encode(self, texts, encode_fn) -> np.ndarray:
+        """
+        Returns normalised embeddings for `texts` (a string or a list of strings),
+        calling `encode_fn(list_of_texts)` only for the ones not found in either tier.
+        The output shape matches SentenceTransformer.encode.
+        """
+        single = isinstance(texts, str)
+        if single:
+            texts = [texts]
+
+        keys = [cache_key(t, self.model_name) for t in texts]
+        vectors = [self._l1_get(k) for k in keys]
+        self._count("l1_hits", sum(v is not None for v in vectors))
+
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        if missing and self.redis is not None:
+            try:
+                blobs = self.redis.mget([keys[i] for i in missing])
+            except Exception as e:
+                print(f"[EmbeddingCache] Redis read failed: {e}")
+                self._count("l2_errors")
+                blobs = [None] * len(missing)
+
+            still_missing = []
+            for i, blob in zip(missing, blobs):
+                if blob:
+                    vec = np.frombuffer(blob, dtype=np.float16).astype(np.float32)
+                    vectors[i] = vec
+                    self._l1_put(keys[i], vec)
+                else:
+                    still_missing.append(i)
+            self._count("l2_hits", len(missing) - len(still_missing))
+            missing = still_missing
+
+        if missing:
+            self._count("misses", len(missing))
+            encoded = np.asarray(encode_fn([texts[i] for i in missing]), dtype=np.float32)
+            for i, vec in zip(missing, encoded):
+                vectors[i] = vec
+                self._l1_put(keys[i], vec)
+
+            if self.redis is not None:
+                try:
+                    pipe = self.redis.pipeline(transaction=False)
+                    for i in missing:
+                        pipe.set(keys[i], vectors[i].astype(np.float16).tobytes(), ex=self.ttl)
+                    pipe.execute()
+                except Exception as e:
+                    print(f"[EmbeddingCache] Redis write failed: {e}")
+                    self._count("l2_errors")
+
+        result = np.vstack(vectors)
+        return result[0] if single else result
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.counters["l1_hits"] + self.counters["l2_hits"] + self.counters["misses"]
+            hits = self.counters["l1_hits"] + self.counters["l2_hits"]
+            return {
+                **self.counters,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "l1_entries": len(self._lru),
+                "l1_bytes": self._bytes,
+            }
@@ -0,0 +1,65 @@
+import socket
+import threading
+
+import numpy as np
+
+from .embedding_server import send_message, recv_message
+
+CLIENT_TIMEOUT_SECONDS = 120
+
+
+class EmbeddingClient:
+    """
+    Talks to app/RAG/embedding_server.py over its Unix socket.
+    Has the same encode() signature as SentenceTransformer, so it can stand
+    in for a local model. Each thread keeps its own persistent connection.
+    """
+
+    def __init__(self, socket_path: str, timeout: float = CLIENT_TIMEOUT_SECONDS):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)   # Before connect, so a full backlog fails instead of hanging
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        self._local.sock = sock
+        return sock
+
+    def _call(self, message: dict):
+        for attempt in (1, 2):
+            sock = getattr(self._local, "sock", None) or self._connect()
+            try:
+                send_message(sock, message)
+                reply, payload = recv_message(sock)
+                break
+            except (ConnectionError, OSError):
+                # Server restarted or the connection went stale: retry once on a fresh socket
+                sock.close()
+                self._local.sock = None
+                if attempt == 2:
+                    raise
+        if not reply.get("ok"):
+            raise RuntimeError(f"Embedding server error: {reply.get('error')}")
+        return reply, payload
+
+    def encode(self, sentences, batch_size: int = None, normalize_embeddings: bool = True, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        reply, payload = self._call({"op": "encode", "texts": texts, "normalize": normalize_embeddings})
+        vectors = np.frombuffer(payload, dtype=np.float32).reshape(reply["shape"])
+        return vectors[0] if single else vectors
+
+    def backend(self) -> str:
+        """The backend the server computes vectors with (its vectors differ slightly per backend)."""
+        reply, _ = self._call({"op": "info"})
+        return reply["backend"]
+
+    def stats(self) -> dict:
+        reply, _ = self._call({"op": "stats"})
+        return reply["stats"]
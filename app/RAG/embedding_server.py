@@ -0,0 +1,261 @@
+"""
+Shared embedding worker.
+
+One process loads bge-m3 once; every web worker (and data/ingest.py) talks
+to it over a local Unix socket. Concurrent encode requests are coalesced
+into a single forward pass, bounded by MAX_BATCH texts and MAX_WAIT_MS.
+Requests larger than MAX_BATCH (ingest batches) are split and only run when
+no smaller request is waiting, so queries are never stuck behind them.
+
+Run with:
+    python -m app.RAG.embedding_server
+and point clients at it with LEX_EMBEDDING_SOCKET=/tmp/lex-embed.sock.
+
+Wire format (both directions): an 8-byte header "!II" giving the JSON
+length and the binary payload length, then the JSON, then the payload.
+    {"op": "encode", "texts": [...], "normalize": true}
+        -> {"ok": true, "shape": [n, dim], "dtype": "float32"} + raw vectors
+    {"op": "stats"} -> {"ok": true, "stats": {...}}
+    {"op": "info"} -> {"ok": true, "backend": "torch" | "onnx" | "onnx-int8"}
+"""
+import os
+import json
+import time
+import struct
+import argparse
+import threading
+import socketserver
+from collections import deque
+
+import numpy as np
+
+SOCKET_PATH = os.environ.get("LEX_EMBEDDING_SOCKET", "/tmp/lex-embed.sock")
+MAX_BATCH = int(os.environ.get("LEX_EMBED_MAX_BATCH", 32))
+MAX_WAIT_MS = float(os.environ.get("LEX_EMBED_MAX_WAIT_MS", 10))
+
+_header = struct.Struct("!II")
+
+
+# --- Wire helpers (shared with the client) ---
+def _recv_exact(sock, n: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("Embedding socket closed")
+        buf.extend(chunk)
+    return bytes(buf)
+
+
+def send_message(sock, message: dict, payload: bytes = b""):
+    body = json.dumps(message).encode("utf-8")
+    sock.sendall(_header.pack(len(body), len(payload)) + body + payload)
+
+
+def recv_message(sock):
+    body_len, payload_len = _header.unpack(_recv_exact(sock, _header.size))
+    message = json.loads(_recv_exact(sock, body_len))
+    payload = _recv_exact(sock, payload_len) if payload_len else b""
+    return message, payload
+
+
+# --- Micro-batching ---
+class _Job:
+    __slots__ = ("texts", "normalize", "enqueued", "done", "result", "error")
+
+    def __init__(self, texts, normalize):
+        self.texts = texts
+        self.normalize = normalize
+        self.enqueued = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MicroBatcher:
+    """
+    Collects jobs from many connection threads and runs them through the
+    model together. A batch closes when it holds MAX_BATCH texts or when
+    MAX_WAIT_MS has passed since its first job arrived.
+
+    A request over MAX_BATCH texts is split into MAX_BATCH-sized jobs on a
+    separate bulk queue, which is only drawn from when no interactive job
+    is waiting; a forward pass never exceeds MAX_BATCH texts, so a query
+    waits for at most one bulk pass.
+    """
+
+    def __init__(self, model, max_batch: int = MAX_BATCH, max_wait_ms: float = MAX_WAIT_MS):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._interactive = deque()
+        self._bulk = deque()
+        self._ready = threading.Condition()
+        self._lock = threading.Lock()
+        self.counters = {
+            "requests": 0, "split_requests": 0, "jobs": 0, "texts": 0, "batches": 0, "errors": 0,
+            "max_queue_depth": 0, "queue_wait_ms_total": 0.0, "encode_ms_total": 0.0,
+        }
+        self.batch_sizes = {}   # texts per forward pass -> count
+        threading.Thread(target=self._run, name="embed-batcher", daemon=True).start()
+
+    def _queue_depth(self) -> int:
+        return len(self._interactive) + len(self._bulk)
+
+    def encode(self, texts, normalize: bool = True) -> np.ndarray:
+        texts = list(texts)
+        split = len(texts) > self.max_batch
+        jobs = [
+            _Job(texts[i:i + self.max_batch], normalize) for i in range(0, len(texts), self.max_batch)
+        ] if split else [_Job(texts, normalize)]
+        with self._ready:
+            (self._bulk if split else self._interactive).extend(jobs)
+            depth = self._queue_depth()
+            self._ready.notify()
+        with self._lock:
+            self.counters["requests"] += 1
+            self.counters["split_requests"] += int(split)
+            self.counters["max_queue_depth"] = max(self.counters["max_queue_depth"], depth)
+        for job in jobs:
+            job.done.wait()
+            if job.error:
+                raise job.error
+        return jobs[0].result if len(jobs) == 1 else np.concatenate([job.result for job in jobs])
+
+    def _collect(self):
+        with self._ready:
+            while not self._interactive and not self._bulk:
+                self._ready.wait()
+            batch = [(self._interactive or self._bulk).popleft()]
+            size = len(batch[0].texts)
+            deadline = time.perf_counter() + self.max_wait
+            while size < self.max_batch:
+                source = self._interactive or self._bulk
+                if source:
+                    if size + len(source[0].texts) > self.max_batch:
+                        break
+                    job = source.popleft()
+                    batch.append(job)
+                    size += len(job.texts)
+                    continue
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._ready.wait(remaining)
+        return batch, size
+
+    def _run(self):
+        while True:
+            batch, size = self._collect()
+            started = time.perf_counter()
+            try:
+                # Encode un-normalised once; normalise per job as requested
+                vectors = np.asarray(
+                    self.model.encode([t for job in batch for t in job.texts], normalize_embeddings=False),
+                    dtype=np.float32
+                )
+                offset = 0
+                for job in batch:
+                    part = vectors[offset:offset + len(job.texts)]
+                    offset += len(job.texts)
+                    if job.normalize:
+                        part = part / np.maximum(np.linalg.norm(part, axis=1, keepdims=True), 1e-12)
+                    job.result = part
+            except Exception as e:
+                print(f"[EmbeddingServer] Batch of {size} failed: {e}")
+                for job in batch:
+                    job.error = e
+                with self._lock:
+                    self.counters["errors"] += 1
+
+            finished = time.perf_counter()
+            with self._lock:
+                self.counters["batches"] += 1
+                self.counters["jobs"] += len(batch)
+                self.counters["texts"] += size
+                self.counters["encode_ms_total"] += (finished - started) * 1000
+                self.counters["queue_wait_ms_total"] += sum(started - job.enqueued for job in batch) * 1000
+                self.batch_sizes[size] = self.batch_sizes.get(size, 0) + 1
+            for job in batch:
+                job.done.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            c = dict(self.counters)
+            batches = c["batches"] or 1
+            return {
+                **c,
+                "queue_depth": self._queue_depth(),
+                "mean_batch_size": round(c["texts"] / batches, 2),
+                "mean_queue_wait_ms": round(c["queue_wait_ms_total"] / max(c["jobs"], 1), 2),
+                "mean_encode_ms": round(c["encode_ms_total"] / batches, 2),
+                "batch_size_histogram": dict(sorted(self.batch_sizes.items())),
+                "max_batch": self.max_batch,
+                "max_wait_ms": self.max_wait * 1000,
+            }
+
+
+# --- Server ---
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        batcher = self.server.batcher
+        while True:
+            try:
+                message, _ = recv_message(self.request)
+            except ConnectionError:
+                return
+            try:
+                if message.get("op") == "encode":
+                    vectors = batcher.encode(message["texts"], message.get("normalize", True))
+                    send_message(
+                        self.request,
+                        {"ok": True, "shape": list(vectors.shape), "dtype": "float32"},
+                        vectors.tobytes()
+                    )
+                elif message.get("op") == "info":
+                    send_message(self.request, {"ok": True, "backend": self.server.backend})
+                elif message.get("op") == "stats":
+                    send_message(self.request, {"ok": True, "stats": {**batcher.stats(), "backend": self.server.backend}})
+                else:
+                    send_message(self.request, {"ok": False, "error": f"Unknown op: {message.get('op')}"})
+            except Exception as e:
+                send_message(self.request, {"ok": False, "error": str(e)})
+
+
+class EmbeddingServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128   # Every web worker thread may connect at once
+
+    def __init__(self, socket_path, model, backend_name):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)   # Stale socket from a previous run
+        super().__init__(socket_path, _Handler)
+        os.chmod(socket_path, 0o660)
+        self.batcher = MicroBatcher(model)
+        self.backend = backend_name
+
+
+def main():
+    from .embedding_backend import load_backend
+    from .rag_service import EMBEDDING_MODEL_NAME, EMBEDDING_BACKEND
+
+    parser = argparse.ArgumentParser(description="Shared bge-m3 embedding worker.")
+    parser.add_argument("--socket", default=SOCKET_PATH)
+    parser.add_argument("--backend", default=EMBEDDING_BACKEND)
+    args = parser.parse_args()
+
+    print(f"Loading {EMBEDDING_MODEL_NAME} ({args.backend})...")
+    model = load_backend(args.backend, EMBEDDING_MODEL_NAME)
+    model.encode(["warm up"])
+
+    server = EmbeddingServer(args.socket, model, args.backend)
+    print(f"Embedding server listening on {args.socket} (max_batch={MAX_BATCH}, max_wait={MAX_WAIT_MS}ms)")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.unlink(args.socket)
+
+
+if __name__ == "__main__":
+    main()
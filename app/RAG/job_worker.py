@@ -0,0 +1,126 @@
+"""
+Background analysis workers.
+
+Each worker process builds its own "rag" app (for the database session),
+claims jobs from app/RAG/jobs.py and runs the same pipeline as the
+synchronous /analyze: PDF extraction / OCR, retrieval, the Gemini call
+(through the shared rate limiter) and the user-cache update.
+
+Run with:
+    python -m app.RAG.job_worker --workers 2
+"""
+import io
+import os
+import time
+import argparse
+import threading
+import multiprocessing
+
+POLL_INTERVAL_SECONDS = 0.5
+REQUEUE_EVERY_SECONDS = 30
+
+
+def keep_lease(job, stop: threading.Event):
+    """Heartbeat thread: extends the job's lease until `stop` is set or the lease is lost."""
+    from . import jobs
+
+    while not stop.wait(jobs.HEARTBEAT_SECONDS):
+        try:
+            if not jobs.heartbeat(job):
+                print(f"[Worker {os.getpid()}] Job {job['id']}: lease lost to another worker.")
+                return
+        except Exception as e:
+            print(f"[Worker {os.getpid()}] Job {job['id']}: heartbeat failed: {e}")
+
+
+def process(job):
+    from . import jobs
+    from .services import perform_legal_analysis, extract_text_from_upload, parse_analysis_result
+    from .user_cache import get_user_cache, cached_analysis, store_analysis
+    from .rate_limiter import RateLimitExceeded
+    from .llm_client import CircuitOpenError, LLMTimeout
+
+    user_id = job["user_id"]
+    jurisdiction = job.get("jurisdiction") or None
+    stop = threading.Event()
+    threading.Thread(target=keep_lease, args=(job, stop), name="lex-job-heartbeat", daemon=True).start()
+    try:
+        if job.get("pdf") is not None:
+            document_text = extract_text_from_upload(io.BytesIO(job["pdf"]))
+        elif job.get("has_pdf") == "1":
+            raise ValueError("The uploaded file expired before it could be processed.")
+        else:
+            document_text = job["text"]
+
+        user_cache = get_user_cache(user_id)
+        analysis_result = cached_analysis(user_id, user_cache, document_text, jurisdiction, job.get("role"))
+        if analysis_result is None:
+            analysis_result = parse_analysis_result(perform_legal_analysis(
+                document_text=document_text,
+                user_id=user_id,
+                jurisdiction=jurisdiction
+            ))
+            store_analysis(user_id, user_cache, document_text, jurisdiction, analysis_result)
+        if jobs.complete(job, analysis_result):
+            print(f"[Worker {os.getpid()}] Job {job['id']} done.")
+
+    except (RateLimitExceeded, CircuitOpenError, LLMTimeout) as e:
+        # Upstream is busy or down for now: try again later rather than failing the job
+        print(f"[Worker {os.getpid()}] Job {job['id']} {type(e).__name__}: {e}")
+        jobs.retry(job, str(e))
+    except ValueError as e:
+        print(f"[Worker {os.getpid()}] Job {job['id']} failed: {e}")
+        jobs.fail(job, str(e))
+    except Exception as e:
+        print(f"[Worker {os.getpid()}] Job {job['id']} UNEXPECTED ERROR:\n{e}")
+        jobs.fail(job, "An internal error occurred during analysis.")
+    finally:
+        stop.set()
+
+
+def run_worker(config_name: str):
+    from app import create_app
+    from . import jobs, rag_service, llm_service
+
+    app = create_app(config_name, role="rag")
+    with app.app_context():
+        rag_service.warm_up()
+        llm_service.warm_up()
+        print(f"[Worker {os.getpid()}] Waiting for jobs...")
+
+        last_requeue = 0.0
+        while True:
+            if time.monotonic() - last_requeue > REQUEUE_EVERY_SECONDS:
+                requeued = jobs.requeue_expired()
+                if requeued:
+                    print(f"[Worker {os.getpid()}] Re-queued {requeued} abandoned job(s).")
+                last_requeue = time.monotonic()
+
+            job = jobs.claim()
+            if job is None:
+                time.sleep(POLL_INTERVAL_SECONDS)
+                continue
+            process(job)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Background /analyze workers.")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("LEX_JOB_WORKERS", 2)))
+    parser.add_argument("--config", default=os.getenv("FLASK_CONFIG") or "default")
+    args = parser.parse_args()
+
+    # spawn, not fork: every worker loads its own torch / Redis / DB connections
+    ctx = multiprocessing.get_context("spawn")
+    workers = [
+        ctx.Process(target=run_worker, args=(args.config,), name=f"lex-job-worker-{i}")
+        for i in range(args.workers)
+    ]
+    for worker in workers:
+        worker.start()
+    print(f"Started {len(workers)} analysis worker(s).")
+    for worker in workers:
+        worker.join()
+
+
+if __name__ == "__main__":
+    main()
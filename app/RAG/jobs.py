@@ -0,0 +1,312 @@
+"""
+Redis-backed queue of background analysis jobs.
+
+    lex:jobs:queue        ZSET  job_id -> priority band * 1e13 + enqueue time (ms)
+    lex:jobs:inflight     ZSET  job_id -> lease deadline (ms), pushed forward by heartbeat()
+    lex:jobs:running      HASH  user_id -> jobs currently being processed
+    lex:jobs:delayed      ZSET  job_id -> time (ms) it may be retried
+    lex:job:{id}          HASH  status, user_id, role, text, jurisdiction, result, error, ...
+    lex:job:{id}:pdf      raw upload bytes (extracted by the worker)
+
+premium_user jobs sit in a lower band than free_user jobs, so they are always
+claimed first; within a band jobs run in arrival order. claim() skips jobs
+of users who already have MAX_RUNNING_PER_USER jobs in flight, so one user's
+burst can't occupy every worker. A job whose worker dies is put back on the
+queue once its lease runs out (see requeue_expired()). Every claim gets its
+own token: a worker that lost its lease can no longer extend it or record a
+result, so a requeued job is never finished twice.
+
+Transient upstream failures (rate limit, open circuit, timeout) are retried:
+retry() parks the job in the delayed set with exponential backoff, and
+claim() moves it back to the queue when it is due. After MAX_RETRIES the job
+fails with the last reason.
+
+Workers: python -m app.RAG.job_worker
+"""
+import os
+import json
+import time
+import uuid
+
+from . import r, r_raw
+
+QUEUE_KEY = "lex:jobs:queue"
+INFLIGHT_KEY = "lex:jobs:inflight"
+RUNNING_KEY = "lex:jobs:running"
+DELAYED_KEY = "lex:jobs:delayed"
+JOB_PREFIX = "lex:job:"
+
+PRIORITY_BANDS = {"premium_user": 0, "free_user": 1}
+BAND_WIDTH = 10 ** 13                   # > any epoch-ms timestamp, so bands never interleave
+MAX_RUNNING_PER_USER = int(os.environ.get("LEX_JOBS_PER_USER", 2))
+# A running job's lease; the worker extends it every HEARTBEAT_SECONDS
+VISIBILITY_SECONDS = int(os.environ.get("LEX_JOB_VISIBILITY_SECONDS", 120))
+HEARTBEAT_SECONDS = max(1, VISIBILITY_SECONDS // 4)
+MAX_ATTEMPTS = 2                        # Worker deaths before a job is failed
+MAX_RETRIES = int(os.environ.get("LEX_JOB_MAX_RETRIES", 3))   # Transient upstream errors
+RETRY_BASE_SECONDS = 20
+RETRY_MAX_SECONDS = 300
+JOB_TTL_SECONDS = 86400
+CLAIM_SCAN = 50                         # Queue head entries inspected per claim
+
+# Move due retries back to the queue, then claim the best job whose owner is
+# under the concurrency cap.
+_CLAIM_LUA = """
+for _, job_id in ipairs(redis.call('ZRANGEBYSCORE', KEYS[4], '-inf', ARGV[1])) do
+    redis.call('ZREM', KEYS[4], job_id)
+    local score = redis.call('HGET', ARGV[5] .. job_id, 'score')
+    if score then
+        redis.call('HSET', ARGV[5] .. job_id, 'status', 'queued')
+        redis.call('ZADD', KEYS[1], score, job_id)
+    end
+end
+local candidates = redis.call('ZRANGE', KEYS[1], 0, tonumber(ARGV[2]) - 1)
+for _, job_id in ipairs(candidates) do
+    local job_key = ARGV[5] .. job_id
+    local user_id = redis.call('HGET', job_key, 'user_id')
+    if not user_id then
+        redis.call('ZREM', KEYS[1], job_id)   -- Job hash expired while queued
+    elseif tonumber(redis.call('HGET', KEYS[3], user_id) or '0') < tonumber(ARGV[3]) then
+        redis.call('ZREM', KEYS[1], job_id)
+        redis.call('ZADD', KEYS[2], tonumber(ARGV[1]) + tonumber(ARGV[4]), job_id)
+        redis.call('HINCRBY', KEYS[3], user_id, 1)
+        redis.call('HSET', job_key, 'status', 'running', 'started_at', ARGV[1], 'claim', ARGV[6])
+        return job_id
+    end
+end
+return false
+"""
+
+# Extend the lease, if this claim still holds it.
+_HEARTBEAT_LUA = """
+if redis.call('HGET', KEYS[2], 'claim') ~= ARGV[2] then
+    return 0
+end
+if not redis.call('ZSCORE', KEYS[1], ARGV[3]) then
+    return 0
+end
+redis.call('ZADD', KEYS[1], ARGV[1], ARGV[3])
+return 1
+"""
+
+# Release the user's slot and record the outcome, only if this claim still holds
+# the lease (otherwise the job was requeued and belongs to another worker now).
+_FINISH_LUA = """
+if redis.call('HGET', KEYS[3], 'claim') ~= ARGV[8] or redis.call('ZREM', KEYS[1], ARGV[1]) == 0 then
+    return 0
+end
+if redis.call('HINCRBY', KEYS[2], ARGV[2], -1) <= 0 then
+    redis.call('HDEL', KEYS[2], ARGV[2])
+end
+redis.call('HDEL', KEYS[3], 'claim', 'retry_at', 'error')
+redis.call('HSET', KEYS[3], 'status', ARGV[3], 'finished_at', ARGV[4], ARGV[5], ARGV[6])
+redis.call('EXPIRE', KEYS[3], ARGV[7])
+return 1
+"""
+
+# Release the user's slot and park the job until ARGV[5]; 0 once retries are used up, -1 if the claim is stale.
+_RETRY_LUA = """
+if redis.call('HGET', KEYS[3], 'claim') ~= ARGV[3] or redis.call('ZREM', KEYS[1], ARGV[1]) == 0 then
+    return -1
+end
+if redis.call('HINCRBY', KEYS[2], ARGV[2], -1) <= 0 then
+    redis.call('HDEL', KEYS[2], ARGV[2])
+end
+redis.call('HDEL', KEYS[3], 'claim')
+local retries = redis.call('HINCRBY', KEYS[3], 'retries', 1)
+if retries > tonumber(ARGV[6]) then
+    return 0
+end
+redis.call('HSET', KEYS[3], 'status', 'retrying', 'error', ARGV[4], 'retry_at', ARGV[5])
+redis.call('ZADD', KEYS[4], ARGV[5], ARGV[1])
+return retries
+"""
+
+# Put jobs whose worker vanished back on the queue (or fail them after MAX_ATTEMPTS).
+_REQUEUE_LUA = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+for _, job_id in ipairs(expired) do
+    redis.call('ZREM', KEYS[1], job_id)
+    local job_key = ARGV[2] .. job_id
+    local user_id = redis.call('HGET', job_key, 'user_id')
+    redis.call('HDEL', job_key, 'claim')
+    if user_id then
+        if redis.call('HINCRBY', KEYS[2], user_id, -1) <= 0 then
+            redis.call('HDEL', KEYS[2], user_id)
+        end
+        if redis.call('HINCRBY', job_key, 'attempts', 1) >= tonumber(ARGV[3]) then
+            redis.call('HSET', job_key, 'status', 'failed', 'error', 'The analysis worker stopped unexpectedly.')
+        else
+            redis.call('HSET', job_key, 'status', 'queued')
+            redis.call('ZADD', KEYS[3], redis.call('HGET', job_key, 'score'), job_id)
+        end
+    end
+end
+return #expired
+"""
+
+_claim = r.register_script(_CLAIM_LUA)
+_heartbeat = r.register_script(_HEARTBEAT_LUA)
+_finish = r.register_script(_FINISH_LUA)
+_retry = r.register_script(_RETRY_LUA)
+_requeue = r.register_script(_REQUEUE_LUA)
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def job_key(job_id: str) -> str:
+    return f"{JOB_PREFIX}{job_id}"
+
+
+def enqueue(user_id, role: str, text: str = None, pdf_bytes: bytes = None, jurisdiction: str = None) -> str:
+    """Queues an analysis of `text` (or of an uploaded PDF) and returns the job id."""
+    job_id = uuid.uuid4().hex
+    now = _now_ms()
+    score = PRIORITY_BANDS.get(role, PRIORITY_BANDS["free_user"]) * BAND_WIDTH + now
+
+    if pdf_bytes is not None:
+        r_raw.set(f"{job_key(job_id)}:pdf", pdf_bytes, ex=JOB_TTL_SECONDS)
+
+    pipe = r.pipeline(transaction=True)
+    pipe.hset(job_key(job_id), mapping={
+        "id": job_id,
+        "user_id": str(user_id),
+        "role": role,
+        "status": "queued",
+        "created_at": now,
+        "score": score,
+        "attempts": 0,
+        "text": text or "",
+        "has_pdf": int(pdf_bytes is not None),
+        "jurisdiction": jurisdiction or "",
+    })
+    pipe.expire(job_key(job_id), JOB_TTL_SECONDS)
+    pipe.zadd(QUEUE_KEY, {job_id: score})
+    pipe.execute()
+    print(f"[Jobs] Queued {job_id} for {role} {user_id}")
+    return job_id
+
+
+def claim():
+    """Next job (dict, including its input) for a worker, or None if nothing is runnable."""
+    token = uuid.uuid4().hex
+    job_id = _claim(
+        keys=[QUEUE_KEY, INFLIGHT_KEY, RUNNING_KEY, DELAYED_KEY],
+        args=[_now_ms(), CLAIM_SCAN, MAX_RUNNING_PER_USER, VISIBILITY_SECONDS * 1000, JOB_PREFIX, token]
+    )
+    if not job_id:
+        return None
+    job = r.hgetall(job_key(job_id))
+    job["claim"] = token
+    if job.get("has_pdf") == "1":
+        job["pdf"] = r_raw.get(f"{job_key(job_id)}:pdf")
+    return job
+
+
+def heartbeat(job) -> bool:
+    """Pushes the job's lease forward; False if this worker no longer holds it."""
+    return bool(_heartbeat(
+        keys=[INFLIGHT_KEY, job_key(job["id"])],
+        args=[_now_ms() + VISIBILITY_SECONDS * 1000, job["claim"], job["id"]]
+    ))
+
+
+def _finish_job(job, status, field, value) -> bool:
+    finished = _finish(
+        keys=[INFLIGHT_KEY, RUNNING_KEY, job_key(job["id"])],
+        args=[job["id"], job["user_id"], status, _now_ms(), field, value, JOB_TTL_SECONDS, job["claim"]]
+    )
+    if not finished:
+        print(f"[Jobs] {job['id']}: lease lost, outcome '{status}' discarded")
+        return False
+    r_raw.delete(f"{job_key(job['id'])}:pdf")
+    return True
+
+
+def complete(job, result: dict) -> bool:
+    return _finish_job(job, "done", "result", json.dumps(result))
+
+
+def fail(job, error: str) -> bool:
+    return _finish_job(job, "failed", "error", error)
+
+
+def retry(job, reason: str) -> bool:
+    """
+    Puts the job back after a transient failure, with exponential backoff.
+    False if it has used up MAX_RETRIES (it is then failed with `reason`) or
+    this worker lost the lease.
+    """
+    retries = int(job.get("retries") or 0)
+    delay = min(RETRY_BASE_SECONDS * 2 ** retries, RETRY_MAX_SECONDS)
+    outcome = _retry(
+        keys=[INFLIGHT_KEY, RUNNING_KEY, job_key(job["id"]), DELAYED_KEY],
+        args=[job["id"], job["user_id"], job["claim"], reason, _now_ms() + delay * 1000, MAX_RETRIES]
+    )
+    if outcome == -1:
+        print(f"[Jobs] {job['id']}: lease lost, retry discarded")
+        return False
+    if outcome == 0:
+        # Slot already released; record the failure directly
+        pipe = r.pipeline(transaction=True)
+        pipe.hset(job_key(job["id"]), mapping={"status": "failed", "finished_at": _now_ms(), "error": reason})
+        pipe.hdel(job_key(job["id"]), "retry_at")
+        pipe.expire(job_key(job["id"]), JOB_TTL_SECONDS)
+        pipe.execute()
+        r_raw.delete(f"{job_key(job['id'])}:pdf")
+        return False
+    print(f"[Jobs] {job['id']}: retry {outcome}/{MAX_RETRIES} in {delay}s ({reason})")
+    return True
+
+
+def requeue_expired() -> int:
+    return _requeue(keys=[INFLIGHT_KEY, RUNNING_KEY, QUEUE_KEY], args=[_now_ms(), JOB_PREFIX, MAX_ATTEMPTS])
+
+
+def get_job(job_id: str):
+    """Public view of a job (no input text), or None if unknown/expired."""
+    pipe = r.pipeline(transaction=False)
+    pipe.hgetall(job_key(job_id))
+    pipe.zrank(QUEUE_KEY, job_id)
+    job, position = pipe.execute()
+    if not job:
+        return None
+
+    view = {
+        "job_id": job["id"],
+        "user_id": job["user_id"],
+        "status": job["status"],
+        "created_at": int(job["created_at"]) / 1000,
+    }
+    if job["status"] == "queued" and position is not None:
+        view["queue_position"] = position + 1
+    if job.get("started_at"):
+        view["started_at"] = int(job["started_at"]) / 1000
+    if job.get("finished_at"):
+        view["finished_at"] = int(job["finished_at"]) / 1000
+    if job.get("result"):
+        view["result"] = json.loads(job["result"])
+    if job.get("error"):
+        view["error"] = job["error"]
+    if job.get("retry_at"):
+        view["retry_at"] = int(job["retry_at"]) / 1000
+    if job.get("retries"):
+        view["retries"] = int(job["retries"])
+    return view
+
+
+def queue_stats() -> dict:
+    pipe = r.pipeline(transaction=False)
+    for band in PRIORITY_BANDS.values():
+        pipe.zcount(QUEUE_KEY, band * BAND_WIDTH, (band + 1) * BAND_WIDTH - 1)
+    pipe.zcard(INFLIGHT_KEY)
+    pipe.zcard(DELAYED_KEY)
+    *queued, inflight, delayed = pipe.execute()
+    return {
+        "queued": dict(zip(PRIORITY_BANDS, queued)),
+        "running": inflight,
+        "retrying": delayed,
+        "max_running_per_user": MAX_RUNNING_PER_USER,
+    }
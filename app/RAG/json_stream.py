@@ -0,0 +1,89 @@
+"""
+Incremental parser for the analyzer's streamed JSON.
+
+The analyzer answers with one object, {"summary": "...", "red_flags": [{...}, ...]},
+generated a few characters at a time. AnalysisStreamParser scans each delta
+once, tracking only string/escape state and container depth, and reports a
+value the moment it closes:
+
+    ("summary", str)        the top-level "summary" string
+    ("red_flag", dict)      each complete element of the top-level "red_flags"
+
+Anything before the first "{" (e.g. a ```json fence) is skipped, and so is
+everything after the object closes. The parser never fails: a malformed
+element is not reported, and the caller still validates the full text at
+the end.
+"""
+import json
+
+
+class AnalysisStreamParser:
+    def __init__(self):
+        self.text = ""
+        self.pos = 0
+        self.stack = []             # Open containers, "{" or "["
+        self.in_string = False
+        self.escape = False
+        self.string_start = None
+        self.expect_key = False     # Next top-level string is a key, not a value
+        self.key = None             # Last top-level key seen
+        self.flag_start = None      # Offset of the red_flags element being read
+        self.done = False
+
+    def _in_red_flags(self) -> bool:
+        return len(self.stack) >= 2 and self.stack[1] == "[" and self.key == "red_flags"
+
+    def _decode(self, start, stop):
+        try:
+            return json.loads(self.text[start:stop])
+        except ValueError:
+            return None
+
+    def feed(self, delta: str) -> list:
+        """Consumes the next piece of output; returns the values it completed."""
+        events = []
+        self.text += delta
+        text = self.text
+        while self.pos < len(text) and not self.done:
+            i, ch = self.pos, text[self.pos]
+            self.pos += 1
+
+            if not self.stack and ch != "{":
+                continue
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                    if len(self.stack) == 1:
+                        value = self._decode(self.string_start, i + 1)
+                        if self.expect_key:
+                            self.key = value
+                        elif self.key == "summary" and isinstance(value, str):
+                            events.append(("summary", value))
+                continue
+
+            if ch == '"':
+                self.in_string, self.string_start = True, i
+            elif ch in "{[":
+                self.stack.append(ch)
+                if len(self.stack) == 1:
+                    self.expect_key = True
+                elif len(self.stack) == 3 and ch == "{" and self._in_red_flags():
+                    self.flag_start = i
+            elif ch in "}]":
+                if len(self.stack) == 3 and ch == "}" and self.flag_start is not None:
+                    flag = self._decode(self.flag_start, i + 1)
+                    self.flag_start = None
+                    if isinstance(flag, dict):
+                        events.append(("red_flag", flag))
+                self.stack.pop()
+                self.done = not self.stack
+            elif len(self.stack) == 1:
+                if ch == ",":
+                    self.expect_key = True
+                elif ch == ":":
+                    self.expect_key = False
+        return events
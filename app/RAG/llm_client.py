@@ -0,0 +1,316 @@
+"""
+Asyncio client layer for the LangChain chat models.
+
+All calls run on ONE persistent event loop in a daemon thread, so each
+model's async HTTP client (and its connection pool) is created once and
+reused, instead of a fresh connection per blocking .invoke(). Flask code
+stays synchronous: invoke()/stream() submit to the loop and wait.
+
+Per client:
+    - a semaphore bounding concurrent upstream calls,
+    - a deadline for the whole call, retries included,
+    - retries with exponential backoff + jitter for transient errors
+      (timeouts, connection resets, 5xx; never quota errors, which the
+      rate limiter handles),
+    - optional hedging: if the first attempt hasn't answered after
+      `hedge_after` seconds a second one is started and the first reply wins,
+    - a circuit breaker that fails fast for `reset_timeout` seconds after
+      `failure_threshold` consecutive failures, then lets one probe through.
+"""
+import time
+import queue
+import asyncio
+import threading
+import concurrent.futures
+from collections import deque
+
+import numpy as np
+
+from tenacity import AsyncRetrying, retry_if_exception, stop_after_attempt, stop_after_delay, wait_exponential_jitter
+
+from .rate_limiter import is_quota_error
+
+STREAM_END = object()
+RECENT_LATENCIES = 200      # Window for the p95 used by the model router
+
+
+class LLMTimeout(TimeoutError):
+    """The call (including retries) did not finish before its deadline."""
+
+
+class CircuitOpenError(RuntimeError):
+    """The upstream failed repeatedly; calls are rejected until the breaker resets."""
+
+
+def is_retryable(error: Exception) -> bool:
+    if is_quota_error(error) or isinstance(error, (CircuitOpenError, asyncio.CancelledError)):
+        return False
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    text = f"{type(error).__name__} {error}".lower()
+    return any(marker in text for marker in (
+        "timeout", "timed out", "unavailable", "connection", "503", "502", "500", "internal", "reset"
+    ))
+
+
+# --- Event loop thread ---
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="lex-llm-loop", daemon=True).start()
+                _loop = loop
+    return _loop
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self.probing:
+                self.probing = True   # Exactly one probe call while half-open
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures, self.opened_at, self.probing = 0, None, False
+
+    def release_probe(self):
+        """The probe call ended without a verdict (e.g. the client disconnected)."""
+        with self._lock:
+            self.probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self.probing = False
+
+
+class AsyncLLMClient:
+    def __init__(self, name: str, llm, max_concurrency: int = 4, deadline: float = 120.0,
+                 max_attempts: int = 3, hedge_after: float = None, breaker: CircuitBreaker = None,
+                 semaphore: asyncio.Semaphore = None):
+        self.name = name
+        self.llm = llm
+        self.deadline = deadline
+        self.max_attempts = max_attempts
+        self.hedge_after = hedge_after
+        self.max_concurrency = max_concurrency
+        # Clients for the same upstream (e.g. two Ollama configs) share a breaker and a semaphore
+        self.breaker = breaker or CircuitBreaker()
+        self.semaphore = semaphore or asyncio.Semaphore(max_concurrency)
+        self.loop = get_loop()
+        self.in_flight = 0
+        self.latencies = deque(maxlen=RECENT_LATENCIES)
+        self._lock = threading.Lock()
+        self.counters = {
+            "calls": 0, "succeeded": 0, "failed": 0, "retries": 0, "timeouts": 0,
+            "rejected_open_circuit": 0, "hedges": 0, "hedge_wins": 0, "latency_ms_total": 0.0,
+        }
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def _track(self, delta: int):
+        with self._lock:
+            self.in_flight += delta
+
+    def _record_latency(self, seconds: float):
+        with self._lock:
+            self.counters["succeeded"] += 1
+            self.counters["latency_ms_total"] += seconds * 1000
+            self.latencies.append(seconds)
+
+    def p95_latency(self):
+        """p95 of recent successful calls in seconds, or None before the first one."""
+        with self._lock:
+            recent = list(self.latencies)
+        return float(np.percentile(recent, 95)) if recent else None
+
+    # --- Coroutines (run on the loop thread) ---
+    async def _attempt(self, messages):
+        async with self.semaphore:
+            return await self.llm.ainvoke(messages)
+
+    async def _hedged(self, messages):
+        if not self.hedge_after:
+            return await self._attempt(messages)
+        first = asyncio.ensure_future(self._attempt(messages))
+        done, _ = await asyncio.wait({first}, timeout=self.hedge_after)
+        if done:
+            return first.result()
+
+        self._count("hedges")
+        second = asyncio.ensure_future(self._attempt(messages))
+        pending = {first, second}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self._count("hedge_wins")
+                        return task.result()
+            raise first.exception()   # Both attempts failed
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def ainvoke(self, messages, deadline: float = None):
+        deadline = deadline or self.deadline
+
+        def before_sleep(retry_state):
+            self._count("retries")
+            print(f"[LLMClient] {self.name} attempt {retry_state.attempt_number} failed "
+                  f"({retry_state.outcome.exception()}); retrying")
+
+        retrying = AsyncRetrying(
+            stop=stop_after_attempt(self.max_attempts) | stop_after_delay(deadline),
+            wait=wait_exponential_jitter(initial=1, max=10),
+            retry=retry_if_exception(is_retryable),
+            before_sleep=before_sleep,
+            reraise=True,
+        )
+
+        async def call():
+            async for attempt in retrying:
+                with attempt:
+                    return await self._hedged(messages)
+
+        return await asyncio.wait_for(call(), timeout=deadline)
+
+    # --- Sync bridge (called from Flask / worker threads) ---
+    def _guarded(self, run):
+        if not self.breaker.allow():
+            self._count("rejected_open_circuit")
+            raise CircuitOpenError(f"{self.name} is unavailable; please try again shortly.")
+        self._count("calls")
+        self._track(1)
+        started = time.perf_counter()
+        try:
+            result = run()
+        except (asyncio.TimeoutError, concurrent.futures.TimeoutError, TimeoutError) as e:
+            self._count("timeouts")
+            self._count("failed")
+            self.breaker.record_failure()
+            raise LLMTimeout(f"{self.name} did not respond in time.") from e
+        except Exception as e:
+            self._count("failed")
+            if is_quota_error(e):   # Being throttled doesn't mean the upstream is down
+                self.breaker.release_probe()
+            else:
+                self.breaker.record_failure()
+            raise
+        finally:
+            self._track(-1)
+        self._record_latency(time.perf_counter() - started)
+        self.breaker.record_success()
+        return result
+
+    def invoke(self, messages, deadline: float = None):
+        deadline = deadline or self.deadline
+
+        def run():
+            future = asyncio.run_coroutine_threadsafe(self.ainvoke(messages, deadline), self.loop)
+            try:
+                return future.result(timeout=deadline + 1)
+            except BaseException:
+                future.cancel()
+                raise
+        return self._guarded(run)
+
+    def stream(self, messages, deadline: float = None):
+        """
+        Yields message chunks from llm.astream(). `deadline` bounds the wait for
+        the first chunk and for each gap between chunks. Not retried or hedged:
+        a partial stream can't be replayed.
+        """
+        deadline = deadline or self.deadline
+        chunks = queue.Queue()
+
+        async def pump():
+            try:
+                async with self.semaphore:
+                    async for chunk in self.llm.astream(messages):
+                        chunks.put(chunk)
+            except BaseException as e:
+                chunks.put(e)
+            finally:
+                chunks.put(STREAM_END)
+
+        if not self.breaker.allow():
+            self._count("rejected_open_circuit")
+            raise CircuitOpenError(f"{self.name} is unavailable; please try again shortly.")
+        self._count("calls")
+        self._track(1)
+        started = time.perf_counter()
+        future = asyncio.run_coroutine_threadsafe(pump(), self.loop)
+        try:
+            while True:
+                try:
+                    item = chunks.get(timeout=deadline)
+                except queue.Empty:
+                    self._count("timeouts")
+                    raise LLMTimeout(f"{self.name} stopped responding.")
+                if item is STREAM_END:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        except GeneratorExit:
+            self.breaker.release_probe()   # Client went away; not the upstream's fault
+            raise
+        except Exception as e:
+            self._count("failed")
+            if is_quota_error(e):
+                self.breaker.release_probe()
+            else:
+                self.breaker.record_failure()
+            raise
+        else:
+            self._record_latency(time.perf_counter() - started)
+            self.breaker.record_success()
+        finally:
+            self._track(-1)
+            future.cancel()
+
+    def stats(self) -> dict:
+        with self._lock:
+            c = dict(self.counters)
+        p95 = self.p95_latency()
+        return {
+            **c,
+            "mean_latency_ms": round(c["latency_ms_total"] / c["succeeded"], 1) if c["succeeded"] else 0.0,
+            "p95_latency_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "in_flight": self.in_flight,
+            "circuit": self.breaker.state,
+            "hedge_after_s": self.hedge_after,
+        }
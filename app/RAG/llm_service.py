@@ -1,9 +1,16 @@
 import os
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_ollama import ChatOllama
+import time
+import threading
+import xxhash
 from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
 import json
 
+from . import r
+from .context_builder import count_tokens
+from .rate_limiter import RateLimiter, ModelLimit
+from .llm_client import AsyncLLMClient, CircuitBreaker
+from .model_router import ModelRouter, Target, LOCAL, HOSTED
+
 SYSTEM_PROMPT = """You are Lex AI an intelligent assistant specialized in interpreting Indian legal documents for laypeople. You are **not a lawyer**, and you must **never** provide legal advice or definitive interpretations of law.
 
 ---
@@ -47,7 +54,8 @@ The JSON must strictly follow this structure:
 """
 
 ANALYSIS_PROMPT_TEMPLATE = """
-Here is the legal context I retrieved from my knowledge base:
+Here is the legal context I retrieved from my knowledge base.
+Each excerpt starts with a tag such as "[S1] A2024-01.pdf p.3" naming its source file and page.
 --- BEGIN LEGAL CONTEXT ---
 {context}
 --- END LEGAL CONTEXT ---
@@ -98,41 +106,329 @@ Your goal:
 Help users clearly understand *what* a legal term, clause, or section means — 
 not *what they should do about it*.
 """
+CHAT_SUMMARY_PROMPT = """Summarise the conversation below between a user and Lex, a legal information assistant,
+so the conversation can continue without it. Keep every question the user asked, the facts
+and explanations Lex gave, and any clauses or sections referred to. Write at most 150 words
+of plain prose; do not add anything that was not said.
+
+{previous}--- CONVERSATION ---
+{conversation}
+--- END ---
+"""
+
+MERGE_PROMPT_TEMPLATE = """
+The user's document was too long to analyze in one pass, so each of its sections was summarised separately.
+Here are the section summaries, in document order:
+--- BEGIN SECTION SUMMARIES ---
+{summaries}
+--- END SECTION SUMMARIES ---
+
+Combine them into ONE concise, plain-language summary of the whole document. Identify the key parties,
+their main responsibilities, and any significant financial obligations. Do not repeat yourself and do
+not add anything that is not in the section summaries.
+
+Your response must be a single JSON object with this exact structure:
+{{
+  "summary": "The combined summary."
+}}
+"""
+
+# Changes whenever an analysis prompt is edited, so cached analyses from an
+# older prompt are never served (see app/RAG/analysis_cache.py)
+ANALYSIS_PROMPT_VERSION = xxhash.xxh3_64_hexdigest(
+    (SYSTEM_PROMPT + ANALYSIS_PROMPT_TEMPLATE + MERGE_PROMPT_TEMPLATE).encode("utf-8")
+)
+# Same for cached chat answers (see app/RAG/answer_cache.py)
+CHAT_PROMPT_VERSION = xxhash.xxh3_64_hexdigest(CHAT_SYSTEM_PROMPT.encode("utf-8"))
+
+ANALYZER_MODEL = "gemini-2.5-pro"
+CHATTER_MODEL = "phi3:mini"
+# Hosted fallback for premium chats too long (or a local model too slow) for phi3
+HOSTED_CHAT_MODEL = os.environ.get("LEX_HOSTED_CHAT_MODEL", "gemini-2.5-flash")
+
+# Shared across every worker through Redis. Only the hosted models have a
+# quota; the local Ollama chatter is deliberately absent, so it is never limited.
+rate_limiter = RateLimiter(r, {
+    ANALYZER_MODEL: ModelLimit(
+        per_minute=float(os.environ.get("LEX_GEMINI_RPM", 2)),   # Gemini free tier
+        burst=int(os.environ.get("LEX_GEMINI_BURST", 1))
+    ),
+    HOSTED_CHAT_MODEL: ModelLimit(
+        per_minute=float(os.environ.get("LEX_GEMINI_FLASH_RPM", 10)),
+        burst=int(os.environ.get("LEX_GEMINI_FLASH_BURST", 2))
+    ),
+})
+
+# Deadlines cover a whole call, retries included (see app/RAG/llm_client.py)
+ANALYZER_TIMEOUT = float(os.environ.get("LEX_ANALYZER_TIMEOUT", 180))
+CHATTER_TIMEOUT = float(os.environ.get("LEX_CHATTER_TIMEOUT", 60))
+ANALYZER_CONCURRENCY = int(os.environ.get("LEX_ANALYZER_CONCURRENCY", 4))
+CHATTER_CONCURRENCY = int(os.environ.get("LEX_CHATTER_CONCURRENCY", 2))
+LLM_MAX_ATTEMPTS = int(os.environ.get("LEX_LLM_MAX_ATTEMPTS", 3))
+# Start a second local request if the first hasn't answered after this long (0 = off)
+CHATTER_HEDGE_SECONDS = float(os.environ.get("LEX_CHATTER_HEDGE_SECONDS", 0))
+
+# Model routing (see app/RAG/model_router.py). phi3:mini has a 4k context, so
+# only prompts that leave room for the reply are ever sent to it.
+LOCAL_ANALYSIS_MAX_TOKENS = int(os.environ.get("LEX_ROUTER_LOCAL_ANALYSIS_TOKENS", 3000))
+LOCAL_CHAT_MAX_TOKENS = int(os.environ.get("LEX_ROUTER_LOCAL_CHAT_TOKENS", 3000))
+PREMIUM_ROLE = "premium_user"
+
+# Clients are built on first use (or by warm_up()), so importing this module
+# never pulls in the Gemini / Ollama SDKs.
 llm_analyzer = None
 llm_chatter = None
-
-try:
-    # --- 4. THIS IS THE FIX FOR YOUR QUOTA ERROR ---
-    llm_analyzer = ChatGoogleGenerativeAI(
-        model="gemini-2.5-pro",  # Use the powerful Gemini 1.5 Pro
-        google_api_key=os.environ.get('GEMINI_API_KEY'),
-        convert_system_message_to_human=True, # Helps with System Prompts
-        response_mime_type='application/json' # Ask for JSON directly
-    )
-    print("Google Gemini 1.5 Pro (Analyzer) model loaded.")
-    # --- END FIX ---
-except Exception as e:
-    print(f"CRITICAL: Error setting up Gemini 2.5 Pro:{e}")
+analyzer_client = None
+chatter_client = None
+local_analyzer_client = None
+hosted_chatter_client = None
+_init_lock = threading.Lock()
+
+
+def get_analyzer():
+    global llm_analyzer
+    if llm_analyzer is None:
+        with _init_lock:
+            if llm_analyzer is None:
+                try:
+                    from langchain_google_genai import ChatGoogleGenerativeAI
+                    llm_analyzer = ChatGoogleGenerativeAI(
+                        model=ANALYZER_MODEL,
+                        google_api_key=os.environ.get('GEMINI_API_KEY'),
+                        convert_system_message_to_human=True, # Helps with System Prompts
+                        response_mime_type='application/json' # Ask for JSON directly
+                    )
+                    print("Google Gemini 2.5 Pro (Analyzer) model loaded.")
+                except Exception as e:
+                    print(f"CRITICAL: Error setting up Gemini 2.5 Pro:{e}")
+    return llm_analyzer
+
+
+def get_chatter():
+    global llm_chatter
+    if llm_chatter is None:
+        with _init_lock:
+            if llm_chatter is None:
+                try:
+                    from langchain_ollama import ChatOllama
+                    llm_chatter = ChatOllama(model=CHATTER_MODEL)
+                    print("Ollama Phi-3 Mini (Chatter) model loaded.")
+                except Exception as e:
+                    print(f"CRITICAL: Failed to initialize Ollama: {e}")
+                    print("Is the Ollama app running on your Mac?")
+    return llm_chatter
+
+
+def get_analyzer_client():
+    """The analyzer behind the async client layer (deadline, retries, circuit breaker)."""
+    global analyzer_client
+    if analyzer_client is None and get_analyzer() is not None:
+        with _init_lock:
+            if analyzer_client is None:
+                analyzer_client = AsyncLLMClient(
+                    ANALYZER_MODEL,
+                    llm_analyzer,
+                    max_concurrency=ANALYZER_CONCURRENCY,
+                    deadline=ANALYZER_TIMEOUT,
+                    max_attempts=LLM_MAX_ATTEMPTS,
+                    breaker=CircuitBreaker(failure_threshold=5, reset_timeout=60)
+                )
+    return analyzer_client
+
+
+def get_chatter_client():
+    global chatter_client
+    if chatter_client is None and get_chatter() is not None:
+        with _init_lock:
+            if chatter_client is None:
+                chatter_client = AsyncLLMClient(
+                    CHATTER_MODEL,
+                    llm_chatter,
+                    max_concurrency=CHATTER_CONCURRENCY,
+                    deadline=CHATTER_TIMEOUT,
+                    max_attempts=LLM_MAX_ATTEMPTS,
+                    hedge_after=CHATTER_HEDGE_SECONDS or None,
+                    breaker=CircuitBreaker(failure_threshold=3, reset_timeout=15)
+                )
+    return chatter_client
+
+
+def get_local_analyzer_client():
+    """phi3 in JSON mode, for short analyses. Shares the chatter's breaker and concurrency."""
+    global local_analyzer_client
+    chatter = get_chatter_client()
+    if local_analyzer_client is None and chatter is not None:
+        with _init_lock:
+            if local_analyzer_client is None:
+                from langchain_ollama import ChatOllama
+                local_analyzer_client = AsyncLLMClient(
+                    f"{CHATTER_MODEL} (json)",
+                    ChatOllama(model=CHATTER_MODEL, format="json"),
+                    max_concurrency=CHATTER_CONCURRENCY,
+                    deadline=ANALYZER_TIMEOUT,
+                    max_attempts=LLM_MAX_ATTEMPTS,
+                    breaker=chatter.breaker,
+                    semaphore=chatter.semaphore
+                )
+    return local_analyzer_client
+
+
+def get_hosted_chatter_client():
+    global hosted_chatter_client
+    if hosted_chatter_client is None:
+        with _init_lock:
+            if hosted_chatter_client is None:
+                try:
+                    from langchain_google_genai import ChatGoogleGenerativeAI
+                    hosted_chatter_client = AsyncLLMClient(
+                        HOSTED_CHAT_MODEL,
+                        ChatGoogleGenerativeAI(
+                            model=HOSTED_CHAT_MODEL,
+                            google_api_key=os.environ.get('GEMINI_API_KEY'),
+                            convert_system_message_to_human=True
+                        ),
+                        max_concurrency=ANALYZER_CONCURRENCY,
+                        deadline=CHATTER_TIMEOUT,
+                        max_attempts=LLM_MAX_ATTEMPTS,
+                        breaker=CircuitBreaker(failure_threshold=5, reset_timeout=60)
+                    )
+                except Exception as e:
+                    print(f"CRITICAL: Error setting up {HOSTED_CHAT_MODEL}: {e}")
+    return hosted_chatter_client
+
+
+def llm_client_stats() -> dict:
+    clients = (analyzer_client, chatter_client, local_analyzer_client, hosted_chatter_client)
+    return {client.name: client.stats() for client in clients if client is not None}
+
+
+# --- Model routing ---
+def local_analysis_allowed(role) -> bool:
+    """False for roles whose analyses always run on the hosted model."""
+    return role != PREMIUM_ROLE
+
+
+def _prefer_for_analysis(role, prompt_tokens):
+    # Premium users always get the hosted model; short free analyses stay local
+    if not local_analysis_allowed(role) or prompt_tokens > LOCAL_ANALYSIS_MAX_TOKENS:
+        return HOSTED
+    return LOCAL
+
+
+def _prefer_for_chat(role, prompt_tokens):
+    if role == PREMIUM_ROLE and prompt_tokens > LOCAL_CHAT_MAX_TOKENS:
+        return HOSTED
+    return LOCAL
+
+
+router = ModelRouter(
+    targets={
+        "analysis": {
+            LOCAL: Target(CHATTER_MODEL, get_local_analyzer_client),
+            HOSTED: Target(ANALYZER_MODEL, get_analyzer_client, lambda: rate_limiter.p95_wait(ANALYZER_MODEL)),
+        },
+        "chat": {
+            LOCAL: Target(CHATTER_MODEL, get_chatter_client),
+            HOSTED: Target(HOSTED_CHAT_MODEL, get_hosted_chatter_client,
+                           lambda: rate_limiter.p95_wait(HOSTED_CHAT_MODEL)),
+        },
+    },
+    local_max_tokens={"analysis": LOCAL_ANALYSIS_MAX_TOKENS, "chat": LOCAL_CHAT_MAX_TOKENS},
+    # Free users never spend the analyzer's quota on chat
+    hosted_roles={"analysis": None, "chat": (PREMIUM_ROLE,)},
+    preferred={"analysis": _prefer_for_analysis, "chat": _prefer_for_chat}
+)
+
+
+def _routed_client(route):
+    client = router.client(route)
+    if not client:
+        raise Exception(f"LLM service ({route.model}) not initalised properly")
+    return client
+
+
+def _routed_invoke(route, messages) -> str:
+    client = _routed_client(route)
+    started = time.perf_counter()
+    try:
+        with rate_limiter.slot(route.model):   # No-op for the local model
+            response = client.invoke(messages)
+    except Exception:
+        router.record(route, started, ok=False)
+        raise
+    router.record(route, started, ok=True)
+    return response.content
 
 
-try:
-    llm_chatter = ChatOllama(model="phi3:mini")
-    # --- END OF LAG FIX ---
-    print("Ollama Phi-3 Mini (Chatter) model loaded.")
-except Exception as e:
-    print(f"CRITICAL: Failed to initialize Ollama: {e}")
-    print("Is the Ollama app running on your Mac?")
+def _routed_stream(route, messages):
+    client = _routed_client(route)
+    started = time.perf_counter()
+    ok = False
+    try:
+        with rate_limiter.slot(route.model):
+            for chunk in client.stream(messages):
+                text = _chunk_text(chunk)
+                if text:
+                    yield text
+        ok = True
+    finally:
+        router.record(route, started, ok=ok)
 
 
-# --- 6. ANALYSIS FUNCTION (Bugs Fixed) ---
-def llm_analysis(context: str, user_document: str) -> str:
+def _label_local(content: str, route) -> str:
     """
-    Calls the HIGH-ACCURACY model (GPT-4o) for the main analysis.
+    Marks an analysis made by the local model with {"model": ...}, so it is
+    cached apart from (and never served in place of) the hosted analyzer's.
     """
-    # --- 7. FIXED: Check for 'llm_analyzer' ---
-    if not llm_analyzer:
-        raise Exception("LLM service (Analyzer) not initalised properly")
-    
+    if route.target != LOCAL:
+        return content
+    try:
+        result = json.loads(content)
+    except ValueError:
+        return content   # Becomes a "raw" result, which is never shared anyway
+    if isinstance(result, dict):
+        result["model"] = route.model
+        return json.dumps(result)
+    return content
+
+
+# --- Prompt size metrics (per worker) ---
+_metrics_lock = threading.Lock()
+prompt_token_stats = {}
+
+
+def record_prompt_tokens(kind: str, **parts):
+    """Logs the token breakdown of one prompt and folds it into the running totals."""
+    total = sum(parts.values())
+    breakdown = " ".join(f"{name}={n}" for name, n in parts.items())
+    print(f"[Prompt] {kind}: {breakdown} total={total}")
+    with _metrics_lock:
+        stats = prompt_token_stats.setdefault(kind, {"requests": 0, "total_tokens": 0, "max_tokens": 0})
+        stats["requests"] += 1
+        stats["total_tokens"] += total
+        stats["max_tokens"] = max(stats["max_tokens"], total)
+        stats["mean_tokens"] = round(stats["total_tokens"] / stats["requests"], 1)
+    return total
+
+
+def warm_up() -> bool:
+    """Builds every LLM client ahead of the first request."""
+    ready = get_analyzer_client() is not None and get_chatter_client() is not None
+    get_local_analyzer_client()
+    get_hosted_chatter_client()
+    return ready
+
+
+def _chunk_text(chunk) -> str:
+    """Text of one streamed message chunk (Gemini may send a list of content parts)."""
+    content = chunk.content
+    if isinstance(content, list):
+        return "".join(part if isinstance(part, str) else part.get("text", "") for part in content)
+    return content or ""
+
+
+# --- 6. ANALYSIS FUNCTION (Bugs Fixed) ---
+def _analysis_messages(context: str, user_document: str) -> tuple:
     prompt = ANALYSIS_PROMPT_TEMPLATE.format(
         context = context,
         document = user_document
@@ -143,24 +439,67 @@ def llm_analysis(context: str, user_document: str) -> str:
         HumanMessage(content=prompt)
     ]
 
-    print("Sending prompt to GPT-4o analyzer...")
-    response = llm_analyzer.invoke(messages)
+    prompt_tokens = record_prompt_tokens(
+        "analysis",
+        system=count_tokens(SYSTEM_PROMPT),
+        context=count_tokens(context),
+        document=count_tokens(user_document),
+        template=count_tokens(ANALYSIS_PROMPT_TEMPLATE)
+    )
+    return messages, prompt_tokens
+
+
+def llm_analysis(context: str, user_document: str, role: str = None) -> str:
+    """
+    Runs the main analysis on the model the router picks: the HIGH-ACCURACY
+    hosted analyzer, or the local model for short prompts from free users.
+    """
+    messages, prompt_tokens = _analysis_messages(context, user_document)
+    route = router.route("analysis", prompt_tokens, role)
+
+    print(f"Sending prompt to {route.model} analyzer...")
+    # The raw JSON string
+    return _label_local(_routed_invoke(route, messages), route)
+
+def llm_merge_summaries(summaries: list) -> str:
+    """Reduce step of a map-reduce analysis: one summary from per-section summaries (raw JSON)."""
+    llm_analyzer = get_analyzer_client()
+    if not llm_analyzer:
+        raise Exception("LLM service (Analyzer) not initalised properly")
 
-    # response.content is the raw JSON string
+    joined = "\n\n".join(f"[Section {i}] {summary}" for i, summary in enumerate(summaries, 1))
+    prompt = MERGE_PROMPT_TEMPLATE.format(summaries=joined)
+    messages = [SystemMessage(content=SYSTEM_PROMPT), HumanMessage(content=prompt)]
+    record_prompt_tokens("analysis_merge", system=count_tokens(SYSTEM_PROMPT), prompt=count_tokens(prompt))
+
+    with rate_limiter.slot(ANALYZER_MODEL):
+        response = llm_analyzer.invoke(messages)
     return response.content
 
-# --- 8. CHAT FUNCTION (Bugs Fixed) ---
-def llm_chat(history: list, user_document: str) -> str:
+def llm_analysis_stream(context: str, user_document: str, role: str = None):
     """
-    Calls the FAST, LOCAL model (Llama 3) for the follow-up chat.
+    Same prompt as llm_analysis(), but yields the raw JSON text as it is generated.
+    A local analysis is short, and has to be labelled, so it arrives as one piece.
     """
-    if not llm_chatter:
-        raise Exception("LLM service (Chatter) not initalised properly")
+    messages, prompt_tokens = _analysis_messages(context, user_document)
+    route = router.route("analysis", prompt_tokens, role)
+    if route.target == LOCAL:
+        yield _label_local(_routed_invoke(route, messages), route)
+        return
+
+    print(f"Streaming prompt to {route.model} analyzer...")
+    yield from _routed_stream(route, messages)
+
 
+# --- 8. CHAT FUNCTION (Bugs Fixed) ---
+def _chat_messages(history: list, user_document: str, summary: str = None) -> tuple:
     messages = [
         SystemMessage(content=CHAT_SYSTEM_PROMPT),
         HumanMessage(content=f"Here is the original document we are discussing: <document>{user_document}</document>")
     ]
+    if summary:
+        # Older turns, folded by app/RAG/chat_history.py
+        messages.append(HumanMessage(content=f"Summary of our conversation so far: <summary>{summary}</summary>"))
     
     for msg in history:
         role = msg.get("role")
@@ -174,8 +513,46 @@ def llm_chat(history: list, user_document: str) -> str:
             # --- 9. FIXED: 'messages.append' ---
             messages.append(AIMessage(content=content))
      
-    print(f"Sending chat history to local Llama 3 chatter...")
-    # --- 10. FIXED: 'llm.invoke(messages)' ---
-    response = llm_chatter.invoke(messages)
+    prompt_tokens = record_prompt_tokens(
+        "chat",
+        system=count_tokens(CHAT_SYSTEM_PROMPT),
+        messages=sum(count_tokens(m.content) for m in messages[1:])
+    )
+    return messages, prompt_tokens
+
 
-    return response.content
\ No newline at end of file
+def llm_chat(history: list, user_document: str, summary: str = None, role: str = None) -> str:
+    """
+    Calls the FAST, LOCAL model for the follow-up chat (premium users' long
+    or slow chats may be routed to the hosted chat model).
+    """
+    messages, prompt_tokens = _chat_messages(history, user_document, summary)
+    route = router.route("chat", prompt_tokens, role)
+    print(f"Sending chat history to {route.model} chatter...")
+    return _routed_invoke(route, messages)
+
+
+def llm_chat_stream(history: list, user_document: str, summary: str = None, role: str = None):
+    """Same as llm_chat(), but yields the reply text as it is generated."""
+    messages, prompt_tokens = _chat_messages(history, user_document, summary)
+    route = router.route("chat", prompt_tokens, role)
+    print(f"Streaming chat history to {route.model} chatter...")
+    yield from _routed_stream(route, messages)
+
+
+def llm_summarize_chat(previous_summary: str, messages: list) -> str:
+    """Folds `messages` into the running conversation summary, using the local chatter."""
+    llm_chatter = get_chatter_client()
+    if not llm_chatter:
+        raise Exception("LLM service (Chatter) not initalised properly")
+
+    conversation = "\n".join(
+        f"{'User' if m.get('role') == 'user' else 'Lex'}: {m.get('content', '').strip()}" for m in messages
+    )
+    previous = f"Summary of the earlier part of the conversation:\n{previous_summary}\n\n" if previous_summary else ""
+    prompt = CHAT_SUMMARY_PROMPT.format(previous=previous, conversation=conversation)
+
+    record_prompt_tokens("chat_summary", prompt=count_tokens(prompt))
+    with rate_limiter.slot(CHATTER_MODEL):
+        response = llm_chatter.invoke([HumanMessage(content=prompt)])
+    return response.content
@@ -0,0 +1,118 @@
+"""
+Map-reduce analysis for documents too long for one analyzer call.
+
+map:    the document is split on the same legal separators as ingest into
+        sections of about SECTION_TOKENS tokens; every section gets its own
+        retrieval and analyzer call, run on a small thread pool (each call
+        still goes through the shared rate limiter).
+reduce: the section summaries are merged by one more analyzer call and the
+        red flags are concatenated in document order with duplicates removed.
+
+A failed section doesn't fail the analysis; it is reported in
+"sections_failed" and the remaining sections are still merged.
+"""
+import os
+import math
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .context_builder import count_tokens
+from .embedding_cache import normalize_text
+
+MAP_REDUCE_MIN_TOKENS = int(os.environ.get("LEX_MAP_REDUCE_TOKENS", 12000))
+SECTION_TOKENS = int(os.environ.get("LEX_SECTION_TOKENS", 3000))
+SECTION_OVERLAP_TOKENS = 100
+MAX_SECTIONS = 12           # Longer documents get proportionally larger sections
+MAP_WORKERS = int(os.environ.get("LEX_MAP_WORKERS", 4))
+DUPLICATE_LENGTH_RATIO = 0.8   # A clause containing another is the same flag only if barely longer
+
+
+def needs_map_reduce(document_text: str) -> bool:
+    return count_tokens(document_text) > MAP_REDUCE_MIN_TOKENS
+
+
+def split_sections(document_text: str) -> list[str]:
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    from .rag_service import LEGAL_SEPARATORS
+
+    section_tokens = max(SECTION_TOKENS, math.ceil(count_tokens(document_text) / MAX_SECTIONS))
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=section_tokens,
+        chunk_overlap=SECTION_OVERLAP_TOKENS,
+        length_function=count_tokens,
+        separators=LEGAL_SEPARATORS,
+        is_separator_regex=True,
+    )
+    return [s.strip() for s in splitter.split_text(document_text) if s.strip()]
+
+
+def map_sections(sections: list, analyze_section, workers: int = MAP_WORKERS):
+    """Yields (index, result, error) for each section as soon as its analysis finishes."""
+    with ThreadPoolExecutor(max_workers=min(workers, len(sections)), thread_name_prefix="lex-map") as pool:
+        futures = {pool.submit(analyze_section, section): i for i, section in enumerate(sections)}
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                yield index, future.result(), None
+            except Exception as e:
+                print(f"[MapReduce] Section {index + 1}/{len(sections)} failed: {e}")
+                yield index, None, e
+
+
+def _flag_key(flag: dict) -> str:
+    return normalize_text(flag.get("clause_text") or flag.get("clause") or "").lower()
+
+
+def _same_clause(a: str, b: str) -> bool:
+    shorter, longer = sorted((a, b), key=len)
+    return shorter == longer or (shorter in longer and len(shorter) >= DUPLICATE_LENGTH_RATIO * len(longer))
+
+
+def dedupe_red_flags(flags: list) -> list:
+    """
+    Drops flags whose clause text repeats an earlier flag's: the same text, or
+    one containing the other at nearly the same length (the overlap between
+    sections quotes a clause slightly differently). Flags without clause text
+    are always kept.
+    """
+    kept, keys = [], []
+    for flag in flags:
+        if not isinstance(flag, dict):
+            continue
+        key = _flag_key(flag)
+        if key and any(_same_clause(key, other) for other in keys):
+            continue
+        kept.append(flag)
+        if key:
+            keys.append(key)
+    return kept
+
+
+def reduce_results(results: list, merge_summaries) -> dict:
+    """
+    Combines per-section results (None for a failed section) into one analysis.
+    `merge_summaries(list of summaries) -> str` is only called for two or more.
+    """
+    succeeded = [(i, res) for i, res in enumerate(results) if isinstance(res, dict)]
+    if not succeeded:
+        raise ValueError("The analysis failed for every section of the document. Please try again.")
+
+    summaries = [res["summary"] for _, res in succeeded if res.get("summary")]
+    if len(summaries) > 1:
+        try:
+            summary = merge_summaries(summaries)
+        except Exception as e:
+            print(f"[MapReduce] Merge failed ({e}); joining section summaries.")
+            summary = None
+        summary = summary or "\n\n".join(summaries)
+    else:
+        summary = summaries[0] if summaries else ""
+
+    merged = {
+        "summary": summary,
+        "red_flags": dedupe_red_flags([flag for _, res in succeeded for flag in res.get("red_flags") or []]),
+        "sections_analyzed": len(results),
+    }
+    failed = [i + 1 for i, res in enumerate(results) if not isinstance(res, dict)]
+    if failed:
+        merged["sections_failed"] = failed
+    return merged
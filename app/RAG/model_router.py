@@ -0,0 +1,138 @@
+"""
+Chooses between the local (Ollama) and hosted (Gemini) model per request.
+
+Inputs: the prompt's token count, the user's role, each target's circuit
+breaker, and an estimate of how long a call would take right now:
+
+    p95 latency of recent calls * (1 + calls in flight / concurrency)
+    + p95 of recent rate-limiter waits (hosted quota)
+
+Policy, per request kind:
+    - a target is eligible if its client is up (breaker not open), the
+      prompt fits the local model's budget (local only) and the role is
+      allowed to use it (hosted only: the quota is paid for);
+    - the kind's preferred target is used unless it is ineligible, or it is
+      the local model and its estimate is more than SWITCH_FACTOR times the
+      hosted one's (the reverse swap would trade quality for speed, and a
+      slow hosted model is already paced by the rate limiter);
+    - with no eligible target the preferred one is used anyway, so the
+      caller gets the usual CircuitOpenError / timeout.
+
+Every decision is logged as one "[Router]" JSON line, and again with its
+latency once the call finishes; the last RECENT_DECISIONS are kept for
+/metrics so the thresholds can be tuned.
+"""
+import os
+import json
+import time
+import threading
+from collections import deque, Counter
+from typing import NamedTuple
+
+LOCAL, HOSTED = "local", "hosted"
+SWITCH_FACTOR = float(os.environ.get("LEX_ROUTER_SWITCH_FACTOR", 2.0))
+RECENT_DECISIONS = 100
+# Used until a target has latencies of its own
+PRIOR_LATENCY_SECONDS = {LOCAL: 10.0, HOSTED: 30.0}
+
+
+class Target(NamedTuple):
+    model: str
+    get_client: object          # () -> AsyncLLMClient or None
+    extra_wait: object = None   # () -> expected queueing seconds before the call (e.g. quota)
+
+
+class Route(NamedTuple):
+    kind: str
+    target: str
+    model: str
+    reason: str
+    estimates: dict
+
+
+class ModelRouter:
+    def __init__(self, targets: dict, local_max_tokens: dict, hosted_roles: dict, preferred: dict):
+        """
+        targets:          {kind: {"local": Target, "hosted": Target}}
+        local_max_tokens: {kind: largest prompt sent to the local model}
+        hosted_roles:     {kind: roles allowed on the hosted model, or None for everyone}
+        preferred:        {kind: (role, prompt_tokens) -> "local" | "hosted"}
+        """
+        self.targets = targets
+        self.local_max_tokens = local_max_tokens
+        self.hosted_roles = hosted_roles
+        self.preferred = preferred
+        self._lock = threading.Lock()
+        self.recent = deque(maxlen=RECENT_DECISIONS)
+        self.counts = Counter()
+
+    def estimate(self, name: str, target: Target):
+        """Expected seconds for a call right now, or None if the target is unavailable."""
+        client = target.get_client()
+        if client is None or client.breaker.state == "open":
+            return None
+        p95 = client.p95_latency() or PRIOR_LATENCY_SECONDS[name]
+        seconds = p95 * (1 + client.in_flight / max(client.max_concurrency, 1))
+        if target.extra_wait:
+            seconds += target.extra_wait()
+        return round(seconds, 3)
+
+    def route(self, kind: str, prompt_tokens: int, role: str = None) -> Route:
+        targets = self.targets[kind]
+        estimates = {name: self.estimate(name, target) for name, target in targets.items()}
+
+        eligible = {name for name, seconds in estimates.items() if seconds is not None}
+        if prompt_tokens > self.local_max_tokens[kind]:
+            eligible.discard(LOCAL)
+        allowed = self.hosted_roles.get(kind)
+        if allowed is not None and role not in allowed:
+            eligible.discard(HOSTED)
+
+        target = self.preferred[kind](role, prompt_tokens)
+        other = HOSTED if target == LOCAL else LOCAL
+        reason = "preferred"
+        if target not in eligible:
+            if other in eligible:
+                target, reason = other, "fallback"
+            else:
+                reason = "no_eligible_target"
+        elif target == LOCAL and other in eligible and estimates[target] > SWITCH_FACTOR * estimates[other]:
+            target, reason = other, "latency"
+
+        route = Route(kind, target, targets[target].model, reason, estimates)
+        print("[Router] " + json.dumps({
+            "event": "route", "kind": kind, "target": target, "model": route.model, "reason": reason,
+            "prompt_tokens": prompt_tokens, "role": role, "estimates_s": estimates,
+        }))
+        return route
+
+    def client(self, route: Route):
+        return self.targets[route.kind][route.target].get_client()
+
+    def record(self, route: Route, started: float, ok: bool):
+        """Logs the outcome of a routed call; `started` is its time.perf_counter()."""
+        latency = round(time.perf_counter() - started, 3)
+        print("[Router] " + json.dumps({
+            "event": "done", "kind": route.kind, "target": route.target, "model": route.model,
+            "reason": route.reason, "ok": ok, "latency_s": latency,
+        }))
+        with self._lock:
+            self.counts[(route.kind, route.target, route.reason)] += 1
+            self.recent.append({
+                "kind": route.kind, "target": route.target, "reason": route.reason,
+                "estimates_s": route.estimates, "latency_s": latency, "ok": ok, "at": time.time(),
+            })
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = dict(self.counts)
+            recent = list(self.recent)
+        decisions = {}
+        for (kind, target, reason), n in counts.items():
+            decisions.setdefault(kind, {}).setdefault(target, {})[reason] = n
+        return {
+            "decisions": decisions,
+            "recent": recent[-20:],
+            "local_max_tokens": self.local_max_tokens,
+            "switch_factor": SWITCH_FACTOR,
+        }
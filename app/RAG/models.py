@@ -1,9 +1,10 @@
-from typing import Annotated
-from pydantic import BaseModel, Field, ConfigDict
+from typing import Annotated, Optional
+from pydantic import BaseModel, Field, ConfigDict, AliasChoices
 from typing import Literal
 
 class RAGSchema(BaseModel):
     text: Annotated[str, Field(min_length=1)]
+    jurisdiction: Optional[Literal['central','state']] = None
     model_config = ConfigDict(str_strip_whitespace=True)
 
 class ChatMessage(BaseModel):
@@ -11,4 +12,20 @@ class ChatMessage(BaseModel):
     content:str
 
 class ChatSchema(BaseModel):
-    history: Annotated[list[ChatMessage], Field(min_items=1)]
\ No newline at end of file
+    history: Annotated[list[ChatMessage], Field(min_items=1)]
+
+# --- Analyzer output ---
+class RedFlag(BaseModel):
+    # The system prompt says "clause", the analysis template "clause_text"
+    clause_text: str = Field(validation_alias=AliasChoices('clause_text', 'clause'))
+    concern: str
+    context_source: str = 'General Concern'
+    model_config = ConfigDict(str_strip_whitespace=True)
+
+class AnalysisResult(BaseModel):
+    summary: str
+    red_flags: list[RedFlag] = []
+    # Set by the map-reduce path and the model router
+    sections_analyzed: Optional[int] = None
+    sections_failed: Optional[list[int]] = None
+    model: Optional[str] = None
@@ -1,46 +1,431 @@
 import os
-import chromadb
+import json
+import time
+import threading
+import numpy as np
 from dotenv import load_dotenv
-from sentence_transformers import SentenceTransformer
 from pathlib import Path
 
+from . import r, r_raw
+from .embedding_cache import EmbeddingCache
+from .embedding_backend import load_backend
+from .embedding_client import EmbeddingClient
+from .vector_index import FlatIndex
+from .section_index import SectionIndex
+from .retrieval_cache import RetrievalCache
+
 SCRIPT_DIR = Path(__file__).resolve().parent
 BACKEND_ROOT = SCRIPT_DIR.parent.parent
 CHROMA_PATH = BACKEND_ROOT/"chroma_db"
+FLAT_INDEX_PATH = CHROMA_PATH/"flat_index"
+SECTION_INDEX_PATH = CHROMA_PATH/"section_index.json"
+ACT_CATALOG_PATH = CHROMA_PATH/"act_catalog.json"
 
 COLLECTION_NAME = "legal_india_bge_m3"
 EMBEDDING_MODEL_NAME = "BAAI/bge-m3"
 LLM_MODEL = "gemini-2.5-pro"
 
+# "chroma" (default) or "flat" for the memory-mapped index exported by
+# `python -m app.RAG.vector_index`. Both expose the same query()/get() calls.
+VECTOR_BACKEND = os.environ.get("LEX_VECTOR_BACKEND", "chroma")
+# "torch" (fp32, default), "onnx" or "onnx-int8"; see app/RAG/embedding_backend.py
+EMBEDDING_BACKEND = os.environ.get("LEX_EMBEDDING_BACKEND", "torch")
+# When set, encode through the shared embedding worker (app/RAG/embedding_server.py)
+# instead of loading a model copy into this process.
+EMBEDDING_SOCKET = os.environ.get("LEX_EMBEDDING_SOCKET")
+
+# --- Multi-window retrieval settings ---
+# Same hierarchy of separators as data/ingest.py, so a window lines up with
+# the clause-sized chunks stored in the collection.
+LEGAL_SEPARATORS = [
+    r"\nCHAPTER [IVXLCDM]+\n",
+    r"\n\d{1,3}\.\s",
+    r"\n\(\d{1,2}\)\s",
+    r"\n\([a-z]\)\s",
+    "\n\n",
+    "\n",
+    " "
+]
+WINDOW_CHARS = 1500
+WINDOW_OVERLAP = 150
+MAX_WINDOWS = 32            # Hard cap on the encode batch for very long uploads
+RESULTS_PER_WINDOW = 5
+RRF_K = 60                  # Standard reciprocal-rank-fusion damping constant
+MMR_LAMBDA = 0.7            # 1.0 = pure relevance, 0.0 = pure diversity
+DUPLICATE_THRESHOLD = 0.95  # Cosine similarity above which two chunks are "the same"
+MAX_CITED_CHUNKS = 4        # Chunks pulled in by explicit "Section N of Act X" citations
+
+# Chunk metadata written by data/ingest.py that retrieval can be scoped by
+FILTER_FIELDS = ("jurisdiction", "act_title", "act_year", "source")
+JURISDICTIONS = ("central", "state")
+
+
+# Backends produce slightly different vectors, so they never share cache entries.
+# With LEX_EMBEDDING_SOCKET the namespace is switched to the server's backend on connect.
+embedding_cache = EmbeddingCache(r_raw, f"{EMBEDDING_MODEL_NAME}:{EMBEDDING_BACKEND}")
+retrieval_cache = RetrievalCache(r, COLLECTION_NAME)
+
+# --- Lazy initialisation ---
+# Nothing heavy (torch, bge-m3, Chroma) is loaded at import time. Each resource
+# is created on first use, or up front by warm_up(). `readiness` tracks the
+# state of each one for the /health/ready probe.
+_init_lock = threading.RLock()
+_embedding_model = None
+_collection = None
+_section_index = None
+_window_splitter = None
+_act_catalog = None
+readiness = {"embedding_model": "not_loaded", "vector_store": "not_loaded"}
+
+
+def get_embedding_model():
+    global _embedding_model
+    if _embedding_model is None:
+        with _init_lock:
+            if _embedding_model is None:
+                readiness["embedding_model"] = "loading"
+                try:
+                    if EMBEDDING_SOCKET:
+                        client = EmbeddingClient(EMBEDDING_SOCKET)
+                        backend = client.backend()
+                        embedding_cache.model_name = f"{EMBEDDING_MODEL_NAME}:{backend}"
+                        _embedding_model = client
+                        print(f"Using shared embedding server at {EMBEDDING_SOCKET} ({backend})")
+                    else:
+                        _embedding_model = load_backend(EMBEDDING_BACKEND, EMBEDDING_MODEL_NAME)
+                        print(f"Succesfully imported embdding model ({EMBEDDING_BACKEND})")
+                    readiness["embedding_model"] = "ready"
+                except Exception as e:
+                    readiness["embedding_model"] = "failed"
+                    print(f"Error in importing embedding model: {e}")
+                    raise
+    return _embedding_model
+
+
+def get_collection():
+    global _collection
+    if _collection is None:
+        with _init_lock:
+            if _collection is None:
+                readiness["vector_store"] = "loading"
+                try:
+                    if VECTOR_BACKEND == "flat":
+                        _collection = FlatIndex(FLAT_INDEX_PATH)
+                        print(f"Successfully loaded flat index ({_collection.dtype}, {len(_collection)} rows)")
+                    else:
+                        import chromadb
+                        db = chromadb.PersistentClient(path = str(CHROMA_PATH))
+                        _collection = db.get_collection(name = COLLECTION_NAME)
+                        print("Successfully conencted to Chromadb")
+                    readiness["vector_store"] = "ready"
+                except Exception as e:
+                    readiness["vector_store"] = "failed"
+                    print(f"Error in connecting to vector db: {e}")
+                    raise
+    return _collection
+
+
+def get_section_index():
+    global _section_index
+    if _section_index is None:
+        with _init_lock:
+            if _section_index is None:
+                _section_index = SectionIndex.load(SECTION_INDEX_PATH)
+    return _section_index
+
+
+def get_window_splitter():
+    global _window_splitter
+    if _window_splitter is None:
+        with _init_lock:
+            if _window_splitter is None:
+                from langchain_text_splitters import RecursiveCharacterTextSplitter
+                _window_splitter = RecursiveCharacterTextSplitter(
+                    chunk_size=WINDOW_CHARS,
+                    chunk_overlap=WINDOW_OVERLAP,
+                    separators=LEGAL_SEPARATORS,
+                    is_separator_regex=True,
+                )
+    return _window_splitter
+
+
+def get_act_catalog() -> dict:
+    """{pdf filename: {"title", "year", "jurisdiction", "url"}} written by data/ingest.py."""
+    global _act_catalog
+    if _act_catalog is None:
+        with _init_lock:
+            if _act_catalog is None:
+                try:
+                    with open(ACT_CATALOG_PATH) as f:
+                        _act_catalog = json.load(f)
+                except FileNotFoundError:
+                    print(f"WARNING: {ACT_CATALOG_PATH} not found. Re-run data/ingest.py.")
+                    _act_catalog = {}
+    return _act_catalog
+
+
+def embedding_server_stats():
+    """Queue depth / batch-size statistics of the shared embedding worker, if in use."""
+    if not EMBEDDING_SOCKET:
+        return None
+    try:
+        return get_embedding_model().stats()
+    except Exception as e:
+        return {"error": str(e)}
+
+
+def is_ready() -> bool:
+    return all(state == "ready" for state in readiness.values())
+
+
+def warm_up() -> bool:
+    """
+    Loads every lazy resource and runs one dummy encode so the first real
+    request doesn't pay for model load or first-call kernel setup.
+    Safe to call from a background thread; returns the final readiness.
+    """
+    start = time.perf_counter()
+    try:
+        get_section_index()
+        get_window_splitter()
+        get_collection()
+        get_embedding_model().encode(["warm up"], normalize_embeddings = True)
+    except Exception as e:
+        print(f"[WarmUp] Failed: {e}")
+        return False
+    print(f"[WarmUp] RAG resources ready in {time.perf_counter() - start:.1f}s")
+    return is_ready()
+
+
+def embed(texts):
+    """Cached, normalised embeddings for a string or a list of strings."""
+    if EMBEDDING_SOCKET:
+        get_embedding_model()   # Cheap; fixes the cache namespace to the server's backend
+    return embedding_cache.encode(
+        texts,
+        lambda batch: get_embedding_model().encode(batch, normalize_embeddings = True)
+    )
+
+
+def build_where(filters: dict = None):
+    """
+    Equality filters ({"jurisdiction": "central", "act_year": 1882}) as a
+    Chroma `where` clause, or None when unscoped. Unknown fields and empty
+    values are ignored.
+    """
+    conditions = [
+        {field: value}
+        for field, value in sorted((filters or {}).items())
+        if field in FILTER_FIELDS and value not in (None, "")
+    ]
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
 
-try:
-    embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME,device = "cpu")
-    print("Succesfully imported embdding model")
-except Exception as e:
-    embedding_model = None
-    print(f"Error in importing embedding model: {e}")
 
-try:
-    db = chromadb.PersistentClient(path = str(CHROMA_PATH))
-    collection = db.get_collection(name = COLLECTION_NAME)
-    print("Successfully conencted to Chromadb")
-except Exception as e:
-    print(f"Error in connecting to vector db: {e}")
+def _matches(metadata: dict, where) -> bool:
+    conditions = where.get("$and", [where]) if where else []
+    return all((metadata or {}).get(k) == v for condition in conditions for k, v in condition.items())
 
 
-def retrieve(query: str):
+def _cache_kind(kind: str, where) -> str:
+    # Scoped and unscoped queries must never share a cache entry
+    return f"{kind}:{json.dumps(where, sort_keys=True)}" if where else kind
+
+
+def resolve_citations(text: str, limit: int = MAX_CITED_CHUNKS, where = None):
+    """
+    Chunks for explicit statute citations in `text`, fetched by id.
+    No embedding or vector search is involved.
+    Returns a single-query result dict (possibly empty).
+    """
+    ids = get_section_index().lookup(text, limit=limit)
+    if not ids:
+        return {"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]]}
+
+    found = get_collection().get(ids = ids, include = ["documents", "metadatas"])
+    by_id = {
+        chunk_id: (doc, meta)
+        for chunk_id, doc, meta in zip(found["ids"], found["documents"], found["metadatas"])
+        if _matches(meta, where)
+    }
+    ids = [i for i in ids if i in by_id]   # Keep citation order; drop stale or out-of-scope ids
+    print(f"[Retrieve] {len(ids)} chunk(s) resolved from statute citations")
+    return {
+        "ids": [ids],
+        "documents": [[by_id[i][0] for i in ids]],
+        "metadatas": [[by_id[i][1] for i in ids]],
+        "distances": [[0.0] * len(ids)],
+    }
+
+
+def _prepend_results(first, rest, n_results: int):
+    """Concatenates two single-query results, skipping ids already in `first`."""
+    seen = set(first["ids"][0])
+    merged = {key: list(first[key][0]) for key in ("ids", "documents", "metadatas", "distances")}
+    for i, chunk_id in enumerate(rest["ids"][0]):
+        if len(merged["ids"]) >= n_results:
+            break
+        if chunk_id in seen:
+            continue
+        for key in merged:
+            merged[key].append(rest[key][0][i])
+    return {key: [values[:n_results]] for key, values in merged.items()}
+
+
+def retrieve(query: str, n_results: int = 3, filters: dict = None):
+    """
+    Top-n chunks for `query`. `filters` (see build_where) scopes the search,
+    e.g. {"jurisdiction": "central"}; the flat index then scans only that
+    partition of the matrix.
+    """
+    where = build_where(filters)
+    return retrieval_cache.cached(
+        _cache_kind("single", where), query, n_results, lambda: _retrieve(query, n_results, where)
+    )
+
+
+def _retrieve(query: str, n_results: int, where = None):
+    cited = resolve_citations(query, limit=n_results, where=where)
+    if len(cited["ids"][0]) >= n_results:
+        # Every slot filled by exact citations: skip the encode and the search
+        return cited
+
     try:
-        query_embedding = embedding_model.encode(query,normalize_embeddings = True)
+        query_embedding = embed(query)
 
-        results = collection.query(
+        query_args = {"where": where} if where else {}
+        results = get_collection().query(
         query_embeddings = [query_embedding.tolist()],
-        n_results = 3
+        n_results = n_results,
+        **query_args
         )
     except Exception as e:
         print(f"Error in retrieval: {e}")
-    
-    return results
+        raise
+
+    return _prepend_results(cited, results, n_results)
+
+
+def split_into_windows(document: str) -> list[str]:
+    """
+    Splits a long document into clause-sized windows.
+    If there are more than MAX_WINDOWS, an evenly spaced sample is kept so the
+    whole document (not just its first pages) is still represented.
+    """
+    windows = [w.strip() for w in get_window_splitter().split_text(document) if w.strip()]
+    if len(windows) > MAX_WINDOWS:
+        picks = np.linspace(0, len(windows) - 1, MAX_WINDOWS).round().astype(int)
+        windows = [windows[i] for i in np.unique(picks)]
+    return windows
+
+
+def _reciprocal_rank_fusion(results) -> dict:
+    """
+    Merges the per-window rankings of a multi-embedding query.
+    Returns {chunk_id: (score, document, metadata, embedding)}.
+    """
+    fused = {}
+    for q in range(len(results["ids"])):
+        for rank, chunk_id in enumerate(results["ids"][q]):
+            score = 1.0 / (RRF_K + rank + 1)
+            if chunk_id in fused:
+                fused[chunk_id][0] += score
+            else:
+                fused[chunk_id] = [
+                    score,
+                    results["documents"][q][rank],
+                    results["metadatas"][q][rank],
+                    results["embeddings"][q][rank],
+                ]
+    return fused
+
+
+def _mmr_select(embeddings: np.ndarray, relevance: np.ndarray, k: int) -> list[int]:
+    """
+    Greedy maximal-marginal-relevance selection.
+    The pairwise similarity matrix is computed once; each step only updates
+    the running "closest already-selected chunk" vector.
+    Candidates that are near-duplicates of a selected chunk are dropped.
+    """
+    n = len(relevance)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    unit = embeddings / np.maximum(norms, 1e-12)
+    sim = unit @ unit.T
+
+    rel = relevance / relevance.max() if relevance.max() > 0 else relevance
+    max_sim = np.zeros(n, dtype=np.float32)
+    available = np.ones(n, dtype=bool)
+    selected = []
+
+    while len(selected) < k and available.any():
+        scores = MMR_LAMBDA * rel - (1 - MMR_LAMBDA) * max_sim
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        max_sim = np.maximum(max_sim, sim[:, best])
+        available &= max_sim < DUPLICATE_THRESHOLD
+
+    return selected
+
+
+def retrieve_windows(document: str, n_results: int = 8, filters: dict = None):
+    """
+    Retrieval for long documents.
+    Every window is encoded in ONE batched forward pass and sent in ONE
+    multi-embedding Chroma query; the rankings are fused with RRF and
+    near-duplicates removed with MMR.
+    Returns the same shape as a single Chroma query result.
+    """
+    where = build_where(filters)
+    return retrieval_cache.cached(
+        _cache_kind("windows", where), document, n_results, lambda: _retrieve_windows(document, n_results, where)
+    )
+
+
+def _retrieve_windows(document: str, n_results: int, where = None):
+    windows = split_into_windows(document)
+    if len(windows) <= 1:
+        return _retrieve(document, n_results, where)
+
+    cited = resolve_citations(document, limit=min(MAX_CITED_CHUNKS, n_results), where=where)
+
+    try:
+        window_embeddings = embed(windows)
+
+        query_args = {"where": where} if where else {}
+        results = get_collection().query(
+            query_embeddings = window_embeddings.tolist(),
+            n_results = RESULTS_PER_WINDOW,
+            include = ["documents", "metadatas", "distances", "embeddings"],
+            **query_args
+        )
+    except Exception as e:
+        print(f"Error in multi-window retrieval: {e}")
+        raise
 
+    fused = _reciprocal_rank_fusion(results)
+    ids = list(fused.keys())
+    if not ids:
+        return cited   # Nothing in the requested partition
+    relevance = np.array([fused[i][0] for i in ids], dtype=np.float32)
+    embeddings = np.asarray([fused[i][3] for i in ids], dtype=np.float32)
 
+    picks = _mmr_select(embeddings, relevance, n_results)
+    print(f"[Retrieve] {len(windows)} windows -> {len(ids)} candidates -> {len(picks)} chunks")
 
+    # Distance is reported against the mean of the window embeddings so the
+    # numbers stay comparable with a single-query cosine distance.
+    centroid = window_embeddings.mean(axis=0)
+    centroid /= max(np.linalg.norm(centroid), 1e-12)
+    chosen = embeddings[picks]
+    distances = 1.0 - (chosen / np.linalg.norm(chosen, axis=1, keepdims=True)) @ centroid
 
+    dense = {
+        "ids": [[ids[i] for i in picks]],
+        "documents": [[fused[ids[i]][1] for i in picks]],
+        "metadatas": [[fused[ids[i]][2] for i in picks]],
+        "distances": [distances.tolist()],
+    }
+    return _prepend_results(cited, dense, n_results)
@@ -0,0 +1,221 @@
+"""
+Distributed, adaptive rate limiter for upstream LLM APIs.
+
+One token bucket per model lives in a Redis hash (tokens, ts, rate), so every
+worker process shares the same quota. acquire() runs a Lua script that
+refills the bucket and *reserves* a token atomically; the bucket may go
+negative, and the script returns how long the caller must wait for its
+reservation to mature. The caller then sleeps without holding any lock, so
+other requests (and other models) are never serialised behind it.
+
+The refill rate adapts AIMD-style: a 429 / quota error halves it (down to
+min_rate), every success adds `step` back (up to max_rate).
+
+Models without an entry in the limits table (e.g. the local Ollama chatter)
+are not limited at all.
+"""
+import os
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+KEY_PREFIX = "lex:ratelimit:"
+BUCKET_TTL_SECONDS = 3600
+MAX_WAIT_SECONDS = float(os.environ.get("LEX_RATE_LIMIT_MAX_WAIT", 120))
+DECREASE_FACTOR = 0.5
+RECENT_WAITS = 512          # Per-model window for the wait-time percentiles
+
+# Refill, then reserve one token. Returns {granted, wait seconds, current rate}.
+# Floats are returned as strings: Lua numbers are truncated to integers on the way out.
+_ACQUIRE_LUA = """
+local default_rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local max_wait = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts', 'rate')
+local rate = tonumber(state[3]) or default_rate
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+
+local wait = 0
+if tokens < 1 then
+    wait = (1 - tokens) / rate
+end
+local granted = 0
+if wait <= max_wait then
+    tokens = tokens - 1
+    granted = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now), 'rate', tostring(rate))
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return {granted, tostring(wait), tostring(rate)}
+"""
+
+# AIMD step. ARGV: op ("decrease" | "increase"), default, min, max, step, factor
+_ADJUST_LUA = """
+local rate = tonumber(redis.call('HGET', KEYS[1], 'rate')) or tonumber(ARGV[2])
+if ARGV[1] == 'decrease' then
+    rate = math.max(tonumber(ARGV[3]), rate * tonumber(ARGV[6]))
+    -- Drop any saved-up burst: the upstream has just told us we are over quota
+    local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens')) or 0
+    redis.call('HSET', KEYS[1], 'tokens', tostring(math.min(tokens, 0)))
+else
+    rate = math.min(tonumber(ARGV[4]), rate + tonumber(ARGV[5]))
+end
+redis.call('HSET', KEYS[1], 'rate', tostring(rate))
+return tostring(rate)
+"""
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a reservation would have to wait longer than max_wait."""
+
+
+def is_quota_error(error: Exception) -> bool:
+    """True for HTTP 429 / ResourceExhausted / quota errors from the LLM SDKs."""
+    text = f"{type(error).__name__} {error}".lower()
+    return "429" in text or "resourceexhausted" in text or "quota" in text or "rate limit" in text
+
+
+class ModelLimit:
+    """Bucket settings for one model; rates are in requests per minute."""
+
+    def __init__(self, per_minute: float, burst: int = 1, min_per_minute: float = None, max_per_minute: float = None):
+        self.rate = per_minute / 60.0
+        self.capacity = burst
+        self.min_rate = (min_per_minute or per_minute / 8) / 60.0
+        self.max_rate = (max_per_minute or per_minute) / 60.0
+        self.step = self.max_rate / 10   # Ten clean calls to recover from one halving at full rate
+
+
+class RateLimiter:
+    def __init__(self, redis_client, limits: dict, max_wait: float = MAX_WAIT_SECONDS):
+        self.redis = redis_client
+        self.limits = limits
+        self.max_wait = max_wait
+        self._acquire = redis_client.register_script(_ACQUIRE_LUA)
+        self._adjust = redis_client.register_script(_ADJUST_LUA)
+        self._lock = threading.Lock()   # Guards the counters only; never held while waiting
+        self.counters = {}
+        self.waits = {}
+
+    def _model_counters(self, model):
+        if model not in self.counters:
+            self.counters[model] = {
+                "acquired": 0, "waited": 0, "rejected": 0, "throttled": 0, "errors": 0,
+                "total_wait_s": 0.0, "max_wait_s": 0.0,
+            }
+            self.waits[model] = deque(maxlen=RECENT_WAITS)
+        return self.counters[model]
+
+    def _count(self, model, name):
+        with self._lock:
+            self._model_counters(model)[name] += 1
+
+    def acquire(self, model: str) -> float:
+        """
+        Blocks until a call to `model` is allowed; returns the seconds waited.
+        Raises RateLimitExceeded if the wait would exceed max_wait.
+        """
+        limit = self.limits.get(model)
+        if limit is None:
+            return 0.0
+
+        try:
+            granted, wait, rate = self._acquire(
+                keys=[KEY_PREFIX + model],
+                args=[limit.rate, limit.capacity, self.max_wait, BUCKET_TTL_SECONDS]
+            )
+        except Exception as e:
+            # Fail open: a Redis outage shouldn't take analysis down with it
+            print(f"[RateLimiter] Redis error for {model}, not limiting: {e}")
+            self._count(model, "errors")
+            return 0.0
+
+        wait = float(wait)
+        if not int(granted):
+            self._count(model, "rejected")
+            raise RateLimitExceeded(
+                f"{model} is over its request quota; try again in about {wait:.0f}s."
+            )
+
+        if wait > 0:
+            print(f"[RateLimiter] {model}: sleeping {wait:.2f}s (rate {float(rate) * 60:.2f}/min)")
+            time.sleep(wait)
+
+        with self._lock:
+            c = self._model_counters(model)
+            c["acquired"] += 1
+            c["waited"] += wait > 0
+            c["total_wait_s"] += wait
+            c["max_wait_s"] = max(c["max_wait_s"], wait)
+            self.waits[model].append(wait)
+        return wait
+
+    def _adjust_rate(self, model, op):
+        limit = self.limits.get(model)
+        if limit is None:
+            return
+        try:
+            rate = float(self._adjust(
+                keys=[KEY_PREFIX + model],
+                args=[op, limit.rate, limit.min_rate, limit.max_rate, limit.step, DECREASE_FACTOR]
+            ))
+        except Exception as e:
+            print(f"[RateLimiter] Could not adjust {model} rate: {e}")
+            self._count(model, "errors")
+            return
+        if op == "decrease":
+            print(f"[RateLimiter] {model} throttled upstream; rate cut to {rate * 60:.2f}/min")
+
+    def record_success(self, model: str):
+        self._adjust_rate(model, "increase")
+
+    def record_throttle(self, model: str):
+        self._count(model, "throttled")
+        self._adjust_rate(model, "decrease")
+
+    @contextmanager
+    def slot(self, model: str):
+        """acquire() before the block; feed the outcome back into the AIMD rate."""
+        self.acquire(model)
+        try:
+            yield
+        except Exception as e:
+            if is_quota_error(e):
+                self.record_throttle(model)
+            raise
+        else:
+            self.record_success(model)
+
+    def p95_wait(self, model: str) -> float:
+        """p95 of this worker's recent waits for `model`, in seconds (0 for unlimited models)."""
+        with self._lock:
+            waits = list(self.waits.get(model) or ())
+        return float(np.percentile(waits, 95)) if waits else 0.0
+
+    def stats(self) -> dict:
+        models = {}
+        with self._lock:
+            snapshot = {model: (dict(c), list(self.waits[model])) for model, c in self.counters.items()}
+        for model, (c, waits) in snapshot.items():
+            acquired = c["acquired"] or 1
+            entry = {
+                **c,
+                "mean_wait_s": round(c["total_wait_s"] / acquired, 3),
+                "p50_wait_s": round(float(np.percentile(waits, 50)), 3) if waits else 0.0,
+                "p95_wait_s": round(float(np.percentile(waits, 95)), 3) if waits else 0.0,
+            }
+            try:
+                rate = self.redis.hget(KEY_PREFIX + model, "rate")
+                entry["current_rate_per_min"] = round(float(rate) * 60, 3) if rate else None
+            except Exception:
+                entry["current_rate_per_min"] = None
+            models[model] = entry
+        return models
@@ -0,0 +1,99 @@
+import json
+import threading
+
+import xxhash
+
+from .embedding_cache import normalize_text
+
+RESULT_TTL_SECONDS = 24 * 3600
+RESULT_PREFIX = "lex:retr:"
+# Bumped by data/ingest.py (and the flat-index export) whenever the corpus changes
+VERSION_KEY_FORMAT = "lex:index:version:{collection}"
+
+
+def version_key(collection_name: str) -> str:
+    return VERSION_KEY_FORMAT.format(collection=collection_name)
+
+
+def bump_index_version(redis_client, collection_name: str) -> int:
+    """Invalidates every cached retrieval result for the collection."""
+    return redis_client.incr(version_key(collection_name))
+
+
+class RetrievalCache:
+    """
+    Redis cache of query -> top-k result (ids, documents, metadatas, distances).
+
+    Every entry is stamped with the collection version it was computed
+    against. A lookup reads the current version and the entry in ONE
+    pipelined round trip; an entry from an older version counts as a miss.
+    """
+
+    def __init__(self, redis_client, collection_name: str, ttl: int = RESULT_TTL_SECONDS):
+        self.redis = redis_client
+        self.collection_name = collection_name
+        self.version_key = version_key(collection_name)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "stale": 0, "errors": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def key(self, kind: str, text: str, n_results: int) -> str:
+        digest = xxhash.xxh3_128_hexdigest(
+            f"{self.collection_name}\0{kind}\0{n_results}\0{normalize_text(text)}".encode("utf-8")
+        )
+        return f"{RESULT_PREFIX}{digest}"
+
+    def get(self, key: str):
+        """Returns (result or None, current collection version)."""
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.get(self.version_key)
+            pipe.get(key)
+            version, raw = pipe.execute()
+        except Exception as e:
+            print(f"[RetrievalCache] Redis read failed: {e}")
+            self._count("errors")
+            return None, None
+
+        version = str(version or 0)
+        if raw:
+            entry = json.loads(raw)
+            if entry.get("version") == version:
+                self._count("hits")
+                return entry["result"], version
+            self._count("stale")
+        self._count("misses")
+        return None, version
+
+    def put(self, key: str, version, result: dict):
+        # Stamp with the version read *before* the search, so a re-index that
+        # lands mid-query leaves this entry already stale.
+        if version is None:
+            return
+        try:
+            self.redis.set(key, json.dumps({"version": version, "result": result}), ex=self.ttl)
+        except Exception as e:
+            print(f"[RetrievalCache] Redis write failed: {e}")
+            self._count("errors")
+
+    def cached(self, kind: str, text: str, n_results: int, compute):
+        """Returns the cached result for (kind, text, n_results) or computes and stores it."""
+        key = self.key(kind, text, n_results)
+        result, version = self.get(key)
+        if result is not None:
+            return result
+        result = compute()
+        self.put(key, version, result)
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.counters["hits"] + self.counters["misses"]
+            return {
+                **self.counters,
+                "hit_rate": round(self.counters["hits"] / lookups, 4) if lookups else 0.0,
+            }
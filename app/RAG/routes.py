@@ -1,107 +1,138 @@
-from flask import request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask import request, jsonify, Response, stream_with_context, current_app, url_for
+from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
 from pydantic import ValidationError
-import time, threading, json
-from datetime import datetime
+import json
 
-from . import RAG_bp, r
+from app import local_cache
+from app.auth.models import User
+from . import RAG_bp
 from .models import RAGSchema, ChatSchema
-from .services import perform_legal_analysis, extract_text_from_upload
-from .llm_service import llm_chat
-
-# === GLOBAL RATE LIMIT CONTROL ===
-MAX_CALLS_PER_MIN = 2
-INTERVAL = 60 / MAX_CALLS_PER_MIN
-last_call_time = 0
-lock = threading.Lock()
-
-def wait_for_slot():
-    """Ensures we don’t exceed the Gemini free-tier limit."""
-    global last_call_time
-    with lock:
-        now = time.time()
-        elapsed = now - last_call_time
-        if elapsed < INTERVAL:
-            wait_time = INTERVAL - elapsed
-            print(f"[RateLimiter] Sleeping {wait_time:.2f}s to respect quota...")
-            time.sleep(wait_time)
-        last_call_time = time.time()
-
-
-# === Helper functions for Redis ===
-
-def get_user_cache(user_id):
-    key = f"lex:user:{user_id}"
-    data = r.get(key)
-    if data:
-        return json.loads(data)
-    # Default structure
-    return {"chat_history": [], "analysis_result": None, "document_text": None, "timestamp": None}
-
-
-def update_user_cache(user_id, cache_data):
-    key = f"lex:user:{user_id}"
-    cache_data["timestamp"] = datetime.now().timestamp()
-    r.set(key, json.dumps(cache_data))
-    r.expire(key, 86400)  # 24-hour expiry
+from .services import perform_legal_analysis, stream_legal_analysis, extract_text_from_upload, parse_analysis_result
+from .user_cache import (
+    get_user_cache, save_chat, cached_analysis, store_analysis, load_analysis, reopen_analysis,
+    analysis_cache, answer_cache, workspace
+)
+from .llm_service import llm_chat, llm_chat_stream, llm_summarize_chat
+from .chat_history import compact_history
+from .rate_limiter import RateLimitExceeded
+from .llm_client import CircuitOpenError, LLMTimeout
+from . import rag_service, llm_service, jobs
+
+
+def parse_analysis_request():
+    """
+    Validates an /analyze body (PDF upload or JSON text) without extracting anything.
+    Returns ({"file" or "text", "jurisdiction"}, None) or (None, error response).
+    """
+    if 'document' in request.files:
+        file = request.files['document']
+        if not file or file.filename == '':
+            return None, (jsonify({"error": "No file selected"}), 400)
+        if file.content_type != 'application/pdf':
+            return None, (jsonify({"error": "Invalid file type. Upload a PDF."}), 400)
+        jurisdiction = request.form.get("jurisdiction") or None
+        if jurisdiction and jurisdiction not in rag_service.JURISDICTIONS:
+            return None, (jsonify({"error": "Invalid jurisdiction. Use 'central' or 'state'."}), 400)
+        return {"file": file, "jurisdiction": jurisdiction}, None
+    if request.is_json:
+        try:
+            validated_data = RAGSchema(**request.get_json())
+        except ValidationError as e:
+            return None, (jsonify({"error": "Invalid text input", "details": e.errors()}), 422)
+        return {"text": validated_data.text, "jurisdiction": validated_data.jurisdiction}, None
+    return None, (jsonify({"error": "No document text or PDF file provided."}), 400)
+
+
+def answer_cache_key(user_cache, chat_history):
+    """
+    (analysis hash, conversation context, question, question embedding) for
+    the semantic answer cache, or None when it doesn't apply (no shared
+    analysis, or the last message isn't a user question). The context covers
+    the earlier turns and the rolling summary, so an answer is only reused
+    for the same conversation (or for a first question).
+    """
+    analysis_hash = user_cache.get("analysis_hash")
+    if not analysis_hash or not chat_history or chat_history[-1].get("role") != "user":
+        return None
+    question = chat_history[-1].get("content", "").strip()
+    if not question:
+        return None
+    summary = (user_cache.get("chat_summary") or {}).get("text") if len(chat_history) > 1 else None
+    context = answer_cache.context_digest(chat_history[:-1], summary)
+    try:
+        return analysis_hash, context, question, rag_service.embed(question)
+    except Exception as e:
+        print(f"[AnswerCache] Could not embed the question, skipping the cache: {e}")
+        return None
+
+
+def sse(event: str, data) -> str:
+    """One server-sent event frame."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def sse_response(events):
+    return Response(
+        stream_with_context(events),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}   # No proxy buffering
+    )
 
 
 # --- MAIN RAG ANALYSIS ENDPOINT ---
 @RAG_bp.route('/analyze', methods=['POST'])
 @jwt_required()
 def analyze_document():
-    """Hybrid endpoint: can analyze either uploaded PDF or pasted text."""
+    """
+    Hybrid endpoint: can analyze either uploaded PDF or pasted text.
+    With ?mode=async (or ANALYZE_ASYNC on) the work is queued instead and the
+    response is 202 with a job id to poll at /analyze/jobs/<job_id>.
+    """
     try:
         current_user_id = get_jwt_identity()
         user_cache = get_user_cache(current_user_id)
-        document_text = None
 
         # --- 1️⃣ Input parsing ---
-        if 'document' in request.files:
-            file = request.files['document']
-            if not file or file.filename == '':
-                return jsonify({"error": "No file selected"}), 400
-            if file.content_type != 'application/pdf':
-                return jsonify({"error": "Invalid file type. Upload a PDF."}), 400
-            document_text = extract_text_from_upload(file)
-        elif request.is_json:
-            data = request.get_json()
-            try:
-                validated_data = RAGSchema(**data)
-                document_text = validated_data.text
-            except ValidationError as e:
-                return jsonify({"error": "Invalid text input", "details": e.errors()}), 422
-        else:
-            return jsonify({"error": "No document text or PDF file provided."}), 400
+        parsed, error = parse_analysis_request()
+        if error:
+            return error
+        jurisdiction = parsed["jurisdiction"]
+
+        mode = request.args.get("mode") or ("async" if current_app.config.get("ANALYZE_ASYNC") else "sync")
+        if mode == "async":
+            return enqueue_analysis(current_user_id, user_cache, parsed)
+
+        document_text = parsed.get("text") or extract_text_from_upload(parsed["file"])
 
         # --- 2️⃣ Check Redis Cache ---
-        if user_cache.get("document_text") == document_text and user_cache.get("analysis_result"):
+        cached = cached_analysis(current_user_id, user_cache, document_text, jurisdiction, get_jwt().get("role"))
+        if cached:
             print("[Analyze] Returning cached analysis result.")
-            return jsonify(user_cache["analysis_result"]), 200
+            return jsonify(cached), 200
 
-        # --- 3️⃣ Apply rate limiting BEFORE LLM call ---
-        wait_for_slot()
+        # --- 3️⃣ Rate limiting happens inside llm_service (shared Redis bucket per model) ---
 
         # --- 4️⃣ Perform legal analysis ---
         analysis_result = perform_legal_analysis(
             document_text=document_text,
-            user_id=current_user_id
+            user_id=current_user_id,
+            jurisdiction=jurisdiction
         )
 
-        if isinstance(analysis_result, str):
-            try:
-                analysis_result = json.loads(analysis_result)
-            except json.JSONDecodeError:
-                analysis_result = {"summary": "Error decoding analysis", "raw": analysis_result}
+        analysis_result = parse_analysis_result(analysis_result)
 
         # --- 5️⃣ Cache result ---
-        user_cache["document_text"] = document_text
-        user_cache["analysis_result"] = analysis_result
-        update_user_cache(current_user_id, user_cache)
+        store_analysis(current_user_id, user_cache, document_text, jurisdiction, analysis_result)
 
         print("[Analyze] Completed successfully (cached).")
         return jsonify(analysis_result), 200
 
+    except RateLimitExceeded as e:
+        return jsonify({"error": str(e)}), 429
+    except CircuitOpenError as e:
+        return jsonify({"error": str(e)}), 503
+    except LLMTimeout as e:
+        return jsonify({"error": str(e)}), 504
     except ValueError as e:
         print(f"[Analyze] ValueError: {e}")
         return jsonify({"error": str(e)}), 400
@@ -110,6 +141,103 @@ def analyze_document():
         return jsonify({"error": "An internal error occurred during analysis."}), 500
 
 
+def enqueue_analysis(user_id, user_cache, parsed):
+    """Queues the analysis on the background workers; 202 + job id."""
+    text = parsed.get("text")
+    if text:
+        cached = cached_analysis(user_id, user_cache, text, parsed["jurisdiction"], get_jwt().get("role"))
+        if cached:
+            print("[Analyze] Returning cached analysis result.")
+            return jsonify(cached), 200
+
+    user = User.query.get(user_id)
+    if not user:
+        raise ValueError("User not found.")
+
+    job_id = jobs.enqueue(
+        user_id=user_id,
+        role=user.role,
+        text=text,
+        pdf_bytes=None if text else parsed["file"].read(),
+        jurisdiction=parsed["jurisdiction"]
+    )
+    status_url = url_for("RAG.get_analysis_job", job_id=job_id)
+    return jsonify({"job_id": job_id, "status": "queued", "status_url": status_url}), 202, {"Location": status_url}
+
+
+@RAG_bp.route('/analyze/jobs/<job_id>', methods=['GET'])
+@jwt_required()
+def get_analysis_job(job_id):
+    """
+    Status of a queued analysis (queued, running, retrying, done or failed);
+    includes the result once status is "done".
+    """
+    try:
+        job = jobs.get_job(job_id)
+        if not job or job.pop("user_id") != str(get_jwt_identity()):
+            return jsonify({"error": "Job not found."}), 404
+        return jsonify(job), 200
+    except Exception as e:
+        print(f"[Analyze Job] ERROR: {e}")
+        return jsonify({"error": "Failed to fetch job status"}), 500
+
+
+@RAG_bp.route('/analyze/stream', methods=['POST'])
+@jwt_required()
+def analyze_document_stream():
+    """
+    Streaming /analyze. Same input; the response is a text/event-stream of
+        progress {"stage": "extracted" | "retrieved" | "sections" | "section_done", ...}
+        token    {"text": "..."}        raw JSON deltas from the analyzer
+        summary  {"summary": "..."}     as soon as the summary is complete
+        red_flag {"clause_text", ...}   each red flag as soon as it is complete
+        result   {...}                  the validated analysis (also cached)
+        error    {"error": "..."}
+    """
+    current_user_id = get_jwt_identity()
+    role = get_jwt().get("role")
+    parsed, error = parse_analysis_request()
+    if error:
+        return error
+
+    def events():
+        try:
+            jurisdiction = parsed["jurisdiction"]
+            document_text = parsed.get("text") or extract_text_from_upload(parsed["file"])
+            yield sse("progress", {"stage": "extracted", "chars": len(document_text)})
+
+            user_cache = get_user_cache(current_user_id)
+            cached = cached_analysis(current_user_id, user_cache, document_text, jurisdiction, role)
+            if cached:
+                print("[Analyze/stream] Returning cached analysis result.")
+                yield sse("result", cached)
+                return
+
+            deltas = []
+            for kind, payload in stream_legal_analysis(document_text, current_user_id, jurisdiction):
+                if kind == "token":
+                    deltas.append(payload)
+                    yield sse("token", {"text": payload})
+                elif kind in ("summary", "red_flag"):
+                    yield sse(kind, payload)
+                else:
+                    yield sse("progress", {"stage": kind, **payload})
+
+            analysis_result = parse_analysis_result("".join(deltas))
+            store_analysis(current_user_id, user_cache, document_text, jurisdiction, analysis_result)
+            yield sse("result", analysis_result)
+            print("[Analyze/stream] Completed successfully (cached).")
+
+        except (RateLimitExceeded, CircuitOpenError, LLMTimeout, ValueError) as e:
+            print(f"[Analyze/stream] {type(e).__name__}: {e}")
+            yield sse("error", {"error": str(e)})
+        except Exception as e:
+            print(f"[Analyze/stream] UNEXPECTED ERROR:\n{e}")
+            yield sse("error", {"error": "An internal error occurred during analysis."})
+
+    return sse_response(events())
+
+
 # --- FOLLOW-UP CHAT ENDPOINT ---
 @RAG_bp.route('/chat', methods=['POST'])
 @jwt_required()
@@ -120,48 +248,124 @@ def chat_with_document():
         data = request.get_json()
         validated_data = ChatSchema(**data)
 
-        wait_for_slot()
-
         # --- Get and update chat history ---
         user_cache = get_user_cache(current_user_id)
         chat_history = validated_data.dict().get('history', [])
         doc_context = None
 
-        # If analysis already exists, pass its summary or context to LLM
-        if user_cache.get("analysis_result"):
-            doc_context = json.dumps(user_cache["analysis_result"])
-
-        # Call your LLM
-        ai_response_text = llm_chat(
-            history=chat_history,
-            user_document=doc_context
-        )
-
-        # Append to cached chat
+        # The same question about the same analysis: no rate limiter, no LLM
+        key = answer_cache_key(user_cache, chat_history)
+        cached = answer_cache.lookup(key[0], key[1], key[3]) if key else None
+        fields = {}
+        if cached:
+            print(f"[Chat] Answer cache hit (similarity {cached['similarity']}).")
+            ai_response_text = cached["answer"]
+        else:
+            # If analysis already exists, pass its summary or context to LLM
+            _, analysis_result = load_analysis(current_user_id, user_cache)
+            if analysis_result:
+                doc_context = json.dumps(analysis_result)
+
+            # Older turns are folded into a rolling summary so the prompt stays bounded
+            recent, summary = compact_history(chat_history, user_cache.get("chat_summary"), llm_summarize_chat)
+
+            # Call your LLM
+            ai_response_text = llm_chat(
+                history=recent,
+                user_document=doc_context,
+                summary=summary["text"],
+                role=get_jwt().get("role")
+            )
+            fields["chat_summary"] = summary
+            # Only answers grounded in the analysis are shared under its hash
+            if key and doc_context and ai_response_text.strip():
+                answer_cache.store(*key, ai_response_text)
+
+        # Append the new turns to the cached chat
         chat_history.append({"role": "model", "content": ai_response_text})
-        user_cache["chat_history"] = chat_history
-        update_user_cache(current_user_id, user_cache)
+        save_chat(current_user_id, user_cache, chat_history, fields)
 
         return jsonify({"role": "model", "content": ai_response_text}), 200
 
     except ValidationError as e:
         return jsonify({"error": "Invalid chat history", "details": e.errors()}), 422
+    except RateLimitExceeded as e:
+        return jsonify({"error": str(e)}), 429
+    except CircuitOpenError as e:
+        return jsonify({"error": str(e)}), 503
+    except LLMTimeout as e:
+        return jsonify({"error": str(e)}), 504
     except Exception as e:
         print(f"[Chat] UNEXPECTED ERROR:\n{e}")
         return jsonify({"error": "An internal error occurred."}), 500
 
+@RAG_bp.route('/chat/stream', methods=['POST'])
+@jwt_required()
+def chat_with_document_stream():
+    """Streaming /chat: `token` events with reply deltas, then `done` with the full reply."""
+    current_user_id = get_jwt_identity()
+    role = get_jwt().get("role")
+    try:
+        validated_data = ChatSchema(**(request.get_json(silent=True) or {}))
+    except ValidationError as e:
+        return jsonify({"error": "Invalid chat history", "details": e.errors()}), 422
+
+    def events():
+        try:
+            user_cache = get_user_cache(current_user_id)
+            chat_history = validated_data.dict().get('history', [])
+            doc_context = None
+
+            key = answer_cache_key(user_cache, chat_history)
+            cached = answer_cache.lookup(key[0], key[1], key[3]) if key else None
+            fields = {}
+            if cached:
+                print(f"[Chat/stream] Answer cache hit (similarity {cached['similarity']}).")
+                ai_response_text = cached["answer"]
+                yield sse("token", {"text": ai_response_text})
+            else:
+                _, analysis_result = load_analysis(current_user_id, user_cache)
+                if analysis_result:
+                    doc_context = json.dumps(analysis_result)
+
+                recent, summary = compact_history(chat_history, user_cache.get("chat_summary"), llm_summarize_chat)
+
+                deltas = []
+                for delta in llm_chat_stream(history=recent, user_document=doc_context, summary=summary["text"], role=role):
+                    deltas.append(delta)
+                    yield sse("token", {"text": delta})
+
+                ai_response_text = "".join(deltas)
+                fields["chat_summary"] = summary
+                if key and doc_context and ai_response_text.strip():
+                    answer_cache.store(*key, ai_response_text)
+
+            chat_history.append({"role": "model", "content": ai_response_text})
+            save_chat(current_user_id, user_cache, chat_history, fields)
+            yield sse("done", {"role": "model", "content": ai_response_text})
+
+        except (RateLimitExceeded, CircuitOpenError, LLMTimeout) as e:
+            print(f"[Chat/stream] {type(e).__name__}: {e}")
+            yield sse("error", {"error": str(e)})
+        except Exception as e:
+            print(f"[Chat/stream] UNEXPECTED ERROR:\n{e}")
+            yield sse("error", {"error": "An internal error occurred."})
+
+    return sse_response(events())
+
 @RAG_bp.route('/chat/history', methods=['GET'])
 @jwt_required()
 def get_chat_history():
     """Fetch user's cached chat and analysis from Redis."""
     try:
         current_user_id = get_jwt_identity()
-        user_cache = get_user_cache(current_user_id)
+        user_cache = get_user_cache(current_user_id, with_chat=True)
+        document_text, analysis_result = load_analysis(current_user_id, user_cache)
         
         return jsonify({
             "chat_history": user_cache.get("chat_history", []),
-            "analysis_result": user_cache.get("analysis_result"),
-            "document_text": user_cache.get("document_text")
+            "analysis_result": analysis_result,
+            "document_text": document_text
         }), 200
 
     except Exception as e:
@@ -175,16 +379,126 @@ def get_last_analysis():
     try:
         current_user_id = get_jwt_identity()
         user_cache = get_user_cache(current_user_id)
+        document_text, analysis_result = load_analysis(current_user_id, user_cache)
 
-        if not user_cache.get("analysis_result"):
+        if not analysis_result:
             return jsonify({"message": "No cached analysis found."}), 404
 
         return jsonify({
-            "document_text": user_cache.get("document_text"),
-            "analysis_result": user_cache.get("analysis_result"),
+            "document_text": document_text,
+            "analysis_result": analysis_result,
             "timestamp": user_cache.get("timestamp")
         }), 200
 
     except Exception as e:
         print(f"[Get Analysis] ERROR: {e}")
         return jsonify({"error": "Failed to fetch previous analysis"}), 500
+
+
+@RAG_bp.route('/workspace', methods=['GET'])
+@jwt_required()
+def list_workspace():
+    """The user's analysed documents, most recently used first (no text or results)."""
+    try:
+        current_user_id = get_jwt_identity()
+        user_cache = get_user_cache(current_user_id)
+        documents = workspace.list(current_user_id)
+        for document in documents:
+            document["current"] = document["hash"] == user_cache.get("analysis_hash")
+        return jsonify({
+            "count": len(documents),
+            "bytes": sum(d["bytes"] for d in documents),
+            "max_documents": workspace.max_documents,
+            "max_bytes": workspace.max_bytes,
+            "documents": documents
+        }), 200
+
+    except Exception as e:
+        print(f"[Workspace] ERROR: {e}")
+        return jsonify({"error": "Failed to fetch workspace"}), 500
+
+
+@RAG_bp.route('/workspace/<doc_hash>/open', methods=['POST'])
+@jwt_required()
+def reopen_workspace_document(doc_hash):
+    """Makes a past analysis the current one (for /chat) and returns it; nothing is recomputed."""
+    try:
+        current_user_id = get_jwt_identity()
+        user_cache = get_user_cache(current_user_id)
+        entry = reopen_analysis(current_user_id, user_cache, doc_hash)
+
+        if entry is None:
+            return jsonify({"error": "Document not found in workspace."}), 404
+
+        return jsonify({
+            "hash": doc_hash,
+            "document_text": entry["document"],
+            "analysis_result": entry["result"],
+            "jurisdiction": entry["jurisdiction"]
+        }), 200
+
+    except Exception as e:
+        print(f"[Workspace] ERROR: {e}")
+        return jsonify({"error": "Failed to reopen document"}), 500
+
+
+@RAG_bp.route('/workspace/<doc_hash>', methods=['DELETE'])
+@jwt_required()
+def delete_workspace_document(doc_hash):
+    """Removes a document from the user's workspace."""
+    try:
+        if not workspace.remove(get_jwt_identity(), doc_hash):
+            return jsonify({"error": "Document not found in workspace."}), 404
+        return jsonify({"deleted": doc_hash}), 200
+
+    except Exception as e:
+        print(f"[Workspace] ERROR: {e}")
+        return jsonify({"error": "Failed to delete document"}), 500
+
+
+@RAG_bp.route('/acts', methods=['GET'])
+@jwt_required()
+def list_acts():
+    """Acts in the corpus, optionally filtered with ?jurisdiction=central|state."""
+    jurisdiction = request.args.get("jurisdiction")
+    acts = [
+        {"source": source, **act}
+        for source, act in rag_service.get_act_catalog().items()
+        if not jurisdiction or act.get("jurisdiction") == jurisdiction
+    ]
+    acts.sort(key=lambda act: (act.get("title") or "").lower())
+    return jsonify({"count": len(acts), "acts": acts}), 200
+
+
+@RAG_bp.route('/metrics', methods=['GET'])
+@jwt_required()
+def get_metrics():
+    """Cache and performance counters for this worker process."""
+    return jsonify({
+        "embedding_cache": rag_service.embedding_cache.stats(),
+        "retrieval_cache": rag_service.retrieval_cache.stats(),
+        "analysis_cache": analysis_cache.stats(),
+        "answer_cache": answer_cache.stats(),
+        "workspace": workspace.stats(),
+        "l1_cache": local_cache.stats(),
+        "embedding_server": rag_service.embedding_server_stats(),
+        "prompt_tokens": llm_service.prompt_token_stats,
+        "rate_limiter": llm_service.rate_limiter.stats(),
+        "llm_clients": llm_service.llm_client_stats(),
+        "router": llm_service.router.stats(),
+        "jobs": jobs.queue_stats()
+    }), 200
+
+
+@RAG_bp.route('/health/ready', methods=['GET'])
+def readiness_probe():
+    """200 once bge-m3 and the vector store are loaded, 503 before that."""
+    ready = rag_service.is_ready()
+    return jsonify({
+        "ready": ready,
+        "components": rag_service.readiness,
+        "llm_clients": {
+            "analyzer": llm_service.llm_analyzer is not None,
+            "chatter": llm_service.llm_chatter is not None
+        }
+    }), 200 if ready else 503
\ No newline at end of file
@@ -0,0 +1,67 @@
+"""
+Exact "Section N of Act X" lookups.
+
+data/ingest.py writes chroma_db/section_index.json while it chunks each act:
+    {
+      "acts":     {act_key: {"title": ..., "year": ..., "source": ...}},
+      "sections": {"<act_key>|<section>": [chunk_id, ...]}
+    }
+A citation in a query is resolved with a dict lookup, so it needs neither an
+embedding nor a vector search.
+"""
+import json
+import re
+
+from .act_names import act_key
+
+_ACT_WORD = r"(?:[A-Z][A-Za-z'&\-]*|of|and|the|for|in|on|to|\(\w+\))"
+CITATION_RE = re.compile(
+    r"\b(?:[Ss]ection|[Ss]ec\.?|[Ss]\.|u/s\.?)\s*"       # "Section", "Sec.", "S.", "u/s"
+    r"(\d{1,3}[A-Z]?)"                                    # 106, 13A
+    r"(?:\s*\(\d{1,2}\))*"                                # optional sub-section "(1)"
+    r"(?:\s*,)?\s+(?:of\s+)?(?:the\s+)?"
+    r"((?:" + _ACT_WORD + r"\s+){1,10}?Act)"              # Transfer of Property Act
+    r"(?:\s*,?\s*(\d{4}))?"                               # optional year
+)
+
+
+class SectionIndex:
+    def __init__(self, acts: dict = None, sections: dict = None):
+        self.acts = acts or {}
+        self.sections = sections or {}
+
+    @classmethod
+    def load(cls, path):
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            index = cls(data.get("acts"), data.get("sections"))
+            print(f"Loaded section index ({len(index.sections)} sections, {len(index.acts)} acts)")
+            return index
+        except FileNotFoundError:
+            print(f"No section index at {path}; citation lookup disabled.")
+        except Exception as e:
+            print(f"Error loading section index: {e}")
+        return cls()
+
+    def find_citations(self, text: str) -> list[tuple[str, str]]:
+        """(act_key, section) pairs cited in `text`, in order of appearance, de-duplicated."""
+        found = []
+        for match in CITATION_RE.finditer(text):
+            pair = (act_key(match.group(2)), match.group(1).upper())
+            if pair not in found:
+                found.append(pair)
+        return found
+
+    def lookup(self, text: str, limit: int = None) -> list[str]:
+        """Chunk ids for every citation in `text` that the index knows about."""
+        if not self.sections:
+            return []
+        ids = []
+        for key, section in self.find_citations(text):
+            for chunk_id in self.sections.get(f"{key}|{section}", []):
+                if chunk_id not in ids:
+                    ids.append(chunk_id)
+                if limit and len(ids) >= limit:
+                    return ids
+        return ids
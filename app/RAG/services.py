@@ -1,13 +1,18 @@
+import json
 import pypdf
 from werkzeug.datastructures import FileStorage
 from app.auth.models import User
 from app.extensions import db
+from app import ocr
 
-import pytesseract
-from pdf2image import convert_from_bytes
+from pydantic import ValidationError
 
 from . import rag_service
 from . import llm_service
+from . import map_reduce
+from .context_builder import build_context
+from .json_stream import AnalysisStreamParser
+from .models import AnalysisResult, RedFlag
 
 def extract_text_from_upload(pdf_file: FileStorage) -> str:
     """
@@ -38,13 +43,10 @@ def extract_text_from_upload(pdf_file: FileStorage) -> str:
     print(f"  - Digital text not found. Starting OCR on user upload...")
     try:
         pdf_file.seek(0)
-        
-        images = convert_from_bytes(pdf_file.read())
-    
-        full_ocr_text = ""
-        for img in images:
-            full_ocr_text += pytesseract.image_to_string(img) + "\n\n"
-            
+
+        # Pages are rasterised a few at a time and read in parallel (app/ocr.py)
+        full_ocr_text = "".join(text + "\n\n" for text in ocr.ocr_pdf(pdf_file.read()))
+
         if not full_ocr_text.strip():
             raise ValueError("OCR failed. PDF may be empty or unreadable.")
 
@@ -55,21 +57,149 @@ def extract_text_from_upload(pdf_file: FileStorage) -> str:
         print(f"  - OCR extraction FAILED for user upload: {e}")
         raise ValueError(f"Could not read the provided PDF file. {str(e)}")
 
-def perform_legal_analysis(document_text: str, user_id: str) -> str:
+def parse_analysis_result(analysis_result):
+    """
+    The analyzer's JSON string as a dict validated against AnalysisResult
+    (or an error stub if it isn't valid JSON or doesn't fit the schema).
+    """
+    if isinstance(analysis_result, str):
+        raw = analysis_result
+        # Tolerate a ```json fence or stray text around the object
+        start, stop = raw.find("{"), raw.rfind("}")
+        try:
+            analysis_result = json.loads(raw[start:stop + 1] if 0 <= start < stop else raw)
+        except json.JSONDecodeError:
+            return {"summary": "Error decoding analysis", "raw": raw}
+    if isinstance(analysis_result, dict) and "raw" in analysis_result:
+        return analysis_result
+    try:
+        return AnalysisResult.model_validate(analysis_result).model_dump(exclude_none=True)
+    except ValidationError as e:
+        print(f"[Analysis] Result does not match the schema: {e}")
+        return {"summary": "Error decoding analysis", "raw": json.dumps(analysis_result)}
+
+
+def _stream_event(kind: str, value):
+    """A parsed value from AnalysisStreamParser as a stream event, or None if it is invalid."""
+    if kind == "summary":
+        return "summary", {"summary": value}
+    try:
+        return "red_flag", RedFlag.model_validate(value).model_dump()
+    except ValidationError:
+        return None   # Left to the final validation
+
+
+def find_analysis_context(document_text: str, jurisdiction: str = None):
+    """Retrieval + context packing. Returns (packed context, number of retrieved chunks)."""
+    # Optional scope: only central acts, or only state acts
+    filters = {"jurisdiction": jurisdiction} if jurisdiction else None
+    if len(document_text) > rag_service.WINDOW_CHARS:
+        # Long document: one batched multi-window query instead of a truncated one
+        retrieved_context = rag_service.retrieve_windows(document_text, filters=filters)
+    else:
+        retrieved_context = rag_service.retrieve(document_text, filters=filters)
+    # Compact, tagged, de-overlapped chunks instead of the raw Chroma dict
+    return build_context(retrieved_context), len(retrieved_context["ids"][0])
+
+
+def _analyze_section(section: str, jurisdiction: str = None, role: str = None) -> dict:
+    context, _ = find_analysis_context(section, jurisdiction)
+    result = parse_analysis_result(llm_service.llm_analysis(context=context, user_document=section, role=role))
+    if "raw" in result:
+        raise ValueError("The analyzer returned an invalid result for this section.")
+    return result
+
+
+def _merge_summaries(summaries: list) -> str:
+    merged = parse_analysis_result(llm_service.llm_merge_summaries(summaries))
+    return None if "raw" in merged else merged.get("summary")
+
+
+def iter_map_reduce_analysis(document_text: str, jurisdiction: str = None, role: str = None):
+    """
+    Map-reduce analysis of a long document (see app/RAG/map_reduce.py).
+    Yields ("sections", {"count"}), one ("section_done", {...}) per section
+    followed by a ("red_flag", flag) for each of its flags not already seen,
+    then ("result", merged analysis dict).
+    """
+    sections = map_reduce.split_sections(document_text)
+    print(f"[MapReduce] {len(sections)} sections")
+    yield "sections", {"count": len(sections)}
+
+    results = [None] * len(sections)
+    seen_flags = []
+    for index, result, error in map_reduce.map_sections(sections, lambda s: _analyze_section(s, jurisdiction, role)):
+        results[index] = result
+        yield "section_done", {"section": index + 1, "ok": error is None}
+        for flag in (result or {}).get("red_flags") or []:
+            # Same duplicate rule as the final merge, applied as sections arrive
+            if len(map_reduce.dedupe_red_flags(seen_flags + [flag])) > len(seen_flags):
+                seen_flags.append(flag)
+                yield "red_flag", flag
+
+    yield "result", map_reduce.reduce_results(results, _merge_summaries)
+
+
+def perform_legal_analysis(document_text: str, user_id: str, jurisdiction: str = None) -> str:
     user = User.query.get(user_id)
     if not user:
         raise ValueError("User not found.")
         
     print(f"Analysis requested by user: {user.email}")
+
+    if map_reduce.needs_map_reduce(document_text):
+        # Too long for one prompt: analyse sections in parallel, then merge
+        for kind, payload in iter_map_reduce_analysis(document_text, jurisdiction, user.role):
+            if kind == "result":
+                print("Analysis complete.")
+                return json.dumps(payload)
     
     print("Step 1: Finding relevant context...")
-    retrieved_context = rag_service.retrieve(document_text)
+    context, _ = find_analysis_context(document_text, jurisdiction)
     print("Step 2: Generating analysis...")
     analysis_json_string = llm_service.llm_analysis(
-        context=retrieved_context,
-        user_document=document_text
+        context=context,
+        user_document=document_text,
+        role=user.role
     )
     
     print("Analysis complete.")
     
-    return analysis_json_string
\ No newline at end of file
+    return analysis_json_string
+
+
+def stream_legal_analysis(document_text: str, user_id: str, jurisdiction: str = None):
+    """
+    Streaming counterpart of perform_legal_analysis().
+    Yields ("retrieved", {"chunks": n}) once the context is ready, then
+    ("token", text) for every delta from the analyzer, interleaved with
+    ("summary", {"summary"}) and ("red_flag", flag) as soon as each of those
+    values is complete in the output (see app/RAG/json_stream.py).
+    Long documents take the map-reduce path instead: section progress and
+    red flags as sections finish, then the merged summary and the merged
+    JSON as a single token.
+    """
+    user = User.query.get(user_id)
+    if not user:
+        raise ValueError("User not found.")
+
+    print(f"Streaming analysis requested by user: {user.email}")
+    if map_reduce.needs_map_reduce(document_text):
+        for kind, payload in iter_map_reduce_analysis(document_text, jurisdiction, user.role):
+            if kind == "result":
+                yield "summary", {"summary": payload["summary"]}
+                yield "token", json.dumps(payload)
+            else:
+                yield kind, payload
+        return
+
+    context, n_chunks = find_analysis_context(document_text, jurisdiction)
+    yield "retrieved", {"chunks": n_chunks}
+
+    parser = AnalysisStreamParser()
+    for delta in llm_service.llm_analysis_stream(context=context, user_document=document_text, role=user.role):
+        yield "token", delta
+        for kind, value in parser.feed(delta):
+            event = _stream_event(kind, value)
+            if event:
+                yield event
@@ -0,0 +1,107 @@
+from app import user_session
+from . import r_raw
+from .analysis_cache import AnalysisCache
+from .answer_cache import AnswerCache
+from .workspace import Workspace
+from .llm_service import (
+    ANALYZER_MODEL, CHATTER_MODEL, ANALYSIS_PROMPT_VERSION, CHAT_PROMPT_VERSION, local_analysis_allowed
+)
+
+# Finished analyses are shared by every user; the per-user key only points at them.
+# Stored compressed, hence the bytes client.
+analysis_cache = AnalysisCache(r_raw, ANALYZER_MODEL, ANALYSIS_PROMPT_VERSION)
+# Follow-up answers, per analysis, looked up by question similarity
+answer_cache = AnswerCache(r_raw, CHAT_PROMPT_VERSION)
+# Each user's own copies of the documents they analysed, so they can switch back
+workspace = Workspace(r_raw, analysis_cache.codec)
+
+
+# === Helper functions for Redis ===
+# Shared by the HTTP routes and the background analysis workers.
+# Storage layout: app/user_session.py
+
+def get_user_cache(user_id, with_chat=False):
+    return user_session.load(user_id, with_chat)
+
+
+def update_user_cache(user_id, user_cache, fields, drop=()):
+    """Writes `fields` to the user's session and mirrors them in `user_cache`."""
+    user_cache.update(user_session.save(user_id, fields, drop))
+    for name in drop:
+        user_cache.pop(name, None)
+
+
+def save_chat(user_id, user_cache, chat_history, fields=None):
+    """Appends the new turns of `chat_history` and writes `fields`, in one round trip."""
+    user_session.append_chat(user_id, user_cache, chat_history, fields)
+
+
+def _point_at(user_id, user_cache, digest, jurisdiction):
+    # Entries written before the shared cache held the text and result inline
+    update_user_cache(
+        user_id, user_cache,
+        {"analysis_hash": digest, "jurisdiction": jurisdiction},
+        drop=("document_text", "analysis_result")
+    )
+
+
+def cached_analysis(user_id, user_cache, document_text, jurisdiction, role):
+    """
+    The analysis of this document from the cross-user cache or the user's own
+    workspace, or None. The user's local-model analyses (also in the
+    workspace) are only returned to roles the router may analyse locally, so
+    a user who upgraded gets a hosted analysis. On a hit the user's cache is
+    pointed at it, as if they had run it themselves.
+    """
+    digest = analysis_cache.digest(document_text, jurisdiction)
+    entry = analysis_cache.get(digest)
+    if entry is not None:
+        workspace.add(user_id, digest, document_text, jurisdiction, entry["result"])
+    else:
+        entry = workspace.get(user_id, digest)
+    if entry is None:
+        if not local_analysis_allowed(role):
+            return None
+        digest = analysis_cache.digest(document_text, jurisdiction, CHATTER_MODEL)
+        entry = workspace.get(user_id, digest)
+        if entry is None:
+            return None
+    if user_cache.get("analysis_hash") != digest:
+        _point_at(user_id, user_cache, digest, jurisdiction)
+    return entry["result"]
+
+
+def store_analysis(user_id, user_cache, document_text, jurisdiction, analysis_result):
+    if "raw" in analysis_result:
+        # Never share (or keep) an undecodable response. Nothing is stored under
+        # its digest, so the user's pointer stays on their previous analysis.
+        return
+    # Local-model analyses carry a "model" label and are stored under their own
+    # digest in the owner's workspace only; other users never get them.
+    digest = analysis_cache.digest(document_text, jurisdiction, analysis_result.get("model"))
+    if not analysis_result.get("model"):
+        analysis_cache.put(digest, document_text, analysis_result)
+    workspace.add(user_id, digest, document_text, jurisdiction, analysis_result)
+    _point_at(user_id, user_cache, digest, jurisdiction)
+
+
+def reopen_analysis(user_id, user_cache, digest):
+    """Points the user's cache at a document in their workspace; its entry, or None."""
+    entry = workspace.get(user_id, digest)
+    if entry is None:
+        return None
+    if user_cache.get("analysis_hash") != digest:
+        _point_at(user_id, user_cache, digest, entry["jurisdiction"])
+    return entry
+
+
+def load_analysis(user_id, user_cache):
+    """(document_text, analysis_result) of the user's current analysis, or (None, None)."""
+    digest = user_cache.get("analysis_hash")
+    if digest:
+        # The shared entry may have been evicted; the workspace keeps the user's copy
+        entry = analysis_cache.get(digest, count=False) or workspace.get(user_id, digest, touch=False)
+        if entry:
+            return entry["document"], entry["result"]
+        return None, None
+    return user_cache.get("document_text"), user_cache.get("analysis_result")
@@ -0,0 +1,287 @@
+"""
+In-process, memory-mapped flat vector index.
+
+An exported collection is a directory containing:
+    vectors.npy      N x D matrix, float16 or int8 (row-quantised)
+    scales.npy       per-row float32 scale (int8 only)
+    doc_offsets.npy  N+1 byte offsets into documents.bin
+    documents.bin    UTF-8 chunk texts, concatenated
+    meta.json        dtype, ids, metadatas, the source collection name and
+                     the row range of each partition
+
+Rows are sorted by PARTITION_KEY (jurisdiction) at export, so a query scoped
+to one jurisdiction scans only that contiguous slice of the matrix.
+
+Everything large is opened with mmap, so every gunicorn worker on the box
+shares the same physical pages through the OS page cache.
+
+Export with:
+    python -m app.RAG.vector_index --dtype int8
+"""
+import json
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+BLOCK_ROWS = 65536      # Rows scored per matmul; bounds the temporary float32 copy
+EXPORT_PAGE = 5000      # Rows fetched from Chroma per .get() call
+SUPPORTED_DTYPES = ("float16", "int8")
+PARTITION_KEY = "jurisdiction"
+
+
+class FlatIndex:
+    """Exact (brute-force) cosine search over a memory-mapped matrix."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path / "meta.json") as f:
+            meta = json.load(f)
+
+        self.dtype = meta["dtype"]
+        self.collection_name = meta.get("collection")
+        self.ids = meta["ids"]
+        self.metadatas = meta["metadatas"]
+        self.partitions = meta.get("partitions", {})
+        self._value_rows = {}
+
+        self.vectors = np.load(self.path / "vectors.npy", mmap_mode="r")
+        self.scales = np.load(self.path / "scales.npy", mmap_mode="r") if self.dtype == "int8" else None
+        self.doc_offsets = np.load(self.path / "doc_offsets.npy", mmap_mode="r")
+        self.documents = np.memmap(self.path / "documents.bin", dtype=np.uint8, mode="r")
+
+    def __len__(self):
+        return self.vectors.shape[0]
+
+    def count(self):
+        return len(self)
+
+    # --- Decoding helpers ---
+    def _rows(self, start, stop) -> np.ndarray:
+        block = np.asarray(self.vectors[start:stop], dtype=np.float32)
+        if self.scales is not None:
+            block *= self.scales[start:stop, None]
+        return block
+
+    def _rows_at(self, rows: np.ndarray) -> np.ndarray:
+        block = np.asarray(self.vectors[rows], dtype=np.float32)
+        if self.scales is not None:
+            block *= self.scales[rows, None]
+        return block
+
+    def _document(self, i) -> str:
+        return bytes(self.documents[self.doc_offsets[i]:self.doc_offsets[i + 1]]).decode("utf-8")
+
+    # --- Filters ---
+    def _rows_with(self, key, value) -> np.ndarray:
+        """Sorted row numbers whose metadata[key] == value (built once per pair)."""
+        if (key, value) not in self._value_rows:
+            self._value_rows[(key, value)] = np.array(
+                [i for i, meta in enumerate(self.metadatas) if (meta or {}).get(key) == value],
+                dtype=np.int64
+            )
+        return self._value_rows[(key, value)]
+
+    def _resolve_where(self, where):
+        """
+        Turns a Chroma-style equality filter ({"k": v} or {"$and": [...]}) into
+        either a (start, stop) slice, when only the partition key is used,
+        or an explicit array of rows.
+        """
+        conditions = where.get("$and", [where]) if where else []
+        start, stop, rows = 0, len(self), None
+        for condition in conditions:
+            for key, value in condition.items():
+                if isinstance(value, dict):
+                    value = value.get("$eq", value)
+                if isinstance(value, dict):
+                    raise ValueError("FlatIndex supports equality filters only")
+                if key == PARTITION_KEY and key in self.partitions:
+                    lo, hi = self.partitions[key].get(value, (0, 0))
+                    start, stop = max(start, lo), min(stop, hi)
+                else:
+                    matches = self._rows_with(key, value)
+                    rows = matches if rows is None else np.intersect1d(rows, matches)
+        if rows is None:
+            return (start, max(start, stop)), None
+        return None, rows[(rows >= start) & (rows < stop)]
+
+    # --- Search ---
+    def search(self, query_embeddings, k: int, start: int = 0, stop: int = None, rows: np.ndarray = None):
+        """
+        Top-k by inner product for a batch of normalised queries (Q x D).
+        Returns (indices, scores), both Q x k, best first.
+        Only rows [start, stop) are scanned, or only `rows` if given.
+        """
+        q = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        if rows is None:
+            stop = len(self) if stop is None else stop
+            total = stop - start
+        else:
+            total = len(rows)
+        k = min(k, total)
+
+        best_idx = np.empty((q.shape[0], 0), dtype=np.int64)
+        best_scores = np.empty((q.shape[0], 0), dtype=np.float32)
+        if k <= 0:
+            return best_idx, best_scores
+
+        for offset in range(0, total, BLOCK_ROWS):
+            if rows is None:
+                lo, hi = start + offset, min(start + offset + BLOCK_ROWS, stop)
+                block, row_ids = self._rows(lo, hi), np.arange(lo, hi)
+            else:
+                row_ids = rows[offset:offset + BLOCK_ROWS]
+                block = self._rows_at(row_ids)
+            scores = q @ block.T   # One BLAS call for every query in the batch
+
+            if k < scores.shape[1]:
+                part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                scores = np.take_along_axis(scores, part, axis=1)
+            else:
+                part = np.broadcast_to(np.arange(len(row_ids)), scores.shape)
+
+            best_idx = np.concatenate([best_idx, row_ids[part]], axis=1)
+            best_scores = np.concatenate([best_scores, scores], axis=1)
+            if best_scores.shape[1] > k:
+                keep = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+                best_idx = np.take_along_axis(best_idx, keep, axis=1)
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+
+        order = np.argsort(-best_scores, axis=1)
+        return np.take_along_axis(best_idx, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+
+    def query(self, query_embeddings, n_results: int = 3, where=None, include=("documents", "metadatas", "distances")):
+        """Drop-in replacement for chromadb Collection.query (cosine space)."""
+        span, rows = self._resolve_where(where)
+        if rows is None:
+            indices, scores = self.search(query_embeddings, n_results, start=span[0], stop=span[1])
+        else:
+            indices, scores = self.search(query_embeddings, n_results, rows=rows)
+
+        results = {"ids": [[self.ids[i] for i in row] for row in indices]}
+        if "documents" in include:
+            results["documents"] = [[self._document(i) for i in row] for row in indices]
+        if "metadatas" in include:
+            results["metadatas"] = [[self.metadatas[i] for i in row] for row in indices]
+        if "distances" in include:
+            results["distances"] = (1.0 - scores).tolist()
+        if "embeddings" in include:
+            results["embeddings"] = [[self._rows(i, i + 1)[0] for i in row] for row in indices]
+        return results
+
+    def get(self, ids, include=("documents", "metadatas")):
+        """Drop-in replacement for chromadb Collection.get (by id only)."""
+        if not hasattr(self, "_id_to_row"):
+            self._id_to_row = {chunk_id: i for i, chunk_id in enumerate(self.ids)}
+        rows = [self._id_to_row[i] for i in ids if i in self._id_to_row]
+
+        results = {"ids": [self.ids[i] for i in rows]}
+        if "documents" in include:
+            results["documents"] = [self._document(i) for i in rows]
+        if "metadatas" in include:
+            results["metadatas"] = [self.metadatas[i] for i in rows]
+        return results
+
+
+def quantize_int8(block: np.ndarray):
+    """Symmetric per-row int8 quantisation. Returns (int8 rows, float32 scales)."""
+    scales = np.abs(block).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    return np.round(block / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+
+def export_collection(collection, out_dir, dtype: str = "float16"):
+    """Writes a Chroma collection to the flat index layout described above."""
+    if dtype not in SUPPORTED_DTYPES:
+        raise ValueError(f"dtype must be one of {SUPPORTED_DTYPES}")
+
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    total = collection.count()
+    if total == 0:
+        raise ValueError("Collection is empty; run data/ingest.py first.")
+
+    # Pass 1: ids + metadata only, to decide the partition-sorted row order
+    ids, metadatas = [], []
+    for page in range(0, total, EXPORT_PAGE):
+        batch = collection.get(limit=EXPORT_PAGE, offset=page, include=["metadatas"])
+        ids.extend(batch["ids"])
+        metadatas.extend(batch["metadatas"])
+
+    order = sorted(range(total), key=lambda i: str((metadatas[i] or {}).get(PARTITION_KEY, "")))
+    ids = [ids[i] for i in order]
+    metadatas = [metadatas[i] for i in order]
+
+    partitions = {}
+    for row, meta in enumerate(metadatas):
+        value = (meta or {}).get(PARTITION_KEY)
+        if value is not None:
+            lo, _ = partitions.get(value, (row, row))
+            partitions[value] = (lo, row + 1)
+
+    # Pass 2: vectors and texts, fetched by id in the new order
+    vectors = None
+    scales = np.empty(total, dtype=np.float32)
+    offsets = np.zeros(total + 1, dtype=np.int64)
+
+    with open(out / "documents.bin", "wb") as docs:
+        row = 0
+        for page in range(0, total, EXPORT_PAGE):
+            wanted = ids[page:page + EXPORT_PAGE]
+            fetched = collection.get(ids=wanted, include=["embeddings", "documents"])
+            position = {chunk_id: i for i, chunk_id in enumerate(fetched["ids"])}
+            batch = {
+                "embeddings": [fetched["embeddings"][position[i]] for i in wanted],
+                "documents": [fetched["documents"][position[i]] for i in wanted],
+            }
+            block = np.asarray(batch["embeddings"], dtype=np.float32)
+            if vectors is None:
+                vectors = np.lib.format.open_memmap(
+                    out / "vectors.npy", mode="w+", dtype=dtype, shape=(total, block.shape[1])
+                )
+
+            n = block.shape[0]
+            if dtype == "int8":
+                vectors[row:row + n], scales[row:row + n] = quantize_int8(block)
+            else:
+                vectors[row:row + n] = block.astype(np.float16)
+
+            for i, text in enumerate(batch["documents"]):
+                encoded = (text or "").encode("utf-8")
+                docs.write(encoded)
+                offsets[row + i + 1] = offsets[row + i] + len(encoded)
+
+            row += n
+            print(f"  - Exported {row}/{total} rows")
+
+    vectors.flush()
+    np.save(out / "doc_offsets.npy", offsets)
+    if dtype == "int8":
+        np.save(out / "scales.npy", scales)
+    with open(out / "meta.json", "w") as f:
+        json.dump({
+            "dtype": dtype,
+            "collection": collection.name,
+            "ids": ids,
+            "metadatas": metadatas,
+            "partitions": {PARTITION_KEY: partitions},
+        }, f)
+
+    print(f"Flat index ({dtype}, {total} rows) written to {out}")
+
+
+if __name__ == "__main__":
+    import chromadb
+    from . import r
+    from .rag_service import CHROMA_PATH, COLLECTION_NAME, FLAT_INDEX_PATH
+    from .retrieval_cache import bump_index_version
+
+    parser = argparse.ArgumentParser(description="Export the Chroma collection to a flat mmap index.")
+    parser.add_argument("--dtype", choices=SUPPORTED_DTYPES, default="float16")
+    parser.add_argument("--out", default=str(FLAT_INDEX_PATH))
+    args = parser.parse_args()
+
+    client = chromadb.PersistentClient(path=str(CHROMA_PATH))
+    export_collection(client.get_collection(name=COLLECTION_NAME), args.out, args.dtype)
+    bump_index_version(r, COLLECTION_NAME)
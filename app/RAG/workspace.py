@@ -0,0 +1,152 @@
+"""
+Per-user workspace: the documents a user has analysed, addressed by the
+analysis digest (see app/RAG/analysis_cache.py), so switching between
+contracts never re-extracts or re-analyses one.
+
+    lex:user:{id}:workspace        zset   digest -> last used (unix seconds)
+    lex:user:{id}:workspace:docs   hash   digest -> codec blob {"document", "result", "jurisdiction"}
+    lex:user:{id}:workspace:meta   hash   digest -> JSON {"title", "jurisdiction", "chars", "bytes", ...}
+
+The workspace keeps its own compressed copy because shared cache entries
+can be evicted or expire while a user still wants the document. It is
+bounded per user by max_documents and max_bytes (stored size), evicting the
+least recently used documents; the one just added is never evicted.
+"""
+import os
+import json
+import time
+import threading
+
+from app.user_session import workspace_key
+from .cache_codec import CacheCodec
+
+WORKSPACE_MAX_DOCUMENTS = int(os.environ.get("LEX_WORKSPACE_MAX_DOCUMENTS", 10))
+WORKSPACE_MAX_BYTES = int(os.environ.get("LEX_WORKSPACE_MAX_BYTES", 5 * 1024 * 1024))
+WORKSPACE_TTL_SECONDS = int(os.environ.get("LEX_WORKSPACE_TTL", 30 * 86400))
+TITLE_CHARS = 80
+
+
+def document_title(document_text: str) -> str:
+    """First non-empty line of the document, shortened."""
+    for line in document_text.splitlines():
+        line = " ".join(line.split())
+        if line:
+            return line if len(line) <= TITLE_CHARS else line[:TITLE_CHARS - 1] + "…"
+    return "Untitled document"
+
+
+class Workspace:
+    def __init__(self, redis_client, codec: CacheCodec, max_documents: int = WORKSPACE_MAX_DOCUMENTS,
+                 max_bytes: int = WORKSPACE_MAX_BYTES, ttl: int = WORKSPACE_TTL_SECONDS):
+        """`redis_client` must return bytes (the documents are codec blobs)."""
+        self.redis = redis_client
+        self.codec = codec
+        self.max_documents = max_documents
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.counters = {"added": 0, "reopened": 0, "evicted": 0, "errors": 0}
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def _keys(self, user_id):
+        base = workspace_key(user_id)
+        return base, f"{base}:docs", f"{base}:meta"
+
+    def _expire(self, pipe, keys):
+        for key in keys:
+            pipe.expire(key, self.ttl)
+
+    def add(self, user_id, digest: str, document_text: str, jurisdiction: str, result: dict):
+        """Adds (or refreshes) a document, then evicts down to the limits."""
+        keys = index_key, docs_key, meta_key = self._keys(user_id)
+        blob = self.codec.encode({"document": document_text, "result": result, "jurisdiction": jurisdiction})
+        now = time.time()
+        meta = {
+            "title": document_title(document_text),
+            "jurisdiction": jurisdiction,
+            "chars": len(document_text),
+            "red_flags": len(result.get("red_flags") or []),
+            "model": result.get("model"),
+            "bytes": len(blob),
+            "added": now,
+        }
+        try:
+            pipe = self.redis.pipeline()
+            pipe.zadd(index_key, {digest: now})
+            pipe.hset(docs_key, digest, blob)
+            pipe.hset(meta_key, digest, json.dumps(meta))
+            self._expire(pipe, keys)
+            pipe.zrange(index_key, 0, -1)      # Oldest first
+            pipe.hgetall(meta_key)
+            order, metas = pipe.execute()[-2:]
+            self._count("added")
+            self._evict(user_id, digest, order, metas)
+        except Exception as e:
+            print(f"[Workspace] Redis write failed: {e}")
+            self._count("errors")
+
+    def _evict(self, user_id, keep: str, order: list, metas: dict):
+        sizes = {d: json.loads(m)["bytes"] for d, m in metas.items()}
+        count, total = len(order), sum(sizes.get(d, 0) for d in order)
+        evicted = []
+        for member in order:
+            if count <= self.max_documents and total <= self.max_bytes:
+                break
+            if member.decode() == keep:
+                continue
+            evicted.append(member)
+            count -= 1
+            total -= sizes.get(member, 0)
+        if evicted:
+            self.remove(user_id, *evicted)
+            self._count("evicted", len(evicted))
+            print(f"[Workspace] Evicted {len(evicted)} document(s) for user {user_id}")
+
+    def remove(self, user_id, *digests) -> int:
+        index_key, docs_key, meta_key = self._keys(user_id)
+        pipe = self.redis.pipeline()
+        pipe.zrem(index_key, *digests)
+        pipe.hdel(docs_key, *digests)
+        pipe.hdel(meta_key, *digests)
+        return pipe.execute()[0]
+
+    def get(self, user_id, digest: str, touch: bool = True):
+        """{"document", "result", "jurisdiction"} for a document in the workspace, or None."""
+        keys = index_key, docs_key, _ = self._keys(user_id)
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.hget(docs_key, digest)
+            if touch:
+                pipe.zadd(index_key, {digest: time.time()}, xx=True)
+                self._expire(pipe, keys)
+            blob = pipe.execute()[0]
+            if blob is None:
+                return None
+            self._count("reopened")
+            return self.codec.decode(blob)
+        except Exception as e:
+            print(f"[Workspace] Redis read failed: {e}")
+            self._count("errors")
+            return None
+
+    def list(self, user_id) -> list:
+        """Documents in the workspace, most recently used first (metadata only)."""
+        index_key, _, meta_key = self._keys(user_id)
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.zrevrange(index_key, 0, -1, withscores=True)
+        pipe.hgetall(meta_key)
+        order, metas = pipe.execute()
+        documents = []
+        for member, last_used in order:
+            meta = metas.get(member)
+            if meta:
+                documents.append({"hash": member.decode(), **json.loads(meta), "last_used": last_used})
+        return documents
+
+    def stats(self) -> dict:
+        with self._lock:
+            c = dict(self.counters)
+        return {**c, "max_documents": self.max_documents, "max_bytes": self.max_bytes, "ttl_seconds": self.ttl}
@@ -2,14 +2,24 @@ from flask import Flask
 from .config import config
 from .extensions import db, bcrypt, jwt, migrate, mail
 from flask_cors import CORS
-from app.auth import auth_bp
-from app.RAG import RAG_bp
+import threading
 
-def create_app(config_name="default"):
+# Which blueprints each kind of worker serves.
+# "auth" workers never import app.RAG, so they never load torch/bge-m3/Chroma.
+ROLES = {
+    "all": ("auth", "rag"),
+    "auth": ("auth",),
+    "rag": ("rag",),
+}
+
+def create_app(config_name="default", role="all"):
+    if role not in ROLES:
+        raise ValueError(f"Unknown app role '{role}'. Expected one of: {', '.join(ROLES)}")
     
     app = Flask(__name__)
     
     app.config.from_object(config[config_name])
+    app.config["APP_ROLE"] = role
 
     CORS(
         app,
@@ -37,7 +47,22 @@ def create_app(config_name="default"):
 
     jwt.init_app(app)
 
-    app.register_blueprint(auth_bp)
-    app.register_blueprint(RAG_bp)
+    if "auth" in ROLES[role]:
+        from app.auth import auth_bp
+        app.register_blueprint(auth_bp)
+
+    if "rag" in ROLES[role]:
+        from app.RAG import RAG_bp
+        app.register_blueprint(RAG_bp)
+
+        # Models load lazily on first request; optionally start loading now
+        # in the background so /health/ready flips once they are in memory.
+        if app.config.get("RAG_WARMUP"):
+            from app.RAG import rag_service, llm_service
+            threading.Thread(
+                target=lambda: (rag_service.warm_up(), llm_service.warm_up()),
+                name="rag-warmup",
+                daemon=True
+            ).start()
 
     return app
\ No newline at end of file
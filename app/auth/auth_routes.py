@@ -13,7 +13,6 @@ from flask_jwt_extended import (
     get_jti,
     get_jwt
 )
-import json
 
 # -------------------- SIGNUP --------------------
 @auth_bp.route('/signup', methods=['POST'])
@@ -133,15 +132,16 @@ def verify_email():
 def user_profile():
     user_id = get_jwt_identity()
     from app.auth.models import User
-    from app.RAG import r  # redis
+    from app import user_session
     
     user = User.query.get(user_id)
-    cache = r.get(f"lex:user:{user_id}")
-    cache_data = json.loads(cache) if cache else {}
+    # Session fields only; the chat list itself is never read here
+    session = user_session.load(user_id)
     
     return jsonify({
         "email": user.email,
-        "documents": 1 if cache_data.get("analysis_result") else 0,
-        "chats": len(cache_data.get("chat_history", [])),
-        "last_active": cache_data.get("timestamp")
+        "documents": user_session.workspace_size(user_id)
+                     or (1 if session.get("analysis_hash") or session.get("analysis_result") else 0),
+        "chats": session.get("chat_turns", 0),
+        "last_active": session.get("timestamp")
     })
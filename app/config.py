@@ -32,6 +32,12 @@ class Config:
     VECTOR_COLLECTION_NAME = 'legal_india_v1' 
     
     FRONTEND_URL = os.environ.get('FRONTEND_URL', 'http://localhost:5173')
+
+    # --- Load bge-m3 / Chroma / LLM clients at startup instead of on first request ---
+    RAG_WARMUP = str(os.environ.get('RAG_WARMUP', 'False')).lower() in ['true', 'on', '1']
+
+    # --- Queue /analyze on the background workers (python -m app.RAG.job_worker) by default ---
+    ANALYZE_ASYNC = str(os.environ.get('LEX_ANALYZE_ASYNC', 'False')).lower() in ['true', 'on', '1']
     
 
 class DevelopmentConfig(Config):
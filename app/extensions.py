@@ -3,10 +3,17 @@ from flask_bcrypt import Bcrypt
 from flask_jwt_extended import JWTManager
 from flask_migrate import Migrate
 from flask_mail import Mail
+import redis
 
 # Create extension instances
 db = SQLAlchemy()
 bcrypt = Bcrypt()
 jwt = JWTManager()
 migrate = Migrate()
-mail = Mail()
\ No newline at end of file
+mail = Mail()
+
+# Shared Redis clients (session cache, RAG caches).
+# Kept here so auth-only workers can reach Redis without importing app.RAG.
+r = redis.Redis(host='localhost', port=6379, db=0, decode_responses=True)
+# Same server, but returns raw bytes (for binary blobs such as cached embeddings)
+r_raw = redis.Redis(host='localhost', port=6379, db=0)
\ No newline at end of file
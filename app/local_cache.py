@@ -0,0 +1,230 @@
+"""
+Per-process L1 cache in front of hot Redis data (user sessions, analyses).
+
+Entries expire after a short TTL and the least recently used are dropped
+past max_entries. A writer queues the PUBLISH of the key on the
+lex:cache:invalidate channel in the same MULTI pipeline as the write, so
+the other workers are told exactly when the write lands; once the pipeline
+has succeeded it updates its own copy. Workers drop a key when it arrives
+on the channel.
+
+A cache with a bus only serves hits while this process is subscribed to the
+channel. After a disconnect it is cleared, because invalidations may have
+been missed in between. Caches of immutable (content-addressed) values
+need no bus.
+
+Lives outside app.RAG so auth-only workers can use it.
+"""
+import os
+import copy
+import json
+import time
+import uuid
+import threading
+from collections import OrderedDict
+
+from app.extensions import r
+
+INVALIDATION_CHANNEL = "lex:cache:invalidate"
+L1_TTL_SECONDS = float(os.environ.get("LEX_L1_TTL", 10))
+L1_MAX_ENTRIES = int(os.environ.get("LEX_L1_MAX_ENTRIES", 1024))
+RECONNECT_SECONDS = 1.0
+
+_caches = []
+
+
+class InvalidationBus:
+    """Publishes invalidated keys and, in a listener thread, applies the ones other workers publish."""
+
+    def __init__(self, redis_client, channel: str = INVALIDATION_CHANNEL):
+        self.redis = redis_client
+        self.channel = channel
+        self.origin = None
+        self._pid = None
+        self._subscribed = threading.Event()
+        self._lock = threading.Lock()
+        self.counters = {"published": 0, "received": 0, "reconnects": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def ready(self) -> bool:
+        """True once this process is subscribed; starts the listener on first use (and after a fork)."""
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._pid = os.getpid()
+                    self.origin = uuid.uuid4().hex
+                    self._subscribed.clear()
+                    threading.Thread(target=self._listen, name="l1-invalidation", daemon=True).start()
+        return self._subscribed.is_set()
+
+    def _clear_all(self):
+        for cache in _caches:
+            if cache.bus is self:
+                cache.clear()
+
+    def _listen(self):
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                pubsub.subscribe(self.channel)
+                for message in pubsub.listen():
+                    if message["type"] == "subscribe":
+                        self._clear_all()     # Anything cached before now may have missed an invalidation
+                        self._subscribed.set()
+                    elif message["type"] == "message":
+                        self._apply(message["data"])
+            except Exception as e:
+                print(f"[L1Cache] Invalidation listener disconnected: {e}")
+            finally:
+                self._subscribed.clear()
+                self._clear_all()
+                try:
+                    pubsub.close()
+                except Exception:
+                    pass
+            self._count("reconnects")
+            time.sleep(RECONNECT_SECONDS)
+
+    def _apply(self, data):
+        try:
+            message = json.loads(data)
+        except ValueError:
+            return
+        if message.get("origin") == self.origin:
+            return
+        self._count("received")
+        for cache in _caches:
+            if cache.bus is self and cache.name == message.get("cache"):
+                cache.drop(message.get("key"))
+
+    def _message(self, cache_name: str, key: str) -> str:
+        return json.dumps({"origin": self.origin, "cache": cache_name, "key": key})
+
+    def queue(self, pipe, cache_name: str, key: str):
+        """Adds the invalidation to `pipe`, so it is sent atomically with the write."""
+        pipe.publish(self.channel, self._message(cache_name, key))
+        self._count("published")
+
+    def stats(self) -> dict:
+        with self._lock:
+            c = dict(self.counters)
+        return {**c, "subscribed": self._subscribed.is_set(), "channel": self.channel}
+
+
+class LocalCache:
+    """
+    Thread-safe TTL + LRU map of key -> value, one per kind of data.
+
+    Values are deep-copied in and out, so callers may mutate what they get.
+    A reader takes token() before reading Redis and passes it to put(); if
+    the key was invalidated in between, the (possibly stale) value is not
+    cached.
+    """
+
+    def __init__(self, name: str, bus: InvalidationBus = None, ttl: float = L1_TTL_SECONDS,
+                 max_entries: int = L1_MAX_ENTRIES, copy_values: bool = True):
+        self.name = name
+        self.bus = bus
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.copy_values = copy_values
+        self._entries = OrderedDict()   # key -> (expires at, value)
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0, "invalidations": 0, "bypassed": 0}
+        _caches.append(self)
+
+    def _copy(self, value):
+        return copy.deepcopy(value) if self.copy_values else value
+
+    def token(self) -> int:
+        return self._generation
+
+    def get(self, key):
+        key = str(key)
+        if self.ttl <= 0:
+            return None
+        if self.bus is not None and not self.bus.ready():
+            with self._lock:
+                self.counters["bypassed"] += 1
+            return None
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None and item[0] <= time.monotonic():
+                del self._entries[key]
+                self.counters["expired"] += 1
+                item = None
+            if item is None:
+                self.counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.counters["hits"] += 1
+            value = item[1]
+        return self._copy(value)
+
+    def put(self, key, value, token: int = None):
+        """Caches `value` unless the cache was invalidated since `token` was taken."""
+        key = str(key)
+        if self.ttl <= 0:
+            return
+        value = self._copy(value)
+        with self._lock:
+            if token is not None and token != self._generation:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.counters["evictions"] += 1
+
+    def publish(self, pipe, key):
+        """Queues the invalidation of `key` for the other workers on the write's MULTI `pipe`."""
+        if self.bus is not None:
+            self.bus.queue(pipe, self.name, str(key))
+
+    def update(self, key, apply):
+        """
+        After the write to `key` (and its publish()) has succeeded: applies
+        the same change to this worker's copy (`apply(value)` mutates it, if
+        cached).
+        """
+        with self._lock:
+            self._generation += 1
+            item = self._entries.get(str(key))
+            if item is not None:
+                apply(item[1])
+
+    def drop(self, key):
+        with self._lock:
+            self._generation += 1
+            if self._entries.pop(str(key), None) is not None:
+                self.counters["invalidations"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            c = dict(self.counters)
+            entries = len(self._entries)
+        lookups = c["hits"] + c["misses"] + c["bypassed"]
+        return {
+            **c,
+            "hit_rate": round(c["hits"] / lookups, 4) if lookups else 0.0,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+        }
+
+
+bus = InvalidationBus(r)
+
+
+def stats() -> dict:
+    """Hit ratios of every L1 cache in this process, plus the invalidation listener."""
+    return {"invalidation": bus.stats(), **{cache.name: cache.stats() for cache in _caches}}
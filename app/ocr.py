@@ -0,0 +1,148 @@
+"""
+OCR for scanned PDFs: page-range rasterisation streamed into a pool of
+tesseract worker processes.
+
+The PDF is written to a temporary file once, and each task rasterises and
+reads a small page range (PAGES_PER_TASK) from it, one page image at a time.
+Only a bounded number of tasks are in flight, so peak memory scales with
+the pages being worked on, not with the length of the document. Results
+are reassembled in page order.
+
+    LEX_OCR_DPI             rasterisation resolution (pdf2image's default is 200)
+    LEX_OCR_WORKERS         tesseract processes per app process (0 = OCR in-process)
+    LEX_OCR_PAGES_PER_TASK  pages per task
+    LEX_OCR_MAX_MEMORY_MB   budget for the page images in flight (and tesseract's
+                            working copies); fewer pages run at once, and the DPI
+                            is lowered if even one page would not fit
+
+Lives outside app.RAG so the (spawned) workers don't import the RAG stack.
+"""
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+
+OCR_DPI = int(os.environ.get("LEX_OCR_DPI", 200))
+OCR_WORKERS = int(os.environ.get("LEX_OCR_WORKERS", min(4, os.cpu_count() or 1)))
+OCR_PAGES_PER_TASK = int(os.environ.get("LEX_OCR_PAGES_PER_TASK", 2))
+OCR_MAX_MEMORY_MB = int(os.environ.get("LEX_OCR_MAX_MEMORY_MB", 512))
+MIN_DPI = 100
+# A grayscale page image is 1 byte per pixel; tesseract holds a few more copies of it
+BYTES_PER_PIXEL = 5
+DEFAULT_PAGE_SIZE_PTS = (595.0, 842.0)   # A4
+
+_page_size = re.compile(r"([\d.]+)\s*x\s*([\d.]+)")
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _init_worker():
+    # One tesseract thread per process; the pool provides the parallelism
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+
+
+def ocr_pages(pdf_path: str, first_page: int, last_page: int, dpi: int) -> list:
+    """Text of pages first_page..last_page (1-based, inclusive), rasterised one at a time."""
+    import pytesseract
+    from pdf2image import convert_from_path
+
+    texts = []
+    for page in range(first_page, last_page + 1):
+        images = convert_from_path(pdf_path, dpi=dpi, first_page=page, last_page=page, grayscale=True)
+        texts.extend(pytesseract.image_to_string(image) for image in images)
+        del images
+    return texts
+
+
+def _get_pool(workers: int):
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: the app process is multi-threaded
+            _pool = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn"), initializer=_init_worker
+            )
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def page_bytes(width_pts: float, height_pts: float, dpi: int) -> int:
+    """Estimated memory to rasterise and OCR one page."""
+    return int(width_pts / 72 * dpi) * int(height_pts / 72 * dpi) * BYTES_PER_PIXEL
+
+
+def plan(page_count: int, page_size_pts: tuple, dpi: int = OCR_DPI, workers: int = OCR_WORKERS,
+         pages_per_task: int = OCR_PAGES_PER_TASK, max_memory_mb: int = OCR_MAX_MEMORY_MB) -> dict:
+    """DPI, page ranges and tasks in flight for a document, within the memory budget."""
+    budget = max_memory_mb * 1024 * 1024
+    while dpi > MIN_DPI and page_bytes(*page_size_pts, dpi) > budget:
+        dpi -= 25
+    # Each task holds one page image at a time
+    in_flight = max(1, min(max(workers, 1), budget // page_bytes(*page_size_pts, dpi)))
+    pages_per_task = max(1, pages_per_task)
+    ranges = [
+        (first, min(first + pages_per_task - 1, page_count))
+        for first in range(1, page_count + 1, pages_per_task)
+    ]
+    return {"dpi": dpi, "in_flight": in_flight, "ranges": ranges}
+
+
+def pdf_layout(pdf_path: str):
+    """(page count, largest page size in points) from poppler's pdfinfo."""
+    from pdf2image import pdfinfo_from_path
+
+    info = pdfinfo_from_path(pdf_path)
+    match = _page_size.search(info.get("Page size", ""))
+    size = (float(match.group(1)), float(match.group(2))) if match else DEFAULT_PAGE_SIZE_PTS
+    # pdfinfo reports the first page; scans are almost always uniform
+    return int(info["Pages"]), size
+
+
+def ocr_pdf(pdf_bytes: bytes, dpi: int = OCR_DPI, workers: int = OCR_WORKERS,
+            pages_per_task: int = OCR_PAGES_PER_TASK, max_memory_mb: int = OCR_MAX_MEMORY_MB) -> list:
+    """Text of every page of a scanned PDF, in page order."""
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
+        f.write(pdf_bytes)
+        path = f.name
+    try:
+        page_count, size = pdf_layout(path)
+        p = plan(page_count, size, dpi, workers, pages_per_task, max_memory_mb)
+        print(f"  - OCR: {page_count} page(s) at {p['dpi']} DPI, {len(p['ranges'])} task(s), {p['in_flight']} at a time")
+
+        if workers <= 0:
+            return [text for first, last in p["ranges"] for text in ocr_pages(path, first, last, p["dpi"])]
+
+        pool = _get_pool(workers)
+        results, pending = {}, {}
+        ranges = iter(p["ranges"])
+        try:
+            while True:
+                while len(pending) < p["in_flight"]:
+                    page_range = next(ranges, None)
+                    if page_range is None:
+                        break
+                    pending[pool.submit(ocr_pages, path, *page_range, p["dpi"])] = page_range[0]
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[pending.pop(future)] = future.result()
+        except BrokenProcessPool:
+            _reset_pool()
+            raise
+        finally:
+            for future in pending:
+                future.cancel()
+        return [text for first in sorted(results) for text in results[first]]
+    finally:
+        os.unlink(path)
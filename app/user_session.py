@@ -0,0 +1,200 @@
+"""
+Per-user session cache in Redis.
+
+    lex:user:{id}:session   hash   analysis_hash, jurisdiction, chat_summary,
+                                   chat_turns, timestamp (values JSON-encoded)
+    lex:user:{id}:chat      list   chat messages (JSON), newest CHAT_MAX_MESSAGES
+
+Both keys share a TTL that every write refreshes. A request reads with one
+pipeline and writes with one MULTI pipeline, so a chat turn appends two list
+items and a few hash fields instead of rewriting the whole session.
+
+Session fields are also kept for a few seconds in a per-process L1 cache
+(app/local_cache.py); every write here invalidates the other workers' copies
+over pub/sub in the same MULTI pipeline, then updates this worker's copy. The chat list is always read from
+Redis.
+
+Sessions written before this layout are a single JSON string at
+lex:user:{id}. load() migrates such a key the first time it is read, and
+data/migrate_user_cache.py migrates all of them at once. The migration is a
+compare-and-set script, so it never overwrites a session written meanwhile.
+
+Lives outside app.RAG so auth-only workers (/user/profile) can read it.
+"""
+import os
+import json
+from datetime import datetime
+
+from app.extensions import r
+from app.local_cache import LocalCache, bus
+
+SESSION_TTL_SECONDS = 86400   # 24-hour expiry
+CHAT_MAX_MESSAGES = int(os.environ.get("LEX_CHAT_MAX_MESSAGES", 200))
+
+DEFAULT_SESSION = {
+    "analysis_hash": None, "jurisdiction": None, "chat_summary": None, "chat_turns": 0, "timestamp": None
+}
+
+session_cache = LocalCache("session", bus)
+
+# Writes the new layout only if the legacy value is still the one that was read
+# and no new-layout session exists yet; then deletes the legacy key.
+# ARGV: legacy value, TTL, number of field pairs, field/value pairs..., chat messages...
+_MIGRATE_LUA = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] or redis.call('EXISTS', KEYS[2]) == 1 then
+    return 0
+end
+local n = tonumber(ARGV[3])
+redis.call('DEL', KEYS[3])
+redis.call('HSET', KEYS[2], unpack(ARGV, 4, 3 + 2 * n))
+if #ARGV > 3 + 2 * n then
+    redis.call('RPUSH', KEYS[3], unpack(ARGV, 4 + 2 * n, #ARGV))
+end
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+redis.call('EXPIRE', KEYS[3], ARGV[2])
+redis.call('DEL', KEYS[1])
+return 1
+"""
+_migrate = r.register_script(_MIGRATE_LUA)
+
+
+def legacy_key(user_id) -> str:
+    return f"lex:user:{user_id}"
+
+
+def session_key(user_id) -> str:
+    return f"lex:user:{user_id}:session"
+
+
+def chat_key(user_id) -> str:
+    return f"lex:user:{user_id}:chat"
+
+
+def workspace_key(user_id) -> str:
+    """Index of the user's analysed documents (app/RAG/workspace.py)."""
+    return f"lex:user:{user_id}:workspace"
+
+
+def _encode(fields: dict) -> dict:
+    return {name: json.dumps(value) for name, value in fields.items()}
+
+
+def _decode(raw: dict) -> dict:
+    return {name: json.loads(value) for name, value in raw.items()}
+
+
+def _expire(pipe, user_id):
+    pipe.expire(session_key(user_id), SESSION_TTL_SECONDS)
+    pipe.expire(chat_key(user_id), SESSION_TTL_SECONDS)
+
+
+def _written(user_id, fields: dict, drop: tuple = ()):
+    """Mirrors a successful session write in this worker's L1 copy."""
+    def apply(session):
+        session.update(fields)
+        for name in drop:
+            session.pop(name, None)
+    session_cache.update(user_id, apply)
+
+
+def load(user_id, with_chat: bool = False) -> dict:
+    """
+    The user's session fields; with `with_chat`, also "chat_history" (the
+    stored messages). Reads the chat list only when asked for it.
+    """
+    session = session_cache.get(user_id)
+    if session is not None:
+        if with_chat:
+            session["chat_history"] = [json.loads(m) for m in r.lrange(chat_key(user_id), 0, -1)]
+        return session
+
+    token = session_cache.token()
+    pipe = r.pipeline(transaction=False)
+    pipe.hgetall(session_key(user_id))
+    pipe.get(legacy_key(user_id))
+    if with_chat:
+        pipe.lrange(chat_key(user_id), 0, -1)
+    results = pipe.execute()
+    raw, legacy = results[0], results[1]
+
+    if not raw and legacy:
+        migrated = migrate(user_id, legacy)
+        if migrated is None:   # Migrated (or rewritten) by someone else in the meantime
+            return load(user_id, with_chat)
+        session, history = migrated
+    else:
+        session = {**DEFAULT_SESSION, **_decode(raw)}
+        history = [json.loads(m) for m in results[2]] if with_chat else None
+        session_cache.put(user_id, session, token)
+    if with_chat:
+        session["chat_history"] = history
+    return session
+
+
+def save(user_id, fields: dict, drop: tuple = ()):
+    """Sets `fields` (and the timestamp), deletes `drop` and refreshes the TTL, in one round trip."""
+    fields = {**fields, "timestamp": datetime.now().timestamp()}
+    pipe = r.pipeline()
+    pipe.hset(session_key(user_id), mapping=_encode(fields))
+    if drop:
+        pipe.hdel(session_key(user_id), *drop)
+    _expire(pipe, user_id)
+    session_cache.publish(pipe, user_id)
+    pipe.execute()
+    _written(user_id, fields, drop)
+    return fields
+
+
+def append_chat(user_id, session: dict, history: list, fields: dict = None):
+    """
+    Stores the conversation after a turn. `history` is the full history the
+    client sent plus the reply; only the messages the list doesn't have yet
+    are pushed. A history shorter than the stored one is a new conversation
+    and replaces the list.
+    """
+    stored = session.get("chat_turns") or 0
+    fields = {**(fields or {}), "chat_turns": len(history), "timestamp": datetime.now().timestamp()}
+
+    pipe = r.pipeline()
+    if stored > len(history):
+        pipe.delete(chat_key(user_id))
+        new = history
+    else:
+        new = history[stored:]
+    new = new[-CHAT_MAX_MESSAGES:]
+    if new:
+        pipe.rpush(chat_key(user_id), *(json.dumps(m) for m in new))
+        pipe.ltrim(chat_key(user_id), -CHAT_MAX_MESSAGES, -1)
+    pipe.hset(session_key(user_id), mapping=_encode(fields))
+    _expire(pipe, user_id)
+    session_cache.publish(pipe, user_id)
+    pipe.execute()
+    _written(user_id, fields)
+    session.update(fields)
+
+
+def workspace_size(user_id) -> int:
+    return r.zcard(workspace_key(user_id))
+
+
+def migrate(user_id, legacy_json: str):
+    """
+    Rewrites one legacy JSON-string session in the new layout and deletes it.
+    Returns (session fields, chat history), or None if the legacy key changed
+    or a new-layout session already exists (nothing is written then).
+    """
+    data = json.loads(legacy_json)
+    history = (data.pop("chat_history", None) or [])[-CHAT_MAX_MESSAGES:]
+    session = {**DEFAULT_SESSION, **data, "chat_turns": len(history)}
+
+    fields = [item for pair in _encode(session).items() for item in pair]
+    migrated = _migrate(
+        keys=[legacy_key(user_id), session_key(user_id), chat_key(user_id)],
+        args=[legacy_json, SESSION_TTL_SECONDS, len(session), *fields, *(json.dumps(m) for m in history)]
+    )
+    if not migrated:
+        return None
+    # No worker can hold a copy to invalidate: the session key did not exist
+    # and a legacy session is never cached
+    session_cache.drop(user_id)
+    return session, history
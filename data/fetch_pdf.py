@@ -1,4 +1,4 @@
-import os, json, time, zipfile, logging
+import os, re, json, time, zipfile, logging
 from urllib.parse import urljoin
 import requests
 from bs4 import BeautifulSoup
@@ -18,7 +18,7 @@ session = requests.Session()
 session.headers.update({
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
                   "AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124 Safari/537.36"
-})`1`
+})
 
 def get_soup(url):
     for _ in range(3):
@@ -43,12 +43,15 @@ def find_year_links(base):
     return year_links
 
 def find_act_links(year_url):
+    """Returns [(act_url, act_title, act_year)] listed on one year page."""
     soup = get_soup(year_url)
     if not soup:
         return []
+    year_match = re.search(r"value=(\d{4})", year_url)
+    year = int(year_match.group(1)) if year_match else None
     acts = []
     for a in soup.select("table.panel a[href*='/handle/123456789/']"):
-        acts.append(urljoin(BASE_URL, a["href"]))
+        acts.append((urljoin(BASE_URL, a["href"]), a.get_text(strip=True), year))
     return acts
 
 def find_pdf_link(act_url):
@@ -80,16 +83,21 @@ def scrape(base_url, label="central"):
     year_links = find_year_links(base_url)
     logging.info(f"✅ Found {len(year_links)} year pages.")
 
-    all_acts = []
+    all_acts = {}
     for y in tqdm(year_links, desc=f"{label}-years"):
-        acts = find_act_links(y)
-        all_acts.extend(acts)
+        for act_url, title, year in find_act_links(y):
+            all_acts[act_url] = (title, year)
 
     logging.info(f"📜 Found {len(all_acts)} act pages in {label} category.")
     downloaded = 0
 
-    for act_url in tqdm(sorted(set(all_acts)), desc=f"{label}-acts"):
+    for act_url in tqdm(sorted(all_acts), desc=f"{label}-acts"):
+        title, year = all_acts[act_url]
+        # Catalog fields used by ingest.py for metadata-partitioned retrieval
+        details = {"jurisdiction": label, "title": title, "year": year}
+
         if act_url in manifest and manifest[act_url].get("downloaded"):
+            manifest[act_url].update({k: v for k, v in details.items() if v})
             continue
         pdf_url = find_pdf_link(act_url)
         if not pdf_url:
@@ -98,16 +106,18 @@ def scrape(base_url, label="central"):
         fname = os.path.basename(pdf_url.split("/")[-1])
         out = os.path.join(OUT_DIR, fname)
         if os.path.exists(out):
-            manifest[act_url] = {"downloaded": out, "pdf": pdf_url}
+            manifest[act_url] = {"downloaded": out, "pdf": pdf_url, **details}
             continue
 
         if download_pdf(pdf_url, out):
-            manifest[act_url] = {"downloaded": out, "pdf": pdf_url}
+            manifest[act_url] = {"downloaded": out, "pdf": pdf_url, **details}
             downloaded += 1
             with open(MANIFEST, "w") as f:
                 json.dump(manifest, f, indent=2)
             time.sleep(1)
 
+    with open(MANIFEST, "w") as f:
+        json.dump(manifest, f, indent=2)
     logging.info(f"✅ Downloaded {downloaded} new {label} acts.")
 
 def main():
@@ -1,11 +1,18 @@
 import os
+import sys
+import re
+import json
 import chromadb
+import redis
 from dotenv import load_dotenv
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.document_loaders import PyPDFLoader
 from sentence_transformers import SentenceTransformer
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from app.RAG.act_names import act_key
+
 print("Loading environment variables...")
 load_dotenv()
 
@@ -13,16 +20,124 @@ load_dotenv()
 CHROMA_PATH = "chroma_db"
 COLLECTION_NAME = "legal_india_bge_m3"
 PDF_SOURCE_DIR = "data/All_Acts_PDFs"
+SECTION_INDEX_PATH = os.path.join(CHROMA_PATH, "section_index.json")
+ACT_CATALOG_PATH = os.path.join(CHROMA_PATH, "act_catalog.json")
+MANIFEST_PATH = "data/manifest.json"   # Written by data/fetch_pdf.py
+
+# Same shapes as the "CHAPTER" and "1. " separators below.
+# A section heading is a number at the start of a line followed by a capitalised title.
+SECTION_HEADING_RE = re.compile(r"(?:^|\n)\s*(\d{1,3}[A-Z]?)\.\s+[A-Z\[]")
+ACT_TITLE_RE = re.compile(r"THE\s+([A-Z][A-Z0-9 ,()&'\-]+?\s+ACT),?\s*(\d{4})")
+# Cached retrieval results are stamped with this counter (see app/RAG/retrieval_cache.py)
+INDEX_VERSION_KEY = f"lex:index:version:{COLLECTION_NAME}"
+MAX_CHUNKS_PER_SECTION = 3   # Heading chunk + continuation chunks of long sections
+ARRANGEMENT_HEADINGS = 8     # More headings than this in one chunk = table of contents
+
+# If the shared embedding worker is running, encode through it instead of
+# loading a second copy of bge-m3 (see app/RAG/embedding_server.py).
+EMBEDDING_SOCKET = os.environ.get("LEX_EMBEDDING_SOCKET")
+
+if EMBEDDING_SOCKET:
+    from app.RAG.embedding_client import EmbeddingClient
+
+    EMBEDDING_MODEL = EmbeddingClient(EMBEDDING_SOCKET)
+    server_backend = EMBEDDING_MODEL.stats().get("backend")
+    if server_backend != "torch":
+        # The index is the full-precision reference; never build it from a quantised model
+        raise SystemExit(f"Embedding server runs the '{server_backend}' backend; ingest needs 'torch' (fp32).")
+    print(f"Using shared embedding server at {EMBEDDING_SOCKET}.")
+else:
+    # Load the local model (runs once)
+    print("Loading bge-m3 model... (This may take a moment)")
+    EMBEDDING_MODEL = SentenceTransformer('BAAI/bge-m3', device='cpu')
+    print("Model loaded.")
+
+def bump_index_version(r):
+    """Invalidates the app's retrieval cache after the collection changes."""
+    try:
+        version = r.incr(INDEX_VERSION_KEY)
+        print(f"Index version bumped to {version}.")
+    except Exception as e:
+        print(f"WARNING: Could not bump index version in Redis ({e}). Cached retrievals may be stale.")
+
+
+def detect_act_title(texts, fallback_title):
+    """Act title and year from the cover page, e.g. ("The Transfer Of Property Act", 1882)."""
+    match = ACT_TITLE_RE.search(" ".join(texts[:3]))
+    if match:
+        return "The " + match.group(1).title(), int(match.group(2))
+    return fallback_title, None
+
+
+def index_sections(texts, ids):
+    """Maps each numbered section of one act to the chunk(s) that hold it."""
+    sections = {}
+    current = None
+    for text, chunk_id in zip(texts, ids):
+        headings = SECTION_HEADING_RE.findall(text)
+        if len(headings) > ARRANGEMENT_HEADINGS:
+            continue   # "ARRANGEMENT OF SECTIONS" page, not the section bodies
+        if headings:
+            for number in headings:
+                sections.setdefault(number, [chunk_id])
+            current = headings[-1]
+        elif current and len(sections[current]) < MAX_CHUNKS_PER_SECTION:
+            sections[current].append(chunk_id)
+
+    return sections
+
+
+def load_section_index():
+    if os.path.exists(SECTION_INDEX_PATH):
+        with open(SECTION_INDEX_PATH) as f:
+            return json.load(f)
+    return {"acts": {}, "sections": {}}
+
+
+def save_section_index(section_index):
+    os.makedirs(CHROMA_PATH, exist_ok=True)
+    with open(SECTION_INDEX_PATH, "w") as f:
+        json.dump(section_index, f)
+
+
+def load_manifest_details():
+    """{pdf filename: {"jurisdiction", "title", "year", "url"}} from the scraper manifest."""
+    if not os.path.exists(MANIFEST_PATH):
+        print(f"WARNING: {MANIFEST_PATH} not found; jurisdiction will be 'unknown'.")
+        return {}
+    with open(MANIFEST_PATH) as f:
+        manifest = json.load(f)
+    return {
+        os.path.basename(entry["downloaded"]): {
+            "jurisdiction": entry.get("jurisdiction"),
+            "title": entry.get("title"),
+            "year": entry.get("year"),
+            "url": act_url,
+        }
+        for act_url, entry in manifest.items()
+        if entry.get("downloaded")
+    }
+
+
+def load_act_catalog():
+    if os.path.exists(ACT_CATALOG_PATH):
+        with open(ACT_CATALOG_PATH) as f:
+            return json.load(f)
+    return {}
+
+
+def save_act_catalog(act_catalog):
+    os.makedirs(CHROMA_PATH, exist_ok=True)
+    with open(ACT_CATALOG_PATH, "w") as f:
+        json.dump(act_catalog, f, indent=2)
 
-# Load the local model (runs once)
-print("Loading bge-m3 model... (This may take a moment)")
-EMBEDDING_MODEL = SentenceTransformer('BAAI/bge-m3', device='cpu')
-print("Model loaded.")
 
 def main():
     print("--- Starting Intelligent Ingestion Process ---")
     
     client = chromadb.PersistentClient(path=CHROMA_PATH)
+    # One connection for the whole run, reused by every version bump
+    redis_client = redis.Redis(host='localhost', port=6379, db=0)
     
     collection = client.get_or_create_collection(
         name=COLLECTION_NAME,
@@ -60,6 +175,9 @@ def main():
     print(f"Found {len(pdf_files)} PDF files to process.")
     
     total_chunks_processed = 0
+    section_index = load_section_index()
+    act_catalog = load_act_catalog()
+    manifest_details = load_manifest_details()
 
     for pdf_file in pdf_files:
         print(f"\n--- Processing: {pdf_file.name} ---")
@@ -75,13 +193,28 @@ def main():
             print(f"Split into {len(pages)} semantic chunks.")
             
             texts = [chunk.page_content for chunk in pages]
+
+            # Act-level details: the scraper manifest first, the cover page as fallback
+            details = manifest_details.get(pdf_file.name, {})
+            detected_title, detected_year = detect_act_title(texts, pdf_file.stem)
+            act = {
+                "title": details.get("title") or detected_title,
+                "year": details.get("year") or detected_year,
+                "jurisdiction": details.get("jurisdiction") or "unknown",
+                "url": details.get("url"),
+            }
+            act_catalog[pdf_file.name] = act
             
             # Add the source filename as metadata (critical for citations)
+            # plus act details so retrieval can be scoped with `where` filters
             metadatas = [
                 {
                     # Get just the filename (e.g., "197504.pdf")
                     "source": Path(chunk.metadata.get('source', str(pdf_file.name))).name,
-                    "page": chunk.metadata.get('page', 0)
+                    "page": chunk.metadata.get('page', 0),
+                    "jurisdiction": act["jurisdiction"],
+                    "act_title": act["title"],
+                    "act_year": int(act["year"] or 0)   # Chroma metadata can't hold None
                 } 
                 for chunk in pages
             ]
@@ -101,6 +234,16 @@ def main():
                 ids=ids
             )
             
+            bump_index_version(redis_client)
+
+            # Record "Section N of Act X" -> chunk ids for exact citation lookups
+            sections = index_sections(texts, ids)
+            key = act_key(act["title"])
+            section_index["acts"][key] = {"title": act["title"], "year": act["year"], "source": pdf_file.name}
+            for number, chunk_ids in sections.items():
+                section_index["sections"][f"{key}|{number}"] = chunk_ids
+            print(f"Indexed {len(sections)} sections of '{act['title']}' ({act['jurisdiction']}).")
+
             print(f"Successfully processed and stored {pdf_file.name}.")
             total_chunks_processed += len(pages)
 
@@ -109,9 +252,14 @@ def main():
             print(f"!!!!!!!! FAILED to process {pdf_file.name}: {e} !!!!!")
             print("Skipping this file.")
 
+    save_section_index(section_index)
+    save_act_catalog(act_catalog)
+
     print("\n--- Ingestion Complete ---")
     print(f"Total chunks processed: {total_chunks_processed}")
     print(f"Data stored in collection: {COLLECTION_NAME}")
+    print(f"Section index: {len(section_index['sections'])} sections -> {SECTION_INDEX_PATH}")
+    print(f"Act catalog: {len(act_catalog)} acts -> {ACT_CATALOG_PATH}")
     print(f"Vector Database setup is now COMPLETE.")
 
 if __name__ == "__main__":
@@ -0,0 +1,71 @@
+"""
+Moves every user session from the old single JSON string (lex:user:{id})
+to the hash + list layout of app/user_session.py.
+
+Sessions are also migrated lazily the first time they are read, so this is
+only needed to convert idle sessions (e.g. before dropping the fallback).
+Each session is converted by one compare-and-set script (see
+user_session.migrate), so it is safe to run while the app is serving: a
+session the app migrated or wrote in the meantime is skipped.
+
+Run from backend/:
+    python data/migrate_user_cache.py [--dry-run]
+"""
+import sys
+import argparse
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+BACKEND_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_ROOT))
+load_dotenv()
+
+from app import user_session
+from app.extensions import r
+
+SCAN_BATCH = 500
+
+
+def legacy_sessions():
+    """(user_id, key) for every old-layout session; new-layout keys have a suffix."""
+    for key in r.scan_iter(match="lex:user:*", count=SCAN_BATCH):
+        parts = key.split(":")
+        if len(parts) == 3 and r.type(key) == "string":
+            yield parts[2], key
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate user sessions to the hash + list layout.")
+    parser.add_argument("--dry-run", action="store_true", help="Only count the sessions to migrate.")
+    args = parser.parse_args()
+
+    migrated = skipped = failed = 0
+    for user_id, key in legacy_sessions():
+        if args.dry_run:
+            migrated += 1
+            continue
+        legacy = r.get(key)
+        if legacy is None:   # Read (and migrated) by the app in the meantime, or expired
+            skipped += 1
+            continue
+        try:
+            migrated = user_session.migrate(user_id, legacy)
+        except Exception as e:
+            print(f"  - {key}: FAILED ({e})")
+            failed += 1
+            continue
+        if migrated is None:   # A new-layout session exists, or the legacy value changed
+            print(f"  - {key}: skipped (session already in the new layout)")
+            skipped += 1
+            continue
+        _, history = migrated
+        migrated += 1
+        print(f"  - {key}: {len(history)} chat message(s)")
+
+    verb = "to migrate" if args.dry_run else "migrated"
+    print(f"Done. {migrated} session(s) {verb}, {skipped} skipped, {failed} failed.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Trains the zstd dictionary used by app/RAG/cache_codec.py and publishes it
+in Redis, where every worker picks it up on its next start.
+
+Samples are the legal text already in Chroma (consecutive chunks joined into
+document-sized pieces) plus, with --include-cache, the documents and results
+currently in the analysis cache. Each sample is encoded exactly as the codec
+stores it (orjson) so the dictionary learns the real byte patterns.
+
+Entries written with an older dictionary stay readable: dictionaries are
+kept under their own id and only lex:codec:dict:current is switched.
+
+Run from backend/:
+    python data/train_cache_dictionary.py [--include-cache] [--dict-bytes 112640] [--dry-run]
+"""
+import sys
+import random
+import argparse
+from pathlib import Path
+
+import chromadb
+import orjson
+import zstandard
+from dotenv import load_dotenv
+
+BACKEND_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_ROOT))
+load_dotenv()
+
+from app.extensions import r_raw
+from app.RAG.cache_codec import CacheCodec, DICT_KEY_FORMAT, CURRENT_DICT_KEY
+
+CHROMA_PATH = BACKEND_ROOT / "chroma_db"
+COLLECTION_NAME = "legal_india_bge_m3"
+ANALYSIS_PREFIX = "lex:analysis:"
+CHUNKS_PER_SAMPLE = 4
+MAX_SAMPLES = 4000
+
+
+def corpus_samples(limit: int) -> list:
+    collection = chromadb.PersistentClient(path=str(CHROMA_PATH)).get_collection(COLLECTION_NAME)
+    documents = []
+    for offset in range(0, collection.count(), 5000):
+        documents.extend(collection.get(limit=5000, offset=offset, include=["documents"])["documents"])
+    pieces = [
+        "\n\n".join(documents[i:i + CHUNKS_PER_SAMPLE])
+        for i in range(0, len(documents), CHUNKS_PER_SAMPLE)
+    ]
+    random.Random(0).shuffle(pieces)
+    return [orjson.dumps(piece) for piece in pieces[:limit]]
+
+
+def cache_samples(limit: int) -> list:
+    codec = CacheCodec(r_raw)
+    samples = []
+    for key in r_raw.scan_iter(match=f"{ANALYSIS_PREFIX}*", count=500):
+        if len(samples) >= limit:
+            break
+        if key == b"lex:analysis:lru":
+            continue
+        entry = r_raw.hmget(key, "document", "result")
+        if entry[0] and entry[1]:
+            samples.append(orjson.dumps(codec.decode(entry[0], legacy="text")))
+            samples.append(orjson.dumps(codec.decode(entry[1])))
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train and publish the cache codec's zstd dictionary.")
+    parser.add_argument("--dict-bytes", type=int, default=112640, help="Dictionary size (zstd's default 110 KB).")
+    parser.add_argument("--max-samples", type=int, default=MAX_SAMPLES)
+    parser.add_argument("--include-cache", action="store_true", help="Also sample the analysis cache.")
+    parser.add_argument("--dry-run", action="store_true", help="Train and report, but don't publish.")
+    args = parser.parse_args()
+
+    samples = corpus_samples(args.max_samples)
+    if args.include_cache:
+        samples += cache_samples(args.max_samples)
+    if len(samples) < 10:
+        sys.exit("Not enough samples to train a dictionary; run data/ingest.py first.")
+    print(f"Training on {len(samples)} samples ({sum(map(len, samples)) / 1e6:.1f} MB)...")
+
+    dictionary = zstandard.train_dictionary(args.dict_bytes, samples)
+    dict_id = dictionary.dict_id()
+    data = dictionary.as_bytes()
+
+    # Quick check on part of the training data (test/bench_cache_codec.py measures held-out data)
+    check = samples[:200]
+    raw = sum(map(len, check))
+    plain = sum(len(zstandard.ZstdCompressor(level=3).compress(s)) for s in check)
+    with_dict = sum(len(zstandard.ZstdCompressor(level=3, dict_data=dictionary).compress(s)) for s in check)
+    print(f"Dictionary {dict_id}: {len(data)} bytes. On {len(check)} samples: "
+          f"{raw} -> {plain} bytes (zstd), {with_dict} bytes (zstd + dictionary)")
+
+    if args.dry_run:
+        print("Dry run; not published.")
+        return
+    pipe = r_raw.pipeline()
+    pipe.set(DICT_KEY_FORMAT.format(dict_id), data)
+    pipe.set(CURRENT_DICT_KEY, dict_id)
+    pipe.execute()
+    print(f"Published as {DICT_KEY_FORMAT.format(dict_id)}; workers switch to it within "
+          f"LEX_CODEC_DICT_REFRESH_SECONDS.")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,7 +6,8 @@ load_dotenv()
 from app import create_app
 
 config_name = os.getenv('FLASK_CONFIG') or "default"
-app = create_app(config_name)
+app_role = os.getenv('LEX_APP_ROLE') or "all"   # "auth", "rag" or "all"
+app = create_app(config_name, role=app_role)
 
 if __name__ == "__main__":
     app.run(debug = True)
\ No newline at end of file
@@ -0,0 +1,139 @@
+# in backend/test/bench_cache_codec.py
+#
+# Stored size and encode/decode time of cached analyses (document text +
+# result JSON) in the old format (plain text + json.dumps) against the cache
+# codec: orjson, orjson + zstd, and orjson + zstd with a trained dictionary.
+#
+# Documents are consecutive chunks of the legal corpus in Chroma; results are
+# built from them in the analyzer's shape. Without a chroma_db, synthetic
+# contract text is used instead. The dictionary is trained on a separate
+# split from the one measured.
+
+import sys
+import json
+import time
+import random
+from pathlib import Path
+
+import zstandard
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+BACKEND_ROOT = SCRIPT_DIR.parent
+sys.path.insert(0, str(BACKEND_ROOT))
+
+from app.RAG.cache_codec import CacheCodec
+
+CHROMA_PATH = BACKEND_ROOT / "chroma_db"
+COLLECTION_NAME = "legal_india_bge_m3"
+NUM_DOCUMENTS = 400
+TRAIN_FRACTION = 0.5
+DICT_BYTES = 112640
+REPEATS = 5
+
+CLAUSES = [
+    "The Tenant shall pay to the Landlord a monthly rent of Rs. {n},000/- on or before the {d}th day of each month.",
+    "The Employee shall not, during the term of employment and for {n} months thereafter, engage in any competing business.",
+    "Either party may terminate this Agreement by giving {n} days' prior written notice to the other party.",
+    "The security deposit of Rs. {n},000/- shall be refunded within {d} days of the termination of this Agreement.",
+    "Any dispute arising out of this Agreement shall be referred to arbitration under the Arbitration and Conciliation Act, 1996.",
+    "The Licensee shall not sub-let, assign or part with the possession of the premises without prior written consent.",
+    "This Agreement shall be governed by the laws of India and the courts at {city} shall have exclusive jurisdiction.",
+    "The rent shall be increased by {n}% every year on the anniversary of the commencement date.",
+]
+CITIES = ["Mumbai", "New Delhi", "Bengaluru", "Chennai", "Pune", "Kolkata"]
+
+
+def corpus_documents(rng):
+    try:
+        import chromadb
+        collection = chromadb.PersistentClient(path=str(CHROMA_PATH)).get_collection(COLLECTION_NAME)
+        chunks = collection.get(limit=20000, include=["documents"])["documents"]
+    except Exception as e:
+        print(f"No Chroma corpus ({e}); using synthetic contracts.")
+        chunks = []
+
+    documents = []
+    for _ in range(NUM_DOCUMENTS):
+        if chunks:
+            start = rng.randrange(len(chunks))
+            documents.append("\n\n".join(chunks[start:start + rng.randint(2, 24)]))
+        else:
+            clauses = [
+                rng.choice(CLAUSES).format(n=rng.randint(1, 99), d=rng.randint(1, 28), city=rng.choice(CITIES))
+                for _ in range(rng.randint(10, 150))
+            ]
+            documents.append("\n".join(f"{i}. {c}" for i, c in enumerate(clauses, 1)))
+    return documents
+
+
+def analysis_for(document: str, rng) -> dict:
+    lines = [line for line in document.splitlines() if len(line) > 40] or [document[:200]]
+    return {
+        "summary": " ".join(lines[:3])[:800],
+        "red_flags": [
+            {
+                "clause_text": line[:300],
+                "concern": "This clause may be unfavourable to you; check the notice period and the amounts involved.",
+                "context_source": rng.choice(["A1872-09.pdf", "A1996-26.pdf", "General Concern"]),
+            }
+            for line in rng.sample(lines, min(len(lines), rng.randint(1, 6)))
+        ],
+    }
+
+
+class LegacyFormat:
+    """What the cache stored before the codec: the text as is and json.dumps(result)."""
+
+    def encode(self, value) -> bytes:
+        return (value if isinstance(value, str) else json.dumps(value)).encode("utf-8")
+
+    def decode(self, data, legacy="json"):
+        text = data.decode("utf-8")
+        return json.loads(text) if legacy == "json" else text
+
+
+def measure(codec, entries):
+    encode_s, decode_s = 0.0, 0.0
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        blobs = [(codec.encode(doc), codec.encode(result)) for doc, result in entries]
+        encode_s += time.perf_counter() - start
+        start = time.perf_counter()
+        for doc_blob, result_blob in blobs:
+            codec.decode(doc_blob, legacy="text")
+            codec.decode(result_blob)
+        decode_s += time.perf_counter() - start
+    stored = sum(len(a) + len(b) for a, b in blobs)
+    per_entry = 1e6 / (REPEATS * len(entries))
+    return stored, encode_s * per_entry, decode_s * per_entry
+
+
+def main():
+    rng = random.Random(0)
+    documents = corpus_documents(rng)
+    entries = [(doc, analysis_for(doc, rng)) for doc in documents]
+    split = int(len(entries) * TRAIN_FRACTION)
+    train, test = entries[:split], entries[split:]
+
+    codec = CacheCodec(min_bytes=10 ** 12)   # Never compresses: orjson only
+    samples = [codec.encode(value)[1:] for doc, result in train for value in (doc, result)]
+    dictionary = zstandard.train_dictionary(DICT_BYTES, samples).as_bytes()
+
+    formats = {
+        "json (current)": LegacyFormat(),
+        "orjson": CacheCodec(min_bytes=10 ** 12),
+        "orjson+zstd": CacheCodec(),
+        "orjson+zstd+dict": CacheCodec(dictionary=dictionary),
+    }
+
+    print(f"{len(test)} cached analyses, mean document {sum(len(d) for d, _ in test) / len(test) / 1024:.1f} KB\n")
+    print(f"{'format':<20} {'stored KB':>10} {'vs current':>11} {'encode us':>10} {'decode us':>10}")
+    baseline = None
+    for name, fmt in formats.items():
+        stored, encode_us, decode_us = measure(fmt, test)
+        baseline = baseline or stored
+        print(f"{name:<20} {stored / 1024:>10.1f} {stored / baseline:>10.1%} {encode_us:>10.1f} {decode_us:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+# in backend/test/bench_ocr.py
+#
+# OCR of synthetic scanned PDFs (pages are images only, no text layer): the
+# old path (convert_from_bytes on the whole PDF, then tesseract page by page)
+# against app/ocr.py in-process and with 1, 2 and 4 worker processes.
+#
+# Each scenario runs in a fresh interpreter and reports wall time, the peak
+# RSS of the app process, the largest child (pdftoppm / tesseract / pool
+# worker) and whether every page came back, in order. Needs tesseract and
+# poppler on the PATH.
+#
+#     python test/bench_ocr.py [--pages 50] [--dpi 200]
+
+import sys
+import json
+import random
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+BACKEND_ROOT = SCRIPT_DIR.parent
+SCAN_DPI = 150
+A4_INCHES = (8.27, 11.69)
+
+LINES = [
+    "This Deed of Sale is made and executed at {city} on this {d}th day of the month.",
+    "The Vendor is the absolute owner of the property bearing Survey No. {n}/{d}.",
+    "The Purchaser has paid a total consideration of Rs. {n},00,000/- to the Vendor.",
+    "The Vendor hereby covenants that the property is free from all encumbrances.",
+    "All stamp duty and registration charges shall be borne by the Purchaser.",
+    "The Vendor shall hand over vacant and peaceful possession within {d} days.",
+]
+CITIES = ["Mumbai", "Pune", "Chennai", "Bengaluru", "Kolkata", "New Delhi"]
+
+RUN_SNIPPET = """
+import json, resource, sys, time
+sys.path.insert(0, {root!r})
+pdf_bytes = open({pdf!r}, "rb").read()
+start = time.perf_counter()
+if {workers} is None:
+    import pytesseract
+    from pdf2image import convert_from_bytes
+    texts = [pytesseract.image_to_string(image) for image in convert_from_bytes(pdf_bytes, dpi={dpi})]
+else:
+    from app.ocr import ocr_pdf
+    texts = ocr_pdf(pdf_bytes, dpi={dpi}, workers={workers})
+print(json.dumps({{
+    "seconds": time.perf_counter() - start,
+    "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "child_rss_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+    "texts": texts,
+}}))
+"""
+
+SCENARIOS = [
+    ("old (all pages, serial)", None),
+    ("ocr.py in-process", 0),
+    ("ocr.py 1 worker", 1),
+    ("ocr.py 2 workers", 2),
+    ("ocr.py 4 workers", 4),
+]
+
+
+def scanned_page(number: int, rng) -> Image.Image:
+    size = (int(A4_INCHES[0] * SCAN_DPI), int(A4_INCHES[1] * SCAN_DPI))
+    page = Image.new("L", size, 255)
+    draw = ImageDraw.Draw(page)
+    try:
+        font = ImageFont.load_default(size=22)
+    except TypeError:   # Pillow without FreeType
+        font = ImageFont.load_default()
+    draw.text((90, 80), f"PAGE {number}", fill=0, font=font)
+    y = 140
+    while y < size[1] - 120:
+        line = rng.choice(LINES).format(n=rng.randint(10, 99), d=rng.randint(1, 28), city=rng.choice(CITIES))
+        draw.text((90, y), line, fill=rng.randint(0, 60), font=font)
+        y += 38
+    # A slightly skewed, blurred, speckled scan
+    page = page.rotate(rng.uniform(-0.8, 0.8), fillcolor=255, resample=Image.BICUBIC)
+    page = page.filter(ImageFilter.GaussianBlur(0.6))
+    pixels = page.load()
+    for _ in range(size[0] * size[1] // 400):
+        pixels[rng.randrange(size[0]), rng.randrange(size[1])] = rng.randint(0, 120)
+    return page
+
+
+def synthetic_pdf(path: Path, pages: int):
+    rng = random.Random(0)
+    images = [scanned_page(i, rng) for i in range(1, pages + 1)]
+    images[0].save(path, save_all=True, append_images=images[1:], resolution=SCAN_DPI)
+
+
+def pages_in_order(texts, pages: int) -> bool:
+    found = [int(word) for text in texts for prev, word in zip(text.split(), text.split()[1:])
+             if prev == "PAGE" and word.isdigit()]
+    return found == list(range(1, pages + 1))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark OCR of scanned PDFs.")
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--dpi", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf = Path(tmp) / "scanned.pdf"
+        synthetic_pdf(pdf, args.pages)
+        print(f"{args.pages}-page scanned PDF ({pdf.stat().st_size / 1e6:.1f} MB), OCR at {args.dpi} DPI\n")
+        print(f"{'scenario':<26} {'seconds':>8} {'s/page':>7} {'rss MB':>7} {'child MB':>9} {'in order':>9}")
+        for name, workers in SCENARIOS:
+            snippet = RUN_SNIPPET.format(root=str(BACKEND_ROOT), pdf=str(pdf), workers=workers, dpi=args.dpi)
+            out = subprocess.run([sys.executable, "-c", snippet], capture_output=True, text=True, cwd=BACKEND_ROOT)
+            if out.returncode != 0:
+                print(f"{name:<26} FAILED: {out.stderr.strip().splitlines()[-1]}")
+                continue
+            r = json.loads(out.stdout.strip().splitlines()[-1])
+            print(f"{name:<26} {r['seconds']:>8.1f} {r['seconds'] / args.pages:>7.2f} {r['rss_mb']:>7.0f} "
+                  f"{r['child_rss_mb']:>9.0f} {str(pages_in_order(r['texts'], args.pages)):>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+# in backend/test/bench_startup.py
+#
+# Measures worker boot cost per app role: wall time to import the app and run
+# create_app(), peak RSS, and whether torch ended up in memory. Each role is
+# booted in a fresh interpreter so nothing is shared between runs.
+# "rag+warmup" also loads bge-m3 and Chroma, i.e. the old import-time cost.
+
+import sys
+import json
+import subprocess
+from pathlib import Path
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+BACKEND_ROOT = SCRIPT_DIR.parent
+RUNS = 3
+
+BOOT_SNIPPET = """
+import json, resource, sys, time
+start = time.perf_counter()
+from app import create_app
+app = create_app(role="{role}")
+booted = time.perf_counter() - start
+if {warm}:
+    from app.RAG import rag_service
+    rag_service.warm_up()
+total = time.perf_counter() - start
+print(json.dumps({{
+    "boot_s": booted,
+    "total_s": total,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "torch_loaded": "torch" in sys.modules
+}}))
+"""
+
+SCENARIOS = [
+    ("auth", "auth", False),
+    ("rag", "rag", False),
+    ("all", "all", False),
+    ("rag+warmup", "rag", True),
+]
+
+
+def boot(role, warm):
+    out = subprocess.run(
+        [sys.executable, "-c", BOOT_SNIPPET.format(role=role, warm=warm)],
+        cwd=BACKEND_ROOT,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    # The app prints its own log lines; the JSON report is the last line
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def run_benchmark():
+    print("--- Startup Benchmark ---")
+    print(f"{'scenario':<12}{'boot s':>9}{'total s':>9}{'max RSS MB':>12}{'torch':>7}")
+    for name, role, warm in SCENARIOS:
+        runs = [boot(role, warm) for _ in range(RUNS)]
+        best = min(runs, key=lambda r: r["total_s"])
+        print(f"{name:<12}{best['boot_s']:>9.2f}{best['total_s']:>9.2f}"
+              f"{best['max_rss_mb']:>12.0f}{str(best['torch_loaded']):>7}")
+    print("\n--- Benchmark Complete ---")
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,108 @@
+# in backend/test/bench_vector_index.py
+#
+# Compares latency and recall of Chroma (HNSW) against the flat mmap index.
+# Queries are perturbed copies of stored chunk embeddings, so no embedding
+# model is needed. Ground truth is an exact float32 search over the corpus.
+#
+# Export the flat indexes first:
+#   python -m app.RAG.vector_index --dtype float16 --out chroma_db/flat_index_fp16
+#   python -m app.RAG.vector_index --dtype int8    --out chroma_db/flat_index_int8
+
+import sys
+import time
+import numpy as np
+import chromadb
+from pathlib import Path
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+BACKEND_ROOT = SCRIPT_DIR.parent
+sys.path.insert(0, str(BACKEND_ROOT))
+
+from app.RAG.vector_index import FlatIndex
+
+CHROMA_PATH = BACKEND_ROOT / "chroma_db"
+COLLECTION_NAME = "legal_india_bge_m3"
+FLAT_INDEXES = {
+    "flat-fp16": CHROMA_PATH / "flat_index_fp16",
+    "flat-int8": CHROMA_PATH / "flat_index_int8",
+}
+NUM_QUERIES = 200
+TOP_K = 10
+NOISE = 0.05
+BATCH = 32
+
+
+def load_corpus(collection):
+    """All stored embeddings as one float32 matrix (ground-truth source)."""
+    total = collection.count()
+    ids, rows = [], []
+    for offset in range(0, total, 5000):
+        batch = collection.get(limit=5000, offset=offset, include=["embeddings"])
+        ids.extend(batch["ids"])
+        rows.append(np.asarray(batch["embeddings"], dtype=np.float32))
+    return ids, np.vstack(rows)
+
+
+def make_queries(corpus, rng):
+    picks = rng.choice(len(corpus), size=NUM_QUERIES, replace=False)
+    queries = corpus[picks] + rng.normal(0, NOISE, size=(NUM_QUERIES, corpus.shape[1])).astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def recall(result_ids, truth_ids):
+    hits = [len(set(r) & set(t)) / len(t) for r, t in zip(result_ids, truth_ids)]
+    return float(np.mean(hits))
+
+
+def time_single(index, queries):
+    latencies, ids = [], []
+    for q in queries:
+        start = time.perf_counter()
+        res = index.query(query_embeddings=[q.tolist()], n_results=TOP_K, include=["distances"])
+        latencies.append((time.perf_counter() - start) * 1000)
+        ids.append(res["ids"][0])
+    return np.array(latencies), ids
+
+
+def time_batched(index, queries):
+    start = time.perf_counter()
+    for i in range(0, len(queries), BATCH):
+        index.query(query_embeddings=queries[i:i + BATCH].tolist(), n_results=TOP_K, include=["distances"])
+    return (time.perf_counter() - start) * 1000 / len(queries)
+
+
+def run_benchmark():
+    print("--- Vector Index Benchmark ---")
+    client = chromadb.PersistentClient(path=str(CHROMA_PATH))
+    collection = client.get_collection(name=COLLECTION_NAME)
+
+    print("Loading corpus embeddings for ground truth...")
+    corpus_ids, corpus = load_corpus(collection)
+    print(f"Corpus: {corpus.shape[0]} x {corpus.shape[1]}")
+
+    rng = np.random.default_rng(0)
+    queries = make_queries(corpus, rng)
+
+    scores = queries @ corpus.T
+    top = np.argsort(-scores, axis=1)[:, :TOP_K]
+    truth = [[corpus_ids[i] for i in row] for row in top]
+
+    engines = {"chroma-hnsw": collection}
+    for name, path in FLAT_INDEXES.items():
+        if path.exists():
+            engines[name] = FlatIndex(path)
+        else:
+            print(f"Skipping {name}: {path} not found")
+
+    print(f"\n{'engine':<14}{'p50 ms':>10}{'p95 ms':>10}{'batched ms/q':>15}{'recall@' + str(TOP_K):>12}")
+    for name, engine in engines.items():
+        engine.query(query_embeddings=[queries[0].tolist()], n_results=TOP_K)  # warm caches
+        latencies, ids = time_single(engine, queries)
+        per_query = time_batched(engine, queries)
+        print(f"{name:<14}{np.percentile(latencies, 50):>10.2f}{np.percentile(latencies, 95):>10.2f}"
+              f"{per_query:>15.3f}{recall(ids, truth):>12.3f}")
+
+    print("\n--- Benchmark Complete ---")
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,85 @@
+# in backend/test/check_embedding_backends.py
+#
+# Accuracy check for the reduced-precision embedding backends.
+# Encodes a random sample of corpus chunks with every available backend and
+# reports cosine agreement with the fp32 torch backend, plus how often each
+# backend keeps the same top-k neighbours within the sample.
+# The SentenceTransformer reference confirms that the shared CLS-pooling
+# path reproduces what ingest stored.
+#
+# Export the ONNX graphs first:  python -m app.RAG.embedding_backend
+
+import sys
+import time
+import numpy as np
+import chromadb
+from pathlib import Path
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+BACKEND_ROOT = SCRIPT_DIR.parent
+sys.path.insert(0, str(BACKEND_ROOT))
+
+from app.RAG.embedding_backend import load_backend, BACKENDS
+
+CHROMA_PATH = BACKEND_ROOT / "chroma_db"
+COLLECTION_NAME = "legal_india_bge_m3"
+EMBEDDING_MODEL_NAME = 'BAAI/bge-m3'
+SAMPLE_SIZE = 200
+TOP_K = 5
+MIN_MEAN_COSINE = 0.99   # Below this a backend is flagged as not safe to serve
+
+
+def sample_chunks(rng):
+    client = chromadb.PersistentClient(path=str(CHROMA_PATH))
+    collection = client.get_collection(name=COLLECTION_NAME)
+    total = collection.count()
+    offsets = rng.choice(total, size=min(SAMPLE_SIZE, total), replace=False)
+    return [collection.get(limit=1, offset=int(o), include=["documents"])["documents"][0] for o in offsets]
+
+
+def neighbour_overlap(reference, candidate):
+    ref_top = np.argsort(-(reference @ reference.T), axis=1)[:, 1:TOP_K + 1]
+    cand_top = np.argsort(-(candidate @ candidate.T), axis=1)[:, 1:TOP_K + 1]
+    return float(np.mean([len(set(a) & set(b)) / TOP_K for a, b in zip(ref_top, cand_top)]))
+
+
+def run_check():
+    print("--- Embedding Backend Accuracy Check ---")
+    rng = np.random.default_rng(0)
+    texts = sample_chunks(rng)
+    print(f"Sampled {len(texts)} corpus chunks.")
+
+    encoded = {}
+    for name in BACKENDS:
+        try:
+            backend = load_backend(name, EMBEDDING_MODEL_NAME)
+        except Exception as e:
+            print(f"Skipping {name}: {e}")
+            continue
+        start = time.perf_counter()
+        encoded[name] = backend.encode(texts, normalize_embeddings=True)
+        print(f"  {name:<10} encoded in {time.perf_counter() - start:.1f}s")
+
+    try:
+        from sentence_transformers import SentenceTransformer
+        st = SentenceTransformer(EMBEDDING_MODEL_NAME, device='cpu')
+        encoded["sentence-transformers"] = st.encode(texts, normalize_embeddings=True)
+    except Exception as e:
+        print(f"Skipping SentenceTransformer reference: {e}")
+
+    reference = encoded.get("torch")
+    if reference is None:
+        print("ERROR: fp32 torch backend unavailable; nothing to compare against.")
+        return
+
+    print(f"\n{'backend':<22}{'mean cos':>10}{'min cos':>10}{'p5 cos':>10}{'top-' + str(TOP_K) + ' overlap':>16}")
+    for name, vectors in encoded.items():
+        cosines = np.sum(reference * vectors, axis=1)
+        verdict = "" if cosines.mean() >= MIN_MEAN_COSINE else "  <-- below threshold"
+        print(f"{name:<22}{cosines.mean():>10.5f}{cosines.min():>10.5f}{np.percentile(cosines, 5):>10.5f}"
+              f"{neighbour_overlap(reference, vectors):>16.3f}{verdict}")
+
+    print("\n--- Check Complete ---")
+
+if __name__ == "__main__":
+    run_check()
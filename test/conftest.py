@@ -0,0 +1,44 @@
+# in backend/test/conftest.py
+#
+# Most unit tests load app/RAG modules straight from their files, under a
+# bare package that skips app/RAG/__init__.py (which needs Flask and Redis),
+# so they run without the app's services.
+#
+#     python -m pytest test
+
+import sys
+import types
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+BACKEND_ROOT = Path(__file__).resolve().parent.parent
+RAG_DIR = BACKEND_ROOT / "app" / "RAG"
+RAG_PACKAGE = "_lex_rag"
+
+# Tests of modules that need the whole app import it from here (and skip if it can't be imported)
+sys.path.insert(0, str(BACKEND_ROOT))
+
+# Scripts that talk to real services (SMTP, Chroma + bge-m3), run by hand
+collect_ignore = ["test_tls.py", "test_retrieval.py"]
+
+
+def load_rag_module(name: str):
+    if RAG_PACKAGE not in sys.modules:
+        package = types.ModuleType(RAG_PACKAGE)
+        package.__path__ = [str(RAG_DIR)]
+        sys.modules[RAG_PACKAGE] = package
+    full_name = f"{RAG_PACKAGE}.{name}"
+    if full_name not in sys.modules:
+        spec = importlib.util.spec_from_file_location(full_name, RAG_DIR / f"{name}.py")
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[full_name] = module
+        spec.loader.exec_module(module)
+    return sys.modules[full_name]
+
+
+@pytest.fixture
+def rag_module():
+    """load_rag_module("json_stream") -> app/RAG/json_stream.py, imported without app.RAG."""
+    return load_rag_module
@@ -0,0 +1,95 @@
+# in backend/test/test_chat_history.py
+#
+# compact_history(): when older messages are folded into the rolling summary,
+# and when a summary that no longer matches the history is thrown away.
+
+import pytest
+
+
+@pytest.fixture
+def ch(rag_module):
+    return rag_module("chat_history")
+
+
+def conversation(n, prefix="m"):
+    return [{"role": "user" if i % 2 == 0 else "model", "content": f"{prefix}{i}"} for i in range(n)]
+
+
+class Summarizer:
+    def __init__(self, reply="summary"):
+        self.reply = reply
+        self.calls = []
+
+    def __call__(self, previous_text, messages):
+        self.calls.append((previous_text, [m["content"] for m in messages]))
+        return f"{self.reply} {len(self.calls)}"
+
+
+def test_no_fold_until_a_batch_has_left_the_window(ch):
+    summarize = Summarizer()
+    history = conversation(ch.KEEP_MESSAGES + ch.FOLD_BATCH - 1)
+    recent, summary = ch.compact_history(history, None, summarize)
+    assert summarize.calls == []
+    assert recent == history
+    assert summary == ch.empty_summary()
+
+
+def test_folds_a_batch_then_carries_the_summary_forward(ch):
+    summarize = Summarizer()
+    history = conversation(ch.KEEP_MESSAGES + ch.FOLD_BATCH)
+    recent, summary = ch.compact_history(history, None, summarize)
+    assert summarize.calls == [("", [f"m{i}" for i in range(ch.FOLD_BATCH)])]
+    assert recent == history[ch.FOLD_BATCH:]
+    assert summary["text"] == "summary 1"
+    assert summary["covered"] == ch.FOLD_BATCH
+
+    # The next turns reuse the stored summary until another batch is due
+    history += conversation(2, prefix="n")
+    recent, summary = ch.compact_history(history, summary, summarize)
+    assert len(summarize.calls) == 1
+    assert recent == history[ch.FOLD_BATCH:]
+
+    history += conversation(ch.FOLD_BATCH - 2, prefix="o")
+    recent, summary = ch.compact_history(history, summary, summarize)
+    assert summarize.calls[1][0] == "summary 1"
+    assert summary["covered"] == 2 * ch.FOLD_BATCH
+    assert recent == history[-ch.KEEP_MESSAGES:]
+
+
+def test_long_messages_fold_before_a_full_batch(ch):
+    summarize = Summarizer()
+    history = [{"role": "user", "content": "clause " * 2000}] + conversation(ch.KEEP_MESSAGES)
+    recent, summary = ch.compact_history(history, None, summarize)
+    assert len(summarize.calls) == 1
+    assert summary["covered"] == 1
+    assert recent == history[1:]
+
+
+def test_summary_is_truncated_to_its_budget(ch):
+    summarize = Summarizer(reply="word " * 5000)
+    history = conversation(ch.KEEP_MESSAGES + ch.FOLD_BATCH)
+    _, summary = ch.compact_history(history, None, summarize)
+    assert ch.count_tokens(summary["text"]) <= ch.SUMMARY_TOKEN_BUDGET
+
+
+def test_edited_history_resets_the_summary(ch):
+    summarize = Summarizer()
+    history = conversation(ch.KEEP_MESSAGES + ch.FOLD_BATCH)
+    _, summary = ch.compact_history(history, None, summarize)
+
+    edited = [{**history[0], "content": "edited"}] + history[1:]
+    recent, rebuilt = ch.compact_history(edited, summary, summarize)
+    assert summarize.calls[1] == ("", ["edited"] + [f"m{i}" for i in range(1, ch.FOLD_BATCH)])
+    assert rebuilt["text"] == "summary 2"
+    assert recent == edited[ch.FOLD_BATCH:]
+
+
+def test_shorter_history_resets_the_summary(ch):
+    summarize = Summarizer()
+    _, summary = ch.compact_history(conversation(ch.KEEP_MESSAGES + ch.FOLD_BATCH), None, summarize)
+
+    new_conversation = conversation(2, prefix="new")
+    recent, summary = ch.compact_history(new_conversation, summary, summarize)
+    assert len(summarize.calls) == 1
+    assert summary == ch.empty_summary()
+    assert recent == new_conversation
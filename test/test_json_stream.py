@@ -0,0 +1,69 @@
+# in backend/test/test_json_stream.py
+#
+# AnalysisStreamParser fed the analyzer's JSON in chunks of every size,
+# including splits inside escapes, keys and nested objects.
+
+import json
+
+import pytest
+
+RESULT = {
+    "summary": 'Lease of "Flat 4B" \\ Pune, rent ₹25,000 {monthly}',
+    "red_flags": [
+        {"clause": "7.2", "issue": "Deposit forfeited on \"any\" delay", "summary": "not the top-level one"},
+        {"clause": "9", "issue": "Brackets ] and } inside a string", "severity": "high"},
+    ],
+}
+TEXT = "```json\n" + json.dumps(RESULT, ensure_ascii=False, indent=2) + "\n```\nDone."
+
+
+@pytest.fixture
+def parser(rag_module):
+    return rag_module("json_stream").AnalysisStreamParser()
+
+
+def feed_in_chunks(parser, text, size):
+    events = []
+    for start in range(0, len(text), size):
+        events += parser.feed(text[start:start + size])
+    return events
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, len(TEXT)])
+def test_chunked_input_gives_the_same_events(parser, size):
+    events = feed_in_chunks(parser, TEXT, size)
+    assert events == [
+        ("summary", RESULT["summary"]),
+        ("red_flag", RESULT["red_flags"][0]),
+        ("red_flag", RESULT["red_flags"][1]),
+    ]
+    assert parser.done
+
+
+def test_split_inside_escapes_and_keys(parser):
+    text = '{"summ' + 'ary": "a \\' + '"quoted\\' + '" \\u20' + 'b9 b", "red_' + 'flags": [{"x": "\\\\' + '"}]}'
+    chunks = ['{"summ', 'ary": "a \\', '"quoted\\', '" \\u20', 'b9 b", "red_', 'flags": [{"x": "\\\\', '"}]}']
+    assert "".join(chunks) == text
+    events = []
+    for chunk in chunks:
+        events += parser.feed(chunk)
+    assert events == [("summary", 'a "quoted" ₹ b'), ("red_flag", {"x": "\\"})]
+
+
+def test_red_flag_is_reported_as_soon_as_it_closes(parser):
+    assert parser.feed('{"summary": "s", "red_flags": [{"clause": "1"') == [("summary", "s")]
+    assert parser.feed("}") == [("red_flag", {"clause": "1"})]
+    assert parser.feed(', {"clause": "2"}') == [("red_flag", {"clause": "2"})]
+    assert not parser.done
+    assert parser.feed("]}") == []
+    assert parser.done
+
+
+def test_malformed_element_is_skipped(parser):
+    events = feed_in_chunks(parser, '{"red_flags": [{"clause": 1,}, {"clause": 2}], "summary": "s"}', 5)
+    assert events == [("red_flag", {"clause": 2}), ("summary", "s")]
+
+
+def test_text_after_the_object_is_ignored(parser):
+    assert parser.feed('{"summary": "s"} {"summary": "again"}') == [("summary", "s")]
+    assert parser.feed('{"red_flags": [{"a": 1}]}') == []
@@ -0,0 +1,54 @@
+# in backend/test/test_map_reduce.py
+#
+# dedupe_red_flags(): which red flags from overlapping sections are merged
+# as duplicates and which are kept.
+
+import pytest
+
+
+@pytest.fixture
+def dedupe(rag_module):
+    return rag_module("map_reduce").dedupe_red_flags
+
+
+def clauses(flags):
+    return [flag.get("clause_text") for flag in flags]
+
+
+def test_empty_clause_text_does_not_swallow_later_flags(dedupe):
+    flags = [{"clause_text": ""}, {"clause_text": "Termination at will"}, {"clause_text": "Unlimited liability"}]
+    assert dedupe(flags) == flags
+
+
+def test_flags_without_clause_text_are_all_kept(dedupe):
+    flags = [{"issue": "No stamp duty"}, {"issue": "No witness"}, {"clause_text": None, "issue": "Unsigned"}]
+    assert dedupe(flags) == flags
+
+
+def test_short_clause_does_not_swallow_longer_ones(dedupe):
+    flags = [
+        {"clause_text": "the"},
+        {"clause_text": "Either party may terminate the lease"},
+        {"clause_text": "Rent"},
+        {"clause_text": "Rent shall increase by 15% every year"},
+    ]
+    assert dedupe(flags) == flags
+
+
+def test_repeated_clause_is_dropped(dedupe):
+    flags = [
+        {"clause_text": "The Lessee shall pay all repairs.", "section": 1},
+        {"clause_text": "the lessee  shall pay all repairs.", "section": 2},
+    ]
+    assert dedupe(flags) == flags[:1]
+
+
+def test_nearly_identical_quote_is_dropped_either_way_round(dedupe):
+    full = "The deposit is forfeited if rent is paid one day late"
+    assert clauses(dedupe([{"clause_text": full}, {"clause_text": full[:-5]}])) == [full]
+    assert clauses(dedupe([{"clause_text": full[:-5]}, {"clause_text": full}])) == [full[:-5]]
+
+
+def test_falls_back_to_the_clause_field(dedupe):
+    flags = [{"clause": "Clause 7.2"}, {"clause": "clause 7.2"}, {"clause": "Clause 9"}]
+    assert dedupe(flags) == [flags[0], flags[2]]
@@ -0,0 +1,28 @@
+# in backend/test/test_section_index.py
+#
+# Citations in a query resolve to the keys data/ingest.py writes for the
+# act's title (both use app/RAG/act_names.act_key).
+
+import pytest
+
+
+@pytest.fixture
+def section_index(rag_module):
+    return rag_module("section_index")
+
+
+@pytest.mark.parametrize("title, key", [
+    ("The Transfer Of Property Act", "transfer of property act"),
+    ("THE INDIAN CONTRACT ACT, 1872", "indian contract act"),
+    ("The Rent Control (Amendment) Act 2001", "rent control amendment act"),
+])
+def test_act_key(rag_module, title, key):
+    assert rag_module("act_names").act_key(title) == key
+
+
+def test_citation_resolves_to_the_ingested_act(rag_module, section_index):
+    key = rag_module("act_names").act_key("THE TRANSFER OF PROPERTY ACT")   # As ingest stores it
+    index = section_index.SectionIndex(sections={f"{key}|106": ["tpa.pdf_chunk_41"]})
+    assert index.lookup("Is notice valid under Section 106 of the Transfer of Property Act, 1882?") == [
+        "tpa.pdf_chunk_41"
+    ]
@@ -0,0 +1,65 @@
+# in backend/test/test_user_cache.py
+#
+# Which analyses store_analysis() shares, keeps and points the user's session
+# at, and which cached ones cached_analysis() hands back. The shared cache,
+# workspace and session are faked instead of going to Redis. Needs the app's
+# dependencies (Flask, langchain).
+
+import pytest
+
+user_cache = pytest.importorskip("app.RAG.user_cache")
+
+DOCUMENT = "This Lease Deed is made at Pune between the Lessor and the Lessee."
+PREVIOUS = {"analysis_hash": "previous-digest", "jurisdiction": "Maharashtra"}
+
+
+@pytest.fixture
+def writes(monkeypatch):
+    calls = []
+    monkeypatch.setattr(user_cache.analysis_cache, "put", lambda *args: calls.append(("shared", args)))
+    monkeypatch.setattr(user_cache.workspace, "add", lambda *args: calls.append(("workspace", args)))
+    monkeypatch.setattr(user_cache, "update_user_cache",
+                        lambda user_id, cache, fields, drop=(): calls.append(("session", fields)))
+    return calls
+
+
+def test_undecodable_result_leaves_the_session_alone(writes):
+    session = dict(PREVIOUS)
+    user_cache.store_analysis("u1", session, DOCUMENT, None, {"summary": "Error decoding analysis", "raw": "{oops"})
+    assert writes == []
+    assert session == PREVIOUS
+
+
+def test_hosted_result_is_shared_and_pointed_at(writes):
+    result = {"summary": "A lease.", "red_flags": []}
+    user_cache.store_analysis("u1", dict(PREVIOUS), DOCUMENT, None, result)
+    digest = user_cache.analysis_cache.digest(DOCUMENT, None)
+    assert [kind for kind, _ in writes] == ["shared", "workspace", "session"]
+    assert writes[-1][1] == {"analysis_hash": digest, "jurisdiction": None}
+
+
+def test_local_model_result_stays_in_the_workspace(writes):
+    result = {"summary": "A lease.", "red_flags": [], "model": user_cache.CHATTER_MODEL}
+    user_cache.store_analysis("u1", dict(PREVIOUS), DOCUMENT, None, result)
+    assert [kind for kind, _ in writes] == ["workspace", "session"]
+    assert writes[-1][1]["analysis_hash"] == user_cache.analysis_cache.digest(DOCUMENT, None, user_cache.CHATTER_MODEL)
+
+
+@pytest.fixture
+def local_only(monkeypatch):
+    """Only the user's local-model analysis of DOCUMENT is cached; returns its workspace entry."""
+    digest = user_cache.analysis_cache.digest(DOCUMENT, None, user_cache.CHATTER_MODEL)
+    entry = {"result": {"summary": "A lease.", "model": user_cache.CHATTER_MODEL}, "jurisdiction": None}
+    monkeypatch.setattr(user_cache.analysis_cache, "get", lambda d, **kwargs: None)
+    monkeypatch.setattr(user_cache.workspace, "get", lambda user_id, d, **kwargs: entry if d == digest else None)
+    return entry
+
+
+def test_free_user_gets_their_local_analysis(writes, local_only):
+    assert user_cache.cached_analysis("u1", dict(PREVIOUS), DOCUMENT, None, "free_user") == local_only["result"]
+    assert writes[-1][1]["analysis_hash"] == user_cache.analysis_cache.digest(DOCUMENT, None, user_cache.CHATTER_MODEL)
+
+
+def test_premium_user_never_gets_a_local_analysis(writes, local_only):
+    assert user_cache.cached_analysis("u1", dict(PREVIOUS), DOCUMENT, None, "premium_user") is None
+    assert writes == []